@@ -1,11 +1,27 @@
 from typing import Any
-from collections.abc import Mapping, Sequence
+from abc import ABC, abstractmethod
+import contextlib
+import functools
+import gc
+import heapq
+import json
+import math
+import operator
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping, MutableMapping, Sequence
 from dataclasses import dataclass
 
 VALUE_TYPES = ["num", "alpha", "bool"]
 TARGETS = ["self", "st", "mt"]
 OPERATORS = ["+", "*", "="]
 COMPARISON =["=", "!=", ">", ">=", "<", "<="]
+SECTIONS = ["attributes", "actions", "entities"]
+
+EVENT_LOG_CAPACITY = 10_000
+TIMER_WHEEL_SLOTS = 64
+TIMER_WHEEL_LEVELS = 4
 
 NumType = int | float
 
@@ -45,6 +61,10 @@ class EffectStruct:
     modifier: str
     value: SupportedValTypes
     condition: ConditionStruct | None
+    # Turns the effect lasts, 0 lasting until the end of the event, or None for a permanent change
+    duration: int | None = None
+    # Apply the effect again every turn of its duration instead of reverting it when it expires
+    per_turn: bool = False
 
 @dataclass
 class EventEndConditionStruct:
@@ -69,7 +89,571 @@ class EventActionStruct:
     action: str
     target: Sequence[str]
 
-class TAttribute:
+@dataclass
+class EventLogRecordStruct:
+    turn: int
+    kind: str
+    actor: str
+    action: str | None
+    targets: list[str]
+    deltas: list[tuple[str, str, SupportedValTypes, SupportedValTypes]]
+    text: str | None = None
+
+@dataclass
+class ActionResultStruct:
+    user: str
+    action: str
+    targets: Sequence[str]
+    success: bool
+    error: str | None
+
+def value_to_data(value: SupportedValTypes) -> Any:
+    """Converts an effect value into its JSON representation
+    """
+    if isinstance(value, AttrBasedValStruct):
+        flat = None
+        if isinstance(value.flat, FlatChangeStruct):
+            flat = {"modifier": value.flat.modifier,
+                    "value": value.flat.value}
+
+        return {"attribute": value.attribute,
+                "attribute owner": value.attribute_owner,
+                "modifier": value.modifier,
+                "value": value.value,
+                "flat": flat}
+
+    return value
+
+def value_from_data(data: Any) -> SupportedValTypes:
+    """Converts the JSON representation of an effect value back into its value
+    """
+    if isinstance(data, dict):
+        flat = None
+        if data.get("flat") is not None:
+            flat = FlatChangeStruct(data["flat"]["modifier"], data["flat"]["value"])
+
+        return AttrBasedValStruct(data["attribute"], data["attribute owner"], data["modifier"], data["value"], flat)
+
+    return data
+
+def effect_to_data(effect: EffectStruct) -> dict:
+    """Converts an EffectStruct into the dictionary stored in a game file
+    """
+    effect_data = {"attribute": effect.attribute,
+                   "effect type": effect.effect_type,
+                   "modifier": effect.modifier,
+                   "value": value_to_data(effect.value),
+                   "condition": None}
+
+    if isinstance(effect.condition, ConditionStruct):
+        effect_data["condition"] = {"attribute": effect.condition.attribute,
+                                    "attribute owner": effect.condition.attribute_owner,
+                                    "comparison": effect.condition.comparison,
+                                    "value": effect.condition.value}
+
+    if effect.duration is not None:
+        effect_data["duration"] = effect.duration
+        effect_data["per turn"] = effect.per_turn
+
+    return effect_data
+
+def iter_data_records(data: dict) -> Iterator[tuple[str, Any]]:
+    """Yields the name and the records of a game's data as the (section, record) pairs taken by TRPG.load_records
+    """
+    yield "name", data["name"]
+
+    for section in SECTIONS:
+        for ele in data[section]:
+            yield section, ele
+
+def event_record_to_data(record: EventLogRecordStruct) -> dict:
+    return {"turn": record.turn,
+            "kind": record.kind,
+            "actor": record.actor,
+            "action": record.action,
+            "targets": record.targets,
+            "deltas": [list(ele) for ele in record.deltas],
+            "text": record.text}
+
+def event_record_from_data(data: dict) -> EventLogRecordStruct:
+    return EventLogRecordStruct(data["turn"],
+                                data["kind"],
+                                data["actor"],
+                                data["action"],
+                                data["targets"],
+                                [tuple(ele) for ele in data["deltas"]],
+                                data["text"])
+
+def effect_from_data(data: dict) -> EffectStruct:
+    """Converts an effect dictionary from a game file into an EffectStruct
+    """
+    condition = None
+    if data["condition"] is not None:
+        condition = ConditionStruct(data["condition"]["attribute"],
+                                    data["condition"]["attribute owner"],
+                                    data["condition"]["comparison"],
+                                    data["condition"]["value"])
+
+    return EffectStruct(data["attribute"],
+                        data["effect type"],
+                        condition,
+                        data["modifier"],
+                        value_from_data(data["value"]),
+                        data.get("duration"),
+                        data.get("per turn", False))
+
+OPERATOR_FUNCTIONS: dict[str: Callable[[Any, Any], Any]] = {"+": operator.add,
+                                                             "*": operator.mul,
+                                                             "=": lambda old, new: new}
+
+COMPARISON_FUNCTIONS: dict[str: Callable[[Any, Any], bool]] = {"=": operator.eq,
+                                                                "!=": operator.ne,
+                                                                ">": operator.gt,
+                                                                ">=": operator.ge,
+                                                                "<": operator.lt,
+                                                                "<=": operator.le}
+
+def _owner_getter(owner: str, attribute: str) -> Callable[[Any, Any], Any]:
+    """Builds a getter reading an attribute of either the user or the target of an action
+
+    Args:
+        owner (str): "user" or "target"
+        attribute (str): Name of the attribute to read
+
+    Returns:
+        Callable[[TEntity, TEntity | None], Any]: Returns the attribute value for a (user, target) pair
+    """
+    def get_from_user(user, target):
+        attributes = user._attributes
+        if attribute not in attributes:
+            raise ValueError("An attribute named {} does not exist in {}'s attribute list.\n".format(attribute, user._name))
+
+        return attributes[attribute].value
+
+    def get_from_target(user, target):
+        if target is None:
+            raise ValueError("A value depends on attribute {} of the target but no target was given.\n".format(attribute))
+
+        attributes = target._attributes
+        if attribute not in attributes:
+            raise ValueError("An attribute named {} does not exist in {}'s attribute list.\n".format(attribute, target._name))
+
+        return attributes[attribute].value
+
+    return get_from_target if owner == "target" else get_from_user
+
+def compile_condition(condition: ConditionStruct | None) -> Callable[[Any, Any], bool] | None:
+    """Resolves a condition into a predicate taking the (user, target) pair of an action
+
+    Args:
+        condition (ConditionStruct | None): The condition to compile
+
+    Returns:
+        Callable[[TEntity, TEntity | None], bool] | None: The predicate, or None if there is no condition
+    """
+    if condition is None:
+        return None
+
+    get = _owner_getter(condition.attribute_owner, condition.attribute)
+    compare = COMPARISON_FUNCTIONS[condition.comparison]
+    expected = condition.value
+
+    return lambda user, target: compare(get(user, target), expected)
+
+def compile_value(value: SupportedValTypes) -> Callable[[Any, Any], SupportedValTypes]:
+    """Resolves an effect value into a getter taking the (user, target) pair of an action
+
+    Args:
+        value (SupportedValTypes): A constant or an AttrBasedValStruct
+
+    Returns:
+        Callable[[TEntity, TEntity | None], SupportedValTypes]: The value getter
+    """
+    if not isinstance(value, AttrBasedValStruct):
+        return lambda user, target: value
+
+    get = _owner_getter(value.attribute_owner, value.attribute)
+
+    flat = 0
+    if isinstance(value.flat, FlatChangeStruct):
+        if value.flat.modifier == "+":
+            flat = value.flat.value
+
+        elif value.flat.modifier == "-":
+            flat = -value.flat.value
+
+    if value.modifier in ("+", "*"):
+        combine = OPERATOR_FUNCTIONS[value.modifier]
+        operand = value.value
+
+        return lambda user, target: flat + combine(get(user, target), operand)
+
+    return lambda user, target: flat
+
+class TUndoJournal:
+    """Records the values an action overwrites, so a failing action can be rolled back
+    at a cost proportional to what it touched.
+
+    Each entry is an (owner, key, old value) triple. The owner is the object the value was written on,
+    which restores it through its restore_value(key, old value) method.
+    """
+    __slots__ = ("entries",)
+
+    def __init__(self):
+        self.entries: list[tuple[Any, Any, Any]] = []
+
+    def record(self, owner, key: Any, old_value: Any):
+        self.entries.append((owner, key, old_value))
+
+    def rollback(self):
+        """Restores every recorded value, most recent first, and empties the journal
+        """
+        for owner, key, old_value in reversed(self.entries):
+            owner.restore_value(key, old_value)
+
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def deltas(self) -> list[tuple[str, str, Any, Any]]:
+        """Returns what the recorded writes changed, as (entity, attribute, old value, new value) tuples.
+        An attribute written several times appears once, with its first old value and its current value
+        """
+        changes: dict[tuple[int, str]: list] = {}
+
+        for owner, key, old_value in self.entries:
+            for entity, attribute_name, old in owner.changed_values(key, old_value):
+                if (id(entity), attribute_name) not in changes:
+                    changes.update({(id(entity), attribute_name): [entity, attribute_name, old]})
+
+        return [(entity.get_name(), attribute_name, old, entity.get_attributes()[attribute_name].value)
+                for entity, attribute_name, old in changes.values()]
+
+class TTimerWheel:
+    def __init__(self,
+                 slots: int = TIMER_WHEEL_SLOTS,
+                 levels: int = TIMER_WHEEL_LEVELS):
+        """Initialize an empty hierarchical timer wheel counting turns. Level 0 has one slot per turn, and each level
+        above has slots spanning a full revolution of the level below. A timer is filed by how far away its deadline is
+        and moved down a level when the level below comes around to it, so advancing a turn only touches the timers
+        due in that turn, plus a cascade every slots turns.
+
+        Timers are objects with a deadline attribute, an int turn set by schedule, and a cancelled attribute.
+
+        Args:
+            slots (int): Slots per level
+            levels (int): Number of levels. Deadlines further than slots ** levels turns away are re-filed as they come closer
+        """
+        self.slots = slots
+        self.levels = levels
+        self.tick: int = 0
+
+        self._wheels: list[list[list]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._spans: list[int] = [slots ** level for level in range(levels + 1)]
+        self._held: list = []
+        self._count = 0
+
+    def _place(self, timer):
+        delta = timer.deadline - self.tick
+        level = 0
+
+        while level < self.levels - 1 and delta >= self._spans[level + 1]:
+            level += 1
+
+        self._wheels[level][(timer.deadline // self._spans[level]) % self.slots].append(timer)
+
+    def schedule(self, delay: int, timer):
+        """Files a timer to fire delay turns from now
+
+        Args:
+            delay (int): Number of turns, at least 1
+            timer: The timer
+        """
+        if delay < 1:
+            raise ValueError("A timer must fire at least one turn from now.\n")
+
+        timer.deadline = self.tick + delay
+        timer.cancelled = False
+
+        self._place(timer)
+        self._count += 1
+
+    def advance(self) -> list:
+        """Moves one turn forward
+
+        Returns:
+            list: The timers due this turn, in the order they were scheduled, without the cancelled ones
+        """
+        self.tick += 1
+
+        for level in range(1, self.levels):
+            if self.tick % self._spans[level] != 0:
+                break
+
+            index = (self.tick // self._spans[level]) % self.slots
+            bucket = self._wheels[level][index]
+            self._wheels[level][index] = []
+
+            for ele in bucket:
+                self._place(ele)
+
+        index = self.tick % self.slots
+        due = [ele for ele in self._wheels[0][index] if ele.deadline == self.tick]
+
+        # Deadlines further than a full turn of every level come back around until they are due
+        self._wheels[0][index] = [ele for ele in self._wheels[0][index] if ele.deadline != self.tick]
+        self._count -= len(due)
+
+        return [ele for ele in due if not ele.cancelled]
+
+    def hold(self, timer):
+        """Keeps a timer with no deadline until finish is called, e.g. a status lasting until the end of an event
+        """
+        self._held.append(timer)
+
+    def finish(self) -> list:
+        """Empties the wheel
+
+        Returns:
+            list: Every timer that was held or not yet due, without the cancelled ones
+        """
+        timers = {id(ele): ele for ele in self._held}
+        timers.update({id(ele): ele for wheel in self._wheels for bucket in wheel for ele in bucket})
+
+        for wheel in self._wheels:
+            for i in range(self.slots):
+                wheel[i] = []
+
+        self._held = []
+        self._count = 0
+
+        return [ele for ele in timers.values() if not ele.cancelled]
+
+    def __len__(self) -> int:
+        return self._count
+
+class TStatusEffect:
+    """An effect with a duration applied to an entity. It is either reverted when it expires or, for a per turn effect,
+    applied again every turn until it runs out. Num effects are reverted by taking back the difference they made,
+    so changes made meanwhile are kept, other effects by restoring the old value
+    """
+    __slots__ = ("effect", "action_name", "user", "target", "entity", "remaining", "old_value", "delta", "deadline", "cancelled")
+
+    def __init__(self,
+                 effect: "TCompiledEffect",
+                 action_name: str,
+                 user,
+                 target,
+                 entity,
+                 old_value: SupportedValTypes):
+        self.effect = effect
+        self.action_name = action_name
+        self.user = user
+        self.target = target
+        self.entity = entity
+        self.old_value = old_value
+        self.delta = None
+        self.deadline: int = 0
+        self.cancelled = False
+
+        # None lasts until the end of the event
+        self.remaining: int | None = effect.duration - 1 if effect.duration > 0 else None
+
+        new_value = entity.get_attributes()[effect.attribute].value
+
+        if isinstance(new_value, (int, float)) and not isinstance(new_value, bool):
+            self.delta = new_value - old_value
+
+    def start(self, timers: TTimerWheel):
+        if self.remaining is None:
+            timers.hold(self)
+
+        if self.effect.per_turn:
+            if self.remaining is None or self.remaining > 0:
+                timers.schedule(1, self)
+
+        elif self.remaining is not None:
+            timers.schedule(self.effect.duration, self)
+
+    def fire(self, timers: TTimerWheel, journal: TUndoJournal | None = None):
+        """Runs the status when its timer is due: applies a per turn effect again or reverts an expiring one
+        """
+        attribute = self.effect.attribute
+
+        if self.effect.per_turn:
+            attributes = self.entity.get_attributes()
+            self.entity.set_attribute_value(attribute,
+                                            self.effect.operation(attributes[attribute].value, self.effect.value(self.user, self.target)),
+                                            journal)
+
+            if self.remaining is not None:
+                self.remaining -= 1
+
+            if self.remaining is None or self.remaining > 0:
+                timers.schedule(1, self)
+
+        else:
+            self.revert(journal)
+
+    def revert(self, journal: TUndoJournal | None = None):
+        """Ends the status. A per turn status just stops, any other one has its change taken back
+        """
+        if self.cancelled:
+            return
+
+        attribute = self.effect.attribute
+        self.cancelled = True
+
+        if self.effect.per_turn:
+            return
+
+        if self.delta is not None:
+            self.entity.set_attribute_value(attribute, self.entity.get_attributes()[attribute].value - self.delta, journal)
+
+        else:
+            self.entity.set_attribute_value(attribute, self.old_value, journal)
+
+    def restore_value(self, key: Any, old_value: Any):
+        """Cancels the status when the action that applied it is rolled back by a TUndoJournal
+        """
+        self.cancelled = True
+
+    def changed_values(self, key: Any, old_value: Any) -> list:
+        return []
+
+def _select_self(action_name: str, targets: Sequence[Any]) -> Sequence[Any]:
+    return targets[:1] if len(targets) > 0 else (None,)
+
+def _select_single(action_name: str, targets: Sequence[Any]) -> Sequence[Any]:
+    if len(targets) == 0:
+        raise ValueError("A single-targeted effect of action {} requires a target but none was given.\n".format(action_name))
+
+    return targets[:1]
+
+def _select_multi(action_name: str, targets: Sequence[Any]) -> Sequence[Any]:
+    if len(targets) == 0:
+        raise ValueError("A multi-targeted effect of action {} requires a list of targets and none was given.\n".format(action_name))
+
+    return targets
+
+TARGET_SELECTORS: dict[str: Callable[[str, Sequence[Any]], Sequence[Any]]] = {"self": _select_self,
+                                                                               "st": _select_single,
+                                                                               "mt": _select_multi}
+
+class TCompiledEffect:
+    """An effect with its targets, operator, condition and value resolved once, when the action is defined.
+    Self-targeted effects still see the first target, which "target" owned values and conditions are read from.
+    """
+    __slots__ = ("source", "attribute", "effect_type", "on_user", "select_targets", "operation", "condition", "value", "duration", "per_turn")
+
+    def __init__(self, effect: EffectStruct):
+        self.source: EffectStruct = effect
+        self.attribute: str = effect.attribute
+        self.effect_type: str = effect.effect_type
+        self.on_user: bool = effect.effect_type == "self"
+        self.select_targets = TARGET_SELECTORS[effect.effect_type]
+        self.operation = OPERATOR_FUNCTIONS[effect.modifier]
+        self.condition = compile_condition(effect.condition)
+        self.value = compile_value(effect.value)
+        self.duration: int | None = effect.duration
+        self.per_turn: bool = effect.per_turn
+
+    def run(self,
+            action_name: str,
+            user,
+            targets: Sequence[Any],
+            journal: TUndoJournal | None = None,
+            timers: TTimerWheel | None = None):
+        """Applies the effect. A target that does not meet the condition is skipped.
+
+        Args:
+            action_name (str): Name of the action, used in error messages
+            user (TEntity): The entity using the action
+            targets (Sequence[TEntity]): The targets of the action
+            journal (TUndoJournal | None): Journal recording the overwritten values
+            timers (TTimerWheel | None): Wheel driving the effect if it has a duration
+        """
+        if self.duration is not None and timers is None:
+            raise ValueError("An effect of action {} lasts for a duration but the action was used without a timer wheel.\n".format(action_name))
+
+        attribute = self.attribute
+        condition = self.condition
+
+        for target in self.select_targets(action_name, targets):
+            if condition is not None and not condition(user, target):
+                continue
+
+            entity = user if self.on_user else target
+            attributes = entity._attributes
+
+            if attribute not in attributes:
+                raise ValueError("An effect of action {} manipulates an attribute {} that is not present in entity {}.\n".format(
+                    action_name, attribute, entity._name))
+
+            old_value = attributes[attribute].value
+            entity.set_attribute_value(attribute, self.operation(old_value, self.value(user, target)), journal)
+
+            if self.duration is not None:
+                status = TStatusEffect(self, action_name, user, target, entity, old_value)
+                status.start(timers)
+
+                if journal is not None:
+                    journal.record(status, None, None)
+
+def compile_effects(effects: Sequence[EffectStruct]) -> list[TCompiledEffect]:
+    """Compiles the effects of an action into the plan executed by TEntity.use_action
+    """
+    return [TCompiledEffect(ele) for ele in effects]
+
+class TDataObject(ABC):
+    """Base class for the game objects that are serialized into TRPG.data.
+
+    An object marks itself dirty whenever one of its properties changes and reports it to its observer
+    (usually the TRPG holding it), so only changed objects have their data rebuilt.
+    """
+    _dirty: bool = True
+    _observer: Callable[["TDataObject"], None] | None = None
+
+    def mark_dirty(self):
+        """Flags the object as changed so its data is rebuilt on the next flush
+        """
+        if not self._dirty:
+            self._dirty = True
+
+            if self._observer is not None:
+                self._observer(self)
+
+    def is_dirty(self) -> bool:
+        return self._dirty
+
+    def get_observer(self) -> Callable[["TDataObject"], None] | None:
+        return self._observer
+
+    def set_observer(self, observer: Callable[["TDataObject"], None] | None):
+        """Sets the callable notified the first time the object becomes dirty after a flush
+
+        Args:
+            observer (Callable | None): Called with the object as its only argument, or None to stop reporting
+        """
+        self._observer = observer
+
+        if self._dirty and observer is not None:
+            observer(self)
+
+    def flush(self):
+        """Rebuilds self.data if the object changed since the last rebuild
+        """
+        if self._dirty:
+            self.update_data()
+
+    @abstractmethod
+    def update_data(self):
+        """Rebuilds self.data from the object's properties and clears its dirty flag
+        """
+
+
+class TAttribute(TDataObject):
     def __init__(self,
                  name: str,
                  value_type: str):
@@ -82,13 +666,17 @@ class TAttribute:
         self._name = name
         self._value_type = value_type
 
+        self.data = {}
         self.update_data()
         
     def update_data(self):
-        """A method to make sure data in self.data corresponds with instance properties
+        """A method to make sure data in self.data corresponds with instance properties.
+        The dictionary is updated in place so references held by TRPG.data stay valid.
         """
-        self.data = {"name": self._name,
-                     "value type": self._value_type}
+        self.data["name"] = self._name
+        self.data["value type"] = self._value_type
+
+        self._dirty = False
     
 
     def get_name(self) -> str:
@@ -110,7 +698,7 @@ class TAttribute:
     def set_name(self, new_attribute_name: str):
         self._name = new_attribute_name
 
-        self.update_data()
+        self.mark_dirty()
 
     def set_value_type(self, new_attribute_type: str):
         if not new_attribute_type in VALUE_TYPES:
@@ -118,7 +706,7 @@ class TAttribute:
         
         self._value_type = new_attribute_type
 
-        self.updata_data()
+        self.mark_dirty()
 
 
 class TNumAttribute(TAttribute):
@@ -137,60 +725,366 @@ class TPercentAttribute(TAttribute):
     def __init__(self, name):
         super().__init__(name, "percent")
 
-class TAction:
+class TAction(TDataObject):
     def __init__(self,
                  name: str,
                  effects: Sequence[EffectStruct]):
         self._name = name
         self._effects: Sequence[EffectStruct] = effects
+        self._plan: list[TCompiledEffect] = compile_effects(effects)
+        self._timed = any(ele.duration is not None for ele in self._plan)
         
+        self.data = {}
         self.update_data()
 
     def update_data(self):
-        self.data = {"name": self._name,
-                    "effects": []}
+        self.data["name"] = self._name
+        self.data["effects"] = []
         
         for ele in self._effects:
-            effect_data = {"attribute": ele.attribute,
-                           "effect type": ele.effect_type,
-                           "modifier": ele.modifier,
-                           "value": None,
-                           "condition": None}
-            
-            if isinstance(ele.value, EffectStruct):
-                effect_data["value"] = {"attribute": ele.value.attribute,
-                                        "attribute owner": ele.value.attribute_owner,
-                                        "modifier": ele.value.modifier,
-                                        "value": ele.value.value,
-                                        "flat": ele.value.flat}
-            else:
-                effect_data["value"] = ele.value
+            self.data["effects"].append(effect_to_data(ele))
 
-            if isinstance(ele.condition, ConditionStruct):
-                effect_data["condition"] = {"attribute": ele.condition.attribute,
-                                            "attribute owner": ele.condition.attribute_owner,
-                                            "comparison": ele.condition.comparison,
-                                            "value": ele.condition.value}
-                
-            self.data["effects"].append(effect_data)
+        self._dirty = False
 
     def get_name(self) -> str:
         return self._name
 
     def get_effects(self) -> Sequence[EffectStruct]:
         return self._effects
+
+    def get_plan(self) -> list[TCompiledEffect]:
+        return self._plan
+
+    def is_timed(self) -> bool:
+        """Whether one of the effects has a duration, so using the action files statuses in a timer wheel
+        """
+        return self._timed
     
     def set_name(self, new_action_name: str):
         self._name = new_action_name
 
-        self.update_data()
+        self.mark_dirty()
 
     def set_effects(self, new_action_effects: Sequence[EffectStruct]):
         self._effects = new_action_effects
+        self._plan = compile_effects(new_action_effects)
+        self._timed = any(ele.duration is not None for ele in self._plan)
 
-        self.update_data()
+        self.mark_dirty()
+
+class TConditionWatch:
+    """A comparison on one attribute of one entity whose result is cached until that attribute is written.
+    Created by TConditionIndex.watch
+    """
+    __slots__ = ("entity", "attribute", "comparison", "value", "_compare", "_result", "_stale")
+
+    def __init__(self,
+                 entity: "TEntity",
+                 attribute: str,
+                 comparison: str,
+                 value: SupportedValTypes):
+        if comparison not in COMPARISON_FUNCTIONS:
+            raise ValueError("Comparison {} is not a supported comparison.\n".format(comparison))
+
+        self.entity = entity
+        self.attribute = attribute
+        self.comparison = comparison
+        self.value = value
+        self._compare = COMPARISON_FUNCTIONS[comparison]
+        self._result = False
+        self._stale = True
+
+    @property
+    def result(self) -> bool:
+        if self._stale:
+            # Cleared before reading the value, so a write landing during the comparison marks it stale again
+            self._stale = False
+            self._result = self._compare(self.entity.get_attributes()[self.attribute].value, self.value)
+
+        return self._result
+
+    def invalidate(self):
+        self._stale = True
+
+class TConditionIndex:
+    def __init__(self):
+        """Initialize an empty index of watched conditions. The watches are filed on their entity under the attribute
+        they read, so writing an attribute only invalidates the conditions depending on it, and reading a condition
+        only re-evaluates it if one of its inputs was written since the last read
+        """
+        self._watches: set[TConditionWatch] = set()
+
+    def watch(self,
+              entity: "TEntity",
+              attribute: str,
+              comparison: str,
+              value: SupportedValTypes) -> TConditionWatch:
+        """Starts watching "entity.attribute comparison value"
+
+        Returns:
+            TConditionWatch: The watch, whose result property gives the current result of the condition
+        """
+        if attribute not in entity.get_attributes():
+            raise ValueError("An attribute {} is not part of {}'s attribute list.\n".format(attribute, entity.get_name()))
+
+        new = TConditionWatch(entity, attribute, comparison, value)
+
+        entity.add_condition_watch(new)
+        self._watches.add(new)
+
+        return new
+
+    def unwatch(self, watch: TConditionWatch):
+        if watch in self._watches:
+            self._watches.remove(watch)
+            watch.entity.remove_condition_watch(watch)
+
+    def clear(self):
+        for ele in list(self._watches):
+            self.unwatch(ele)
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+class _IndexWatch:
+    """Reports writes of an indexed attribute of an entity to its TAttributeIndex, filed on the entity like a TConditionWatch
+    """
+    __slots__ = ("attribute", "index", "entity")
+
+    def __init__(self, attribute: str, index: "TAttributeIndex", entity: "TEntity"):
+        self.attribute = attribute
+        self.index = index
+        self.entity = entity
+
+    def invalidate(self):
+        self.index.update(self.entity)
+
+class TAttributeIndex(ABC):
+    # Comparisons query answers
+    COMPARISONS: Sequence[str] = COMPARISON
+
+    def __init__(self, attribute: str):
+        """Initialize an empty secondary index of the values of an attribute. Every entity added is watched,
+        so the index follows each write of the attribute, including the ones made by use_action and modify_entity.
+        Entities without the attribute are watched too and join the index once they get it
+
+        Args:
+            attribute (str): Name of the attribute
+        """
+        self.attribute = attribute
+
+        self._watches: dict["TEntity": _IndexWatch] = {}
+        # Writes can come from several threads at once, see TRPG.enable_entity_locks
+        self._lock = threading.Lock()
+
+    def add(self, entity: "TEntity"):
+        if entity in self._watches:
+            return
+
+        watch = _IndexWatch(self.attribute, self, entity)
+        entity.add_condition_watch(watch)
+        self._watches.update({entity: watch})
+
+        self.update(entity)
+
+    def remove(self, entity: "TEntity"):
+        if entity not in self._watches:
+            return
+
+        entity.remove_condition_watch(self._watches.pop(entity))
+
+        with self._lock:
+            self._discard(entity)
+
+    def update(self, entity: "TEntity"):
+        """Files an entity under the current value of the attribute
+        """
+        attribute = entity.get_attributes().get(self.attribute)
+
+        with self._lock:
+            self._discard(entity)
+
+            if attribute is not None and self.accepts(attribute.value):
+                self._insert(entity, attribute.value)
+
+    def close(self):
+        """Stops watching every entity
+        """
+        for ele in list(self._watches):
+            self.remove(ele)
+
+    @abstractmethod
+    def query(self,
+              comparison: str,
+              value: SupportedValTypes) -> list["TEntity"]:
+        """Finds the entities whose value of the attribute satisfies "value_of_entity comparison value"
+        """
+
+    @staticmethod
+    @abstractmethod
+    def accepts(value: SupportedValTypes) -> bool:
+        """Whether a value is filed by this kind of index. Values it does not accept are left out of the index,
+        and TRPG.query leaves them out of its scans too
+        """
+
+    @abstractmethod
+    def _insert(self, entity: "TEntity", value: SupportedValTypes):
+        pass
+
+    @abstractmethod
+    def _discard(self, entity: "TEntity"):
+        pass
+
+class TSortedIndex(TAttributeIndex):
+    def __init__(self, attribute: str):
+        """Initialize an index of a num attribute, kept as a sorted list of (value, entity id) entries.
+        Range and equality queries bisect it, in O(log n + k) for k results
+
+        Args:
+            attribute (str): Name of the attribute
+        """
+        super().__init__(attribute)
+
+        self._entries: list[tuple[NumType, int]] = []
+        self._entry_of: dict["TEntity": tuple[NumType, int]] = {}
+        self._ids: dict["TEntity": int] = {}
+        self._entities: dict[int: "TEntity"] = {}
+        self._next_id = 0
+
+    def add(self, entity: "TEntity"):
+        if entity not in self._ids:
+            # Entities with the same value come out in the order they were added
+            self._ids.update({entity: self._next_id})
+            self._entities.update({self._next_id: entity})
+            self._next_id += 1
+
+        super().add(entity)
+
+    def remove(self, entity: "TEntity"):
+        super().remove(entity)
+
+        if entity in self._ids:
+            self._entities.pop(self._ids.pop(entity))
+
+    @staticmethod
+    def accepts(value: SupportedValTypes) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value)
+
+    def _insert(self, entity: "TEntity", value: NumType):
+        entry = (value, self._ids[entity])
+        insort(self._entries, entry)
+        self._entry_of.update({entity: entry})
+
+    def _discard(self, entity: "TEntity"):
+        entry = self._entry_of.pop(entity, None)
+
+        if entry is not None:
+            del self._entries[bisect_left(self._entries, entry)]
+
+    def between(self,
+                low: NumType | None = None,
+                high: NumType | None = None,
+                include_low: bool = True,
+                include_high: bool = True) -> list["TEntity"]:
+        """Finds the entities whose value lies between low and high, in increasing order of value
+
+        Args:
+            low (NumType | None): Lower bound, None for no bound
+            high (NumType | None): Upper bound, None for no bound
+            include_low (bool): Whether a value equal to low is included
+            include_high (bool): Whether a value equal to high is included
+        """
+        with self._lock:
+            start, end = 0, len(self._entries)
+
+            # Entity ids are never negative, so (value, -1) sorts before every entry of value and (value, inf) after them
+            if low is not None:
+                start = bisect_left(self._entries, (low, -1) if include_low else (low, math.inf))
+
+            if high is not None:
+                end = bisect_right(self._entries, (high, math.inf) if include_high else (high, -1))
+
+            return [self._entities[ele[1]] for ele in self._entries[start:end]]
+
+    def query(self,
+              comparison: str,
+              value: NumType) -> list["TEntity"]:
+        if comparison == "=":
+            return self.between(value, value)
+
+        if comparison == "!=":
+            return self.between(high=value, include_high=False) + self.between(value, include_low=False)
+
+        if comparison == ">":
+            return self.between(value, include_low=False)
+
+        if comparison == ">=":
+            return self.between(value)
+
+        if comparison == "<":
+            return self.between(high=value, include_high=False)
+
+        if comparison == "<=":
+            return self.between(high=value)
+
+        raise ValueError("Comparison {} is not a supported comparison.\n".format(comparison))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class THashIndex(TAttributeIndex):
+    COMPARISONS = ["=", "!="]
+
+    def __init__(self, attribute: str):
+        """Initialize an index of an alpha or bool attribute, bucketing the entities by value.
+        Equality queries take O(1 + k) for k results
+
+        Args:
+            attribute (str): Name of the attribute
+        """
+        super().__init__(attribute)
+
+        # Dicts used as insertion ordered sets
+        self._buckets: dict[SupportedValTypes: dict["TEntity": None]] = {}
+        self._value_of: dict["TEntity": SupportedValTypes] = {}
+
+    @staticmethod
+    def accepts(value: SupportedValTypes) -> bool:
+        return isinstance(value, (str, bool))
+
+    def _insert(self, entity: "TEntity", value: SupportedValTypes):
+        self._buckets.setdefault(value, {}).update({entity: None})
+        self._value_of.update({entity: value})
+
+    def _discard(self, entity: "TEntity"):
+        if entity not in self._value_of:
+            return
+
+        value = self._value_of.pop(entity)
+        bucket = self._buckets[value]
+        bucket.pop(entity)
+
+        if len(bucket) == 0:
+            self._buckets.pop(value)
+
+    def query(self,
+              comparison: str,
+              value: SupportedValTypes) -> list["TEntity"]:
+        with self._lock:
+            if comparison == "=":
+                return list(self._buckets.get(value, ()))
+
+            if comparison == "!=":
+                return [entity for key, bucket in self._buckets.items() if key != value for entity in bucket]
+
+        raise ValueError("Comparison {} is not supported by the index of {}, only = and != are.\n".format(comparison, self.attribute))
+
+    def __len__(self) -> int:
+        return len(self._value_of)
+
+class TEntity(TDataObject):
+    _condition_watches: dict[str: list[TConditionWatch]] | None = None
 
-class TEntity:
     def __init__(self,
                  name: str,
                  attributes: Sequence[AttrValueStruct] = None,
@@ -209,14 +1103,18 @@ class TEntity:
             if isinstance(action, TAction):
                 self._actions.update({action.get_name(): action})
 
+        # Taken by TRPG.use_action when the game has entity locks enabled
+        self.lock = threading.RLock()
+
+        self.data = {}
         self.update_data()
         
 
     def update_data(self):
 
-        self.data = {"name": self._name,
-                    "attributes": [],
-                    "actions": []}
+        self.data["name"] = self._name
+        self.data["attributes"] = []
+        self.data["actions"] = []
         
         for ele in self._attributes:
             self.data["attributes"].append({"name": self._attributes[ele].attribute,
@@ -226,6 +1124,8 @@ class TEntity:
         for ele in self._actions:
             self.data["actions"].append(ele)
 
+        self._dirty = False
+
     def get_name(self):
         return self._name
 
@@ -238,17 +1138,78 @@ class TEntity:
     def set_name(self, new_action_name: str):
         self._name = new_action_name
 
-        self.update_data()
+        self.mark_dirty()
 
     def set_attributes(self, new_entity_attributes: Sequence[AttrValueStruct]):
-        self._attributes = new_entity_attributes
+        self._attributes = {}
 
-        self.update_data()
+        for ele in new_entity_attributes:
+            self._attributes.update({ele.attribute: ele})
+
+        if self._condition_watches is not None:
+            for watches in self._condition_watches.values():
+                for ele in watches:
+                    ele.invalidate()
+
+        self.mark_dirty()
 
     def set_actions(self, new_entity_actions: Sequence[TAction]):
-        self._actions = new_entity_actions
+        self._actions = {}
 
-        self.update_data()
+        for action in new_entity_actions:
+            self._actions.update({action.get_name(): action})
+
+        self.mark_dirty()
+
+    def set_attribute_value(self, attribute_name: str, value: SupportedValTypes, journal: TUndoJournal | None = None):
+        """Writes the value of one of the entity's attributes. Every change made by an action goes through here.
+
+        Args:
+            attribute_name (str): Name of the attribute
+            value (SupportedValTypes): The new value
+            journal (TUndoJournal | None): Journal to record the previous value in
+        """
+        if journal is not None:
+            journal.record(self, attribute_name, self._attributes[attribute_name].value)
+
+        self._attributes[attribute_name].value = value
+
+        if self._condition_watches is not None and attribute_name in self._condition_watches:
+            for ele in self._condition_watches[attribute_name]:
+                ele.invalidate()
+
+        self.mark_dirty()
+
+    def value_written(self, attribute_name: str):
+        """Reports an attribute value written without set_attribute_value, e.g. by a TColumnStore
+        """
+        if self._condition_watches is not None and attribute_name in self._condition_watches:
+            for ele in self._condition_watches[attribute_name]:
+                ele.invalidate()
+
+        self.mark_dirty()
+
+    def add_condition_watch(self, watch: TConditionWatch):
+        if self._condition_watches is None:
+            self._condition_watches = {}
+
+        self._condition_watches.setdefault(watch.attribute, []).append(watch)
+
+    def remove_condition_watch(self, watch: TConditionWatch):
+        self._condition_watches[watch.attribute].remove(watch)
+
+        if len(self._condition_watches[watch.attribute]) == 0:
+            self._condition_watches.pop(watch.attribute)
+
+    def restore_value(self, attribute_name: str, old_value: SupportedValTypes):
+        """Puts back a value recorded in a TUndoJournal
+        """
+        self.set_attribute_value(attribute_name, old_value)
+
+    def changed_values(self, attribute_name: str, old_value: SupportedValTypes) -> list[tuple["TEntity", str, SupportedValTypes]]:
+        """Returns the (entity, attribute, old value) triples of a value recorded in a TUndoJournal
+        """
+        return [(self, attribute_name, old_value)]
 
     def display(self, attribute_name):
         if attribute_name not in self._attridefbutes:
@@ -256,371 +1217,666 @@ class TEntity:
 
         return str("{} {}: {}").format(self._name ,attribute_name, self._attributes[attribute_name].value)
 
-    def check_condition(self,
-                        condition: ConditionStruct) -> bool:
-        if condition.attribute not in self._attributes:
-            raise ValueError("The attribute checked by this condition {} is not an attribute in the entity {}.\n".format(condition.attribute, self._name))
+    def use_action(self,
+                   action: TAction,
+                   obj: Sequence[Any] | None = None,
+                   columns = None,
+                   timers: TTimerWheel | None = None) -> TUndoJournal:
+        """Uses an action by running the plan compiled when the action was defined.
+        The action is atomic: if any effect fails, every value it already changed is restored before the error is raised.
 
-        if condition.comparison == "=":
-            if self._attributes[condition.attribute].value == condition.value:
-                return True
+        Args:
+            action (TAction): The action to use. Must be in the entity's action list
+            obj (Sequence[TEntity] | None): The targets of the action
+            columns (TColumnStore | None): Column store holding the targets' numeric attributes, if the game uses one.
+                Multi-target effects it can vectorize are applied through it
+            timers (TTimerWheel | None): Wheel driving the effects that have a duration
 
-            else:
-                return False
+        Returns:
+            TUndoJournal: The values the action overwrote
+        """
+        if action.get_name() not in self._actions:
+            raise ValueError("An action named {} is not in {}'s action list.\n".format(action.get_name(), self._name))
 
-        elif condition.comparison == "!=":
-            if self._attributes[condition.attribute].value != condition.value:
-                return True
+        targets = list(obj) if obj is not None else []
 
-            else:
-                return False
+        if not all(isinstance(ele, TEntity) for ele in targets):
+            raise ValueError("Not all elements of the list of targets given are TEntity types.\n")
 
-        elif condition.comparison == ">":
-            if self._attributes[condition.attribute].value > condition.value:
-                return True
+        action_name = action.get_name()
+        journal = TUndoJournal()
 
-            else:
-                return False
+        try:
+            for effect in action.get_plan():
+                if columns is not None and effect.duration is None and columns.apply_effect(effect, action_name, self, targets, journal):
+                    continue
 
-        elif condition.comparison == ">=":
-            if self._attributes[condition.attribute].value >= condition.value:
-                return True
+                effect.run(action_name, self, targets, journal, timers)
 
-            else:
-                return False
+        except Exception:
+            journal.rollback()
+            raise
 
-        elif condition.comparison == "<":
-            if self._attributes[condition.attribute].value < condition.value:
-                return True
+        return journal
 
-            else:
-                return False
+    def get_actions(self):
+        return self._actions
 
-        elif condition.comparison == "<=":
-            if self._attributes[condition.attribute].value <= condition.value:
-                return True
+class TRecordRef:
+    """A record that is only decoded when it is needed, e.g. an entity stored at an offset of a binary game file
+    """
+    __slots__ = ("name", "_loader")
 
-            else:
-                return False
+    def __init__(self, name: str, loader: Callable[[], dict]):
+        self.name = name
+        self._loader = loader
 
-    def get_value_based_on_attribute(self,
-                                     value: AttrBasedValStruct):
-        if value.attribute not in self._attributes:
-            raise ValueError(
-                "An attribute named {} does not exist in {}'s attribute list.\n".format(value.attribute, self._name))
+    def load(self) -> dict:
+        return self._loader()
 
-        flat = 0
-        if isinstance(value.flat, FlatChangeStruct):
-            if value.flat.modifier == "+":
-                flat = value.flat.value
+class TLazyEntityMap(MutableMapping):
+    def __init__(self, hydrate: Callable[[dict], TEntity]):
+        """Initialize an empty entity mapping for a lazily loaded game. Entities are held as their raw records,
+        or references to them, and only become TEntity objects the first time they are looked up.
 
-            elif value.flat.modifier == "-":
-                flat = -value.flat.value
+        Args:
+            hydrate (Callable[[dict], TEntity]): Builds the entity of a record
+        """
+        self._items: dict[str: TEntity | dict | TRecordRef] = {}
+        self._hydrate = hydrate
+        self._sources: list = []
 
-        true_value = flat
-        if value.modifier == "+":
-            true_value += self._attributes[value.attribute].value + value.value
+        # Lookups can come from several threads at once, see TRPG.enable_entity_locks
+        self._lock = threading.Lock()
 
-        elif value.modifier == "*":
-            true_value += self._attributes[value.attribute].value * value.value
+    def add_record(self, name: str, record: dict | TRecordRef):
+        self._items.update({name: record})
 
-        return true_value
+    def add_source(self, source):
+        """Registers an object with a close method, such as a BinaryGameReader, that the records refer to.
+        It is closed once every record has been decoded
+        """
+        self._sources.append(source)
 
-    def use_action(self, action: TAction, obj: Sequence[Any] | None) -> bool:
+    def is_hydrated(self, name: str) -> bool:
+        return isinstance(self._items[name], TEntity)
 
-        if not isinstance(obj[0], TEntity):
-            raise ValueError("Object type is not TEntity.\n")
+    def hydrated_values(self) -> list[TEntity]:
+        return [ele for ele in self._items.values() if isinstance(ele, TEntity)]
 
-        if action.get_name() not in self._actions:
-            raise ValueError("An action named {} is not in {}'s action list.\n".format(action.get_name(), self._name))
+    def records(self) -> list[dict]:
+        """Returns the data of every entity without hydrating any of them. Entities never hydrated
+        are returned as the records they were loaded from
+        """
+        records = []
 
-        effects = action.get_effects()
-        revert = self._attributes
+        for name, ele in self._items.items():
+            if isinstance(ele, TRecordRef):
+                ele = ele.load()
+                self._items[name] = ele
 
-        for effect in effects:
-            if effect.effect_type == "self":
-                if effect.attribute not in self._attributes:
-                    self._attributes = revert
-                    raise ValueError("A self-targeted effect of action {} manipulates an attribute {} that is not present in entity {}".format(action.get_name(), effect.attribute.get_name(), self._name))
-
-                if effect.condition is not None:
-                    if not self.check_condition(effect.condition):
-                        self._attributes = revert
-                        break
-
-                attribute: str = effect.attribute
-                value: SupportedValTypes = effect.value
-                modifier: str = effect.modifier
-                condition: str = effect.condition
-
-                true_value = value
-
-                if condition is not None:
-                    if not self.check_condition(effect.condition):
-                        return None
-
-                if isinstance(value, AttrBasedValStruct):
-
-                    if value.attribute_owner == "user":
-                        true_value = self.get_value_based_on_attribute(value)
-
-                    elif value.attribute_owner == "target":
-                        if isinstance(obj[0], TEntity):
-                            target = obj[0]
-                            true_value = target.get_value_based_on_attribute(value)
-
-                        else:
-                            raise ValueError("An effect of action {} uses attribute based values depending on target but no valid target was given.\n".format(action.get_name()))
-
-                if modifier == "+":
-                    self._attributes[attribute].value += true_value
-
-                elif modifier == "*":
-                    self._attributes[attribute].value *= true_value
-                    
-
-                elif modifier == "=":
-                    self._attributes[attribute].value = true_value
-                    
-
-            elif effect.effect_type == "st":
-                if obj is None:
-                    self._attributes = revert
-                    raise ValueError("A single-targeted effect of action {} requires a target but none was given.\n")
-
-                target: TEntity
-                st_revert: dict[str: AttrValueStruct]
-
-                if isinstance(obj[0], TEntity):
-                    target = obj[0]
-                    st_revert = target.get_attributes()
-
-                else:
-                    raise ValueError("An invalid target object was given. Expected list[TObject | TEntity] got {}".format(type(obj)))
-
-                if effect.attribute not in target._attributes:
-                    self._attributes = revert
-                    target._attributes = st_revert
-                    raise ValueError(
-                        "A single-targeted effect of action {} manipulates an attribute {} that is not present in entity {}".format(
-                            action.get_name(), effect.attribute, target.get_name()))
+            records.append(ele.data if isinstance(ele, TEntity) else ele)
 
-                if effect.condition is not None:
-                    if not self.check_condition(effect.condition):
-                        self._attributes = revert
-                        target._attributes = st_revert
-                        break
+        for ele in self._sources:
+            ele.close()
 
-                attribute: str = effect.attribute
-                value: SupportedValTypes = effect.value
-                modifier: str = effect.modifier
-                condition: str = effect.condition
+        self._sources.clear()
 
-                true_value = value
+        return records
 
-                if condition is not None:
-                    if not self.check_condition(effect.condition):
-                        return None
+    def __getitem__(self, name: str) -> TEntity:
+        item = self._items[name]
 
-                if isinstance(value, AttrBasedValStruct):
+        if not isinstance(item, TEntity):
+            with self._lock:
+                item = self._items[name]
 
-                    if value.attribute_owner == "user":
-                        true_value = self.get_value_based_on_attribute(value)
+                if not isinstance(item, TEntity):
+                    item = self._hydrate(item.load() if isinstance(item, TRecordRef) else item)
+                    self._items[name] = item
 
-                    elif value.attribute_owner == "target":
-                        if isinstance(obj[0], TEntity):
-                            true_value = target.get_value_based_on_attribute(value)
+        return item
 
-                        else:
-                            raise ValueError(
-                                "An effect of action {} uses attribute based values depending on target but no valid target was given.\n".format(
-                                    action.get_name()))
+    def __setitem__(self, name: str, entity: TEntity):
+        self._items[name] = entity
 
-                if modifier == "+":
-                    target._attributes[attribute].value += true_value
-                    
-                elif modifier == "*":
-                    target._attributes[attribute].value *= true_value
-                    
-                elif modifier == "=":
-                    target._attributes[attribute].value = true_value          
+    def __delitem__(self, name: str):
+        del self._items[name]
 
-            elif effect.effect_type == "mt":
-                if not isinstance(obj, list):
-                    self._attributes = revert
-                    raise ValueError("A multi-targeted effect of action {} requires a list of targets and none was given.\n".format(action.get_name()))
+    def __contains__(self, name: object) -> bool:
+        return name in self._items
 
-                if not all(isinstance(ele, TEntity) for ele in obj):
-                    self._attributes = revert
-                    raise ValueError("Not all elements of the list of targets given are TEntity types.\n")
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
 
-                target: TEntity
-                for target in obj:
-                    st_revert = target.get_attributes()
+    def __len__(self) -> int:
+        return len(self._items)
 
-                    if effect.attribute not in target.get_attributes():
-                        self._attributes = revert
-                        target._attributes = st_revert
-                        raise ValueError(
-                            "A single-targeted effect of action {} manipulates an attribute {} that is not present in entity {}".format(
-                                action.get_name(), effect.attribute, target.get_name))
-
-                    if effect.condition is not None:
-                        if not self.check_condition(effect.condition):
-                            self._attributes = revert
-                            target._attributes = st_revert
-                            break
+class TEventLog:
+    def __init__(self,
+                 capacity: int = EVENT_LOG_CAPACITY,
+                 spill_path: str | None = None):
+        """Initialize an empty event log. The most recent records are kept in a ring buffer. Once it is full
+        the oldest record is appended to the spill file, or dropped if there is none, so memory stays bounded
+        however long the event runs.
 
-                    attribute: str = effect.attribute
-                    value: SupportedValTypes = effect.value
-                    modifier: str = effect.modifier
-                    condition: str = effect.condition
-
-                    true_value = value
-
-                    if condition is not None:
-                        if not self.check_condition(effect.condition):
-                            return None
-
-                    if isinstance(value, AttrBasedValStruct):
-
-                        if value.attribute_owner == "user":
-                            true_value = self.get_value_based_on_attribute(value)
+        Args:
+            capacity (int): Number of records kept in memory
+            spill_path (str | None): JSON lines file receiving the records pushed out of memory. It is truncated on first use
+        """
+        if capacity < 1:
+            raise ValueError("An event log must hold at least one record.\n")
 
-                        elif value.attribute_owner == "target":
-                            if isinstance(obj[0], TEntity):
-                                true_value = target.get_value_based_on_attribute(value)
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.dropped: int = 0
 
-                            else:
-                                raise ValueError(
-                                    "An effect of action {} uses attribute based values depending on target but no valid target was given.\n".format(
-                                        action.get_name()))
-
-                    if modifier == "+":
-                        target._attributes[attribute].value += true_value                        
-
-                    elif modifier == "*":
-                        target._attributes[attribute].value *= true_value
-
-                    elif modifier == "=":
-                        target._attributes[attribute].value = true_value
+        self._records: deque[EventLogRecordStruct] = deque()
+        self._spilled: int = 0
+        self._spill_file = None
 
-    def get_actions(self):
-        return self._actions
+    def append(self, record: EventLogRecordStruct):
+        if len(self._records) == self.capacity:
+            oldest = self._records.popleft()
+
+            if self.spill_path is not None:
+                self._spill(oldest)
+
+            else:
+                self.dropped += 1
+
+        self._records.append(record)
+
+    def _spill(self, record: EventLogRecordStruct):
+        if self._spill_file is None:
+            self._spill_file = open(self.spill_path, "w")
+
+        self._spill_file.write(json.dumps(event_record_to_data(record), separators=(",", ":")) + "\n")
+        self._spilled += 1
+
+    def close(self):
+        """Closes the spill file. The log can still be read, and reopens the file for reading when it is
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._records)
+
+    def __iter__(self) -> Iterator[EventLogRecordStruct]:
+        """Yields the records still available, oldest first: the spilled ones read back from disk, then the ones in memory
+        """
+        if self._spilled > 0:
+            if self._spill_file is not None:
+                self._spill_file.flush()
+
+            with open(self.spill_path) as spill_file:
+                for line in spill_file:
+                    yield event_record_from_data(json.loads(line))
+
+        yield from list(self._records)
+
+    def query(self,
+              kind: str | None = None,
+              actor: str | None = None,
+              entity: str | None = None,
+              turns: range | None = None) -> Iterator[EventLogRecordStruct]:
+        """Yields the records matching every given criterion
+
+        Args:
+            kind (str | None): "action", "speech" or "status"
+            actor (str | None): Name of the acting or speaking entity
+            entity (str | None): Name of an entity targeted by, or changed by, the record
+            turns (range | None): Turns of the records
+        """
+        for ele in self:
+            if kind is not None and ele.kind != kind:
+                continue
+
+            if actor is not None and ele.actor != actor:
+                continue
+
+            if entity is not None and entity not in ele.targets and all(delta[0] != entity for delta in ele.deltas):
+                continue
+
+            if turns is not None and ele.turn not in turns:
+                continue
+
+            yield ele
+
+    def replay(self, game: "TRPG", turns: range | None = None):
+        """Writes the values recorded by the action and status records onto the entities of a game, oldest first,
+        e.g. to rebuild the state reached at some turn from a copy of the game taken before the event
+
+        Args:
+            game (TRPG): The game
+            turns (range | None): Turns to replay. Defaults to every available record
+        """
+        for ele in self.query(turns=turns):
+            for entity_name, attribute_name, _, new_value in ele.deltas:
+                game.get_entity(entity_name).set_attribute_value(attribute_name, new_value)
+
+    def __str__(self) -> str:
+        lines = []
+
+        for ele in self:
+            if ele.kind == "action":
+                lines.append("{} | {} used {} on {}".format(ele.turn, ele.actor, ele.action, ele.targets))
+
+            elif ele.kind == "status":
+                lines.append("{} | {} of {} on {}".format(ele.turn, ele.action, ele.actor, ele.targets))
+
+            else:
+                lines.append("{} | {} said '{}'".format(ele.turn, ele.actor, ele.text))
+
+        return "\n".join(lines)
+
+class _InitiativeWatch:
+    """Reports writes of an entity's initiative attribute to its TInitiativeOrder, filed on the entity like a TConditionWatch
+    """
+    __slots__ = ("attribute", "order", "name")
+
+    def __init__(self, attribute: str, order: "TInitiativeOrder", name: str):
+        self.attribute = attribute
+        self.order = order
+        self.name = name
+
+    def invalidate(self):
+        self.order.reprioritize(self.name)
+
+class TInitiativeOrder:
+    def __init__(self,
+                 attribute: str,
+                 descending: bool = True):
+        """Initialize an empty turn order. Every round each entity acts once, in order of the value of a numeric attribute.
+        The entities still to act are kept in a heap. When the attribute of one of them is written mid-round it is pushed
+        again with its new value and the old entry is skipped once it surfaces, so reordering costs O(log n).
+        An entity whose attribute is removed or no longer numeric, e.g. by TRPG.modify_entity, keeps its last value
+
+        Args:
+            attribute (str): Name of the numeric attribute, e.g. "Speed"
+            descending (bool): Highest value acts first. Ties go to the entity added first
+        """
+        self.attribute = attribute
+        self.descending = descending
+        self.round: int = 0
+
+        self._entities: dict[str: TEntity] = {}
+        self._watches: dict[str: _InitiativeWatch] = {}
+        self._added: dict[str: int] = {}
+        self._versions: dict[str: int] = {}
+        self._values: dict[str: NumType] = {}
+        self._waiting: set[str] = set()
+        self._heap: list[tuple[NumType, int, int, str]] = []
+        self._count = 0
+        # Versions are drawn from one counter, so an entity removed and added again never matches its old entries
+        self._stamp = 0
+
+        # Writes of the attribute can come from several threads at once, see TRPG.enable_entity_locks
+        self._lock = threading.Lock()
+
+    def _entry(self, name: str) -> tuple[NumType, int, int, str]:
+        attribute = self._entities[name].get_attributes().get(self.attribute)
+
+        if attribute is not None and isinstance(attribute.value, (int, float)) and not isinstance(attribute.value, bool):
+            self._values[name] = attribute.value
+
+        value = self._values[name]
+
+        return (-value if self.descending else value, self._added[name], self._versions[name], name)
+
+    def _next_version(self) -> int:
+        self._stamp += 1
+
+        return self._stamp
+
+    def add(self, entity: TEntity):
+        """Adds an entity. It joins the current round
+        """
+        name = entity.get_name()
+
+        if name in self._entities:
+            raise ValueError("Entity {} is already in this turn order.\n".format(name))
+
+        if self.attribute not in entity.get_attributes() or entity.get_attributes()[self.attribute].type != "num":
+            raise ValueError("Entity {} has no num attribute {} to order turns by.\n".format(name, self.attribute))
+
+        self._entities.update({name: entity})
+        self._added.update({name: self._count})
+        self._versions.update({name: self._next_version()})
+        self._values.update({name: entity.get_attributes()[self.attribute].value})
+        self._count += 1
+
+        watch = _InitiativeWatch(self.attribute, self, name)
+        entity.add_condition_watch(watch)
+        self._watches.update({name: watch})
+
+        if self.round > 0:
+            self._waiting.add(name)
+            heapq.heappush(self._heap, self._entry(name))
+
+    def remove(self, name: str):
+        """Removes an entity. Its entry in the heap is skipped once it surfaces
+        """
+        if name not in self._entities:
+            raise ValueError("Entity {} is not in this turn order.\n".format(name))
+
+        self._entities.pop(name).remove_condition_watch(self._watches.pop(name))
+        self._added.pop(name)
+        self._versions.pop(name)
+        self._values.pop(name)
+        self._waiting.discard(name)
+
+    def reprioritize(self, name: str):
+        with self._lock:
+            if name in self._waiting:
+                self._versions[name] = self._next_version()
+                heapq.heappush(self._heap, self._entry(name))
+
+    def _new_round(self):
+        self.round += 1
+        self._waiting = set(self._entities)
+        self._heap = [self._entry(ele) for ele in self._entities]
+
+        heapq.heapify(self._heap)
+
+    def peek(self) -> str:
+        """Returns the name of the entity acting next, starting a new round if everyone acted
+        """
+        if len(self._entities) == 0:
+            raise ValueError("This turn order has no entities.\n")
+
+        if len(self._waiting) == 0:
+            self._new_round()
+
+        heap = self._heap
+
+        while heap[0][3] not in self._waiting or heap[0][2] != self._versions[heap[0][3]]:
+            heapq.heappop(heap)
+
+        return heap[0][3]
+
+    def pop(self) -> str:
+        """Returns the name of the entity acting next and marks it as having acted this round
+        """
+        name = self.peek()
+
+        heapq.heappop(self._heap)
+        self._waiting.discard(name)
+
+        return name
+
+    def close(self):
+        """Stops following the attribute of every entity
+        """
+        for name in list(self._entities):
+            self.remove(name)
+
+    def __len__(self) -> int:
+        return len(self._entities)
 
 class TEvent:
     def __init__(self,
                  participants: Sequence[TEntity],
                  turn_definitions: list[EventActionStruct | EventSpeechStruct],
-                 end_condition: EventEndConditionStruct | EventEndConditionAttributeStruct):
+                 end_condition: EventEndConditionStruct | EventEndConditionAttributeStruct,
+                 log: TEventLog | None = None,
+                 conditions: TConditionIndex | None = None,
+                 initiative: str | None = None):
+        """Initialize an event. Without initiative the turn definitions are played in order, over and over.
+        With initiative every participant with turn definitions acts once per round, in the order of the given
+        attribute, playing its own definitions in order, see TInitiativeOrder
 
+        Args:
+            initiative (str | None): Name of the num attribute ordering the turns, e.g. "Speed"
+        """
         self.turns: int = 0
-        self.log: str
+        self.log: TEventLog = log if log is not None else TEventLog()
+        self.conditions: TConditionIndex = conditions if conditions is not None else TConditionIndex()
+        self._end_watch: TConditionWatch | None = None
         self.end = end_condition
         self.participants: Mapping[str: TEntity]= {}
         self.turn_def = turn_definitions
         self.current_turn: EventActionStruct | EventSpeechStruct
+        self.initiative: TInitiativeOrder | None = None
+        self.timers = TTimerWheel()
+        self._moves: dict[str: list[EventActionStruct | EventSpeechStruct]] = {}
+        self._moves_played: dict[str: int] = {}
 
         for ele in participants:
             self.participants.update({ele.get_name(): ele})
 
+        if initiative is not None:
+            self.initiative = TInitiativeOrder(initiative)
 
-    def check_end(self):
-        if isinstance(self.end, EventEndConditionStruct):
-            if self.end.comparison == "=":
-                if self.turns == self.end.value:
-                    return True
+            for ele in turn_definitions:
+                self._add_move(ele)
 
-                else:
-                    return False
+    def _add_move(self, turn: EventActionStruct | EventSpeechStruct):
+        actor = turn.user if isinstance(turn, EventActionStruct) else turn.speaker
 
-            elif self.end.comparison == "!=":
-                if self.turns != self.end.value:
-                    return True
+        if actor not in self.participants:
+            raise ValueError("Entity {} is not a part of this event.\n".format(actor))
 
-                else:
-                    return False
+        if actor not in self._moves:
+            self._moves.update({actor: []})
+            self._moves_played.update({actor: 0})
+            self.initiative.add(self.participants[actor])
 
-            elif self.end.comparison == ">":
-                if self.turns > self.end.value:
-                    return True
+        self._moves[actor].append(turn)
 
-                else:
-                    return False
+    def add_participant(self,
+                        entity: TEntity,
+                        turn_definitions: Sequence[EventActionStruct | EventSpeechStruct] = ()):
+        """Adds an entity to the event, with the turns it plays. Under initiative it joins the current round
+        """
+        if entity.get_name() in self.participants:
+            raise ValueError("Entity {} is already a part of this event.\n".format(entity.get_name()))
 
-            elif self.end.comparison == ">=":
-                if self.turns >= self.end.value:
-                    return True
+        self.participants.update({entity.get_name(): entity})
 
-                else:
-                    return False
+        for ele in turn_definitions:
+            if self.initiative is not None:
+                self._add_move(ele)
 
-            elif self.end.comparison == "<":
-                if self.turns < self.end.value:
-                    return True
+            else:
+                self.turn_def.append(ele)
 
-                else:
-                    return False
+    def remove_participant(self, name: str):
+        """Removes an entity and the turns it plays from the event
+        """
+        if name not in self.participants:
+            raise ValueError("Entity {} is not a part of this event.\n".format(name))
 
-            elif self.end.comparison == "<=":
-                if self.turns <= self.end.value:
-                    return True
+        self.participants.pop(name)
 
-                else:
-                    return False
+        if self.initiative is None:
+            self.turn_def[:] = [ele for ele in self.turn_def
+                                if (ele.user if isinstance(ele, EventActionStruct) else ele.speaker) != name]
+
+        elif name in self._moves:
+            self._moves.pop(name)
+            self._moves_played.pop(name)
+            self.initiative.remove(name)
+
+    def turn_definitions(self) -> list[EventActionStruct | EventSpeechStruct]:
+        """Returns the turns the event currently plays, including the ones of participants added since it was made
+        """
+        if self.initiative is None:
+            return list(self.turn_def)
+
+        return [turn for moves in self._moves.values() for turn in moves]
+
+    def _peek_turn(self) -> EventActionStruct | EventSpeechStruct:
+        if self.initiative is None:
+            if len(self.turn_def) == 0:
+                raise ValueError("This event has no turns left to play.\n")
+
+            return self.turn_def[self.turns % len(self.turn_def)]
+
+        actor = self.initiative.peek()
+
+        return self._moves[actor][self._moves_played[actor] % len(self._moves[actor])]
+
+    def check_end(self) -> bool:
+        """Checks the end condition of the event. An attribute end condition is watched through the event's
+        TConditionIndex, so it is only evaluated again after its attribute was written
+        """
+        if isinstance(self.end, EventEndConditionStruct):
+            if self.end.comparison not in COMPARISON_FUNCTIONS:
+                raise ValueError("Comparison {} is not a supported comparison.\n".format(self.end.comparison))
 
-        elif isinstance(self.end, EventEndConditionAttributeStruct):
+            return COMPARISON_FUNCTIONS[self.end.comparison](self.turns, self.end.value)
+
+        if self._end_watch is None:
             if self.end.obj not in self.participants:
                 raise ValueError("Entity {} is not a part of this event.\n".format(self.end.obj))
 
-            if self.end.attribute not in self.participants[self.end.obj].get_attributes():
-                raise ValueError("An attribute {} is not part of {}'s attribute list.\n".format(self.end.attribute, self.end.obj))
+            self._end_watch = self.conditions.watch(self.participants[self.end.obj],
+                                                    self.end.attribute,
+                                                    self.end.comparison,
+                                                    self.end.value)
 
-            entity = self.participants[self.end.obj]
-            entity_attributes = entity.get_attributes()
+        return self._end_watch.result
 
-            if self.end.comparison == "=":
-                if entity_attributes[self.end.attribute].value == self.end.value:
-                    return True
+    def next_turn(self) -> EventActionStruct | EventSpeechStruct:
+        self.current_turn = self._peek_turn()
 
-                else:
-                    return False
+        if self.initiative is not None:
+            actor = self.initiative.pop()
+            self._moves_played[actor] += 1
 
-            elif self.end.comparison == "!=":
-                if entity_attributes[self.end.attribute].value != self.end.value:
-                    return True
+        return self.current_turn
 
-                else:
-                    return False
+    def turn_entities(self) -> list[str]:
+        """Returns the names of the entities the next turn involves, in sorted order
+        """
+        turn = self._peek_turn()
 
-            elif self.end.comparison == ">":
-                if entity_attributes[self.end.attribute].value > self.end.value:
-                    return True
+        if isinstance(turn, EventActionStruct):
+            return sorted({turn.user, *turn.target})
 
-                else:
-                    return False
+        return [turn.speaker]
 
-            elif self.end.comparison == ">=":
-                if entity_attributes[self.end.attribute].value >= self.end.value:
-                    return True
+    def close(self):
+        """Stops watching the end condition, e.g. when the event is removed from its game
+        """
+        if self._end_watch is not None:
+            self.conditions.unwatch(self._end_watch)
+            self._end_watch = None
 
-                else:
-                    return False
+        if self.initiative is not None:
+            self.initiative.close()
 
-            elif self.end.comparison == "<":
-                if entity_attributes[self.end.attribute].value < self.end.value:
-                    return True
+class TSharedLock:
+    def __init__(self):
+        """Initialize a lock held either by one thread exclusively or by any number of threads shared.
+        Both ways are reentrant, and the thread holding it exclusively may also take it shared.
+        A thread holding it only shared cannot take it exclusively. Waiting exclusive holders go first,
+        so a stream of shared holders cannot starve them
 
-                else:
-                    return False
+        Used as a context manager, the lock is taken exclusively, like a threading.RLock
+        """
+        self._condition = threading.Condition(threading.Lock())
+        self._owner: int | None = None
+        self._depth = 0
+        self._shared: dict[int: int] = {}
+        self._waiting = 0
 
-            elif self.end.comparison == "<=":
-                if entity_attributes[self.end.attribute].value <= self.end.value:
-                    return True
+    def acquire(self):
+        thread = threading.get_ident()
 
-                else:
-                    return False
-                
+        with self._condition:
+            if self._owner == thread:
+                self._depth += 1
+                return
+
+            if thread in self._shared:
+                raise RuntimeError("A thread holding a shared lock cannot take it exclusively.\n")
+
+            self._waiting += 1
+
+            try:
+                while self._owner is not None or self._shared:
+                    self._condition.wait()
+
+            finally:
+                self._waiting -= 1
+
+            self._owner = thread
+            self._depth = 1
+
+    def release(self):
+        with self._condition:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("Cannot release a lock that is not held exclusively by this thread.\n")
+
+            self._depth -= 1
+
+            if self._depth == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+    def acquire_shared(self):
+        thread = threading.get_ident()
+
+        with self._condition:
+            if self._owner != thread and thread not in self._shared:
+                while self._owner is not None or self._waiting:
+                    self._condition.wait()
+
+            self._shared[thread] = self._shared.get(thread, 0) + 1
+
+    def release_shared(self):
+        thread = threading.get_ident()
+
+        with self._condition:
+            if thread not in self._shared:
+                raise RuntimeError("Cannot release a lock that is not held shared by this thread.\n")
+
+            self._shared[thread] -= 1
+
+            if self._shared[thread] == 0:
+                self._shared.pop(thread)
+
+                if not self._shared:
+                    self._condition.notify_all()
+
+    def held_shared(self) -> bool:
+        """Whether the calling thread holds the lock shared and not exclusively
+        """
+        thread = threading.get_ident()
+
+        return thread in self._shared and self._owner != thread
+
+    def __enter__(self) -> "TSharedLock":
+        self.acquire()
+
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    @contextlib.contextmanager
+    def shared(self) -> Iterator["TSharedLock"]:
+        self.acquire_shared()
+
+        try:
+            yield self
+
+        finally:
+            self.release_shared()
+
+def _synchronized(method: Callable) -> Callable:
+    """Runs a TRPG method while holding the game's lock exclusively, see TRPG.lock
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 class TRPG:
     def __init__(self,
@@ -628,94 +1884,385 @@ class TRPG:
         self._name: str = name
         self.attributes: dict[str: TAttribute] = {}
         self.actions: dict[str: TAction] = {}
-        self.entities: dict[str:TEntity] = {}
+        self.entities: dict[str:TEntity] | TLazyEntityMap = {}
         self.event: dict[str: TEvent] = {}
-        self.event_running: TEvent | None = None
+        self.events_running: dict[str: TEvent] = {}
         self.log: str
-        self.data = {"name": self._name,
-                     "attributes": [],
-                     "actions": [],
-                     "entities": []}        
+        self.columns = None
+        # The journal.GameJournal open on the game, save_game writes its snapshot through it
+        self.journal = None
+        self.conditions = TConditionIndex()
+        self.timers = TTimerWheel()
+        self.indexes: dict[str: TAttributeIndex] = {}
+        self._dirty_objects: set[TDataObject] = set()
+        self._stale_sections: set[str] = set()
+        # The entities of a TLazyEntityMap are only collected into self.data when it is read, see the data property.
+        # Once they are, each entity's position in the list lets a hydrated entity replace its raw record in place
+        self._entities_unread = False
+        self._entity_positions: dict[str: int] | None = None
+        self._data = {"name": self._name,
+                      "attributes": [],
+                      "actions": [],
+                      "entities": []}        
+
+        # Held exclusively by every method that changes the game or reads self.data. Other threads, such as
+        # file_management.AutoSaver, take it to see a consistent game. Code changing entities
+        # directly from another thread than the game's must hold it too. With entity locks enabled,
+        # use_action only holds it shared, plus the locks of the entities involved
+        self.lock = TSharedLock()
+        self.entity_locks = False
+        # Guards the dirty set and the listeners when actions run concurrently
+        self._bookkeeping = threading.RLock()
+        self._change_listeners: list[Callable[["TRPG", TDataObject | None], None]] = []
+        self._operation_listeners: list[Callable[[str, dict], None]] = []
 
 
     def get_name(self):
         return self._name
 
+    @property
+    def data(self) -> dict:
+        """The serializable form of the game, brought up to date on access
+        """
+        with self.lock:
+            self.update_data()
+
+            if self._entities_unread:
+                self._data["entities"] = self.entities.records()
+                self._entity_positions = {name: i for i, name in enumerate(self.entities)}
+                self._entities_unread = False
+
+        return self._data
+
+    @data.setter
+    def data(self, new_data: dict):
+        self._data = new_data
+
+    @_synchronized
     def update_data(self):
-        self.data["name"] = self._name
+        """Brings self.data up to date. Only objects marked dirty since the last call are rebuilt,
+        and a section's list is only rebuilt after an object was removed from it. The entities of a lazily
+        loaded game are left to the data property, so flushing changes never decodes the records not hydrated yet
+        """
+        self._data["name"] = self._name
 
-        self.data["attributes"] = []
-        self.data["actions"] = []
-        self.data["entities"] = []
+        for ele in self._dirty_objects:
+            ele.flush()
+
+        self._dirty_objects.clear()
+
+        for section in self._stale_sections:
+            objects: dict[str: TDataObject] = getattr(self, section)
+
+            if isinstance(objects, TLazyEntityMap):
+                self._entities_unread = True
+                self._entity_positions = None
+
+            else:
+                self._data[section] = [objects[ele].data for ele in objects]
+
+        self._stale_sections.clear()
+
+    def add_change_listener(self, listener: Callable[["TRPG", TDataObject | None], None]):
+        """Registers a callable called whenever the game changes, with the game and the object that became dirty,
+        was added or was removed, or None when the whole game was reloaded. It is called often, on the thread
+        making the change and with the lock held, so it should only take note of the change
+
+        Args:
+            listener (Callable[[TRPG, TDataObject | None], None]): The callable
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener: Callable[["TRPG", TDataObject | None], None]):
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+
+    def _notify(self, obj: TDataObject | None):
+        for ele in self._change_listeners:
+            ele(self, obj)
+
+    def add_operation_listener(self, listener: Callable[[str, dict], None]):
+        """Registers a callable called after every successful new_*, modify_*, remove_* and use_action call,
+        and after a load, with the name of the method and its arguments in the JSON form of self.data.
+        A status firing or ending is reported as "status", with the values it wrote as [entity, attribute, value] lists
+        under "changes". Used to journal the game, see journal.GameJournal. Changes made directly on the objects are not reported
+
+        Args:
+            listener (Callable[[str, dict], None]): The callable
+        """
+        self._operation_listeners.append(listener)
+
+    def remove_operation_listener(self, listener: Callable[[str, dict], None]):
+        if listener in self._operation_listeners:
+            self._operation_listeners.remove(listener)
+
+    def _record(self, operation: str, arguments: dict):
+        for ele in self._operation_listeners:
+            ele(operation, arguments)
+
+    def _mark_dirty(self, obj: TDataObject):
+        with self._bookkeeping:
+            self._dirty_objects.add(obj)
+            self._notify(obj)
+
+    def _track(self, section: str, obj: TDataObject):
+        """Starts tracking a newly added object and links its data into self.data
+
+        Args:
+            section (str): "attributes", "actions" or "entities"
+            obj (TDataObject): The object just added to that section
+        """
+        obj.set_observer(self._mark_dirty)
+
+        if section not in self._stale_sections and not (section == "entities" and self._entities_unread):
+            if section == "entities" and self._entity_positions is not None:
+                self._entity_positions.update({obj.get_name(): len(self._data[section])})
+
+            self._data[section].append(obj.data)
+
+        if section == "entities" and self.columns is not None:
+            self.columns.add_entity(obj)
+
+        if section == "entities":
+            for ele in self.indexes.values():
+                ele.add(obj)
+
+        self._notify(obj)
+
+    def _untrack(self, section: str, obj: TDataObject):
+        obj.set_observer(None)
+        self._dirty_objects.discard(obj)
+
+        self._stale_sections.add(section)
+
+        if section == "entities" and self.columns is not None:
+            self.columns.remove_entity(obj)
 
-        for ele in self.attributes:
-            self.data["attributes"].append(self.attributes[ele].data)
+        if section == "entities":
+            for ele in self.indexes.values():
+                ele.remove(obj)
 
-        for ele in self.actions:
-            self.data["actions"].append(self.actions[ele].data)
+        self._notify(obj)
 
-        for ele in self.entities:
-            self.data["entities"].append(self.entities[ele].data)
+    @_synchronized
+    def enable_columns(self):
+        """Moves the numeric attributes of every entity into a NumPy backed column store,
+        so multi-target effects are applied as vector operations. Requires NumPy
+        """
+        from columns import TColumnStore
+
+        if self.columns is not None:
+            return
+
+        self.columns = TColumnStore([ele for ele in self.attributes if self.attributes[ele].get_value_type() == "num"],
+                                    capacity=len(self.entities))
+
+        # Entities of a lazy map that are not hydrated yet are added as they are hydrated
+        for ele in (self.entities.hydrated_values() if isinstance(self.entities, TLazyEntityMap) else self.entities.values()):
+            self.columns.add_entity(ele)
+
+    @_synchronized
+    def disable_columns(self):
+        """Moves the numeric attributes back into the entities and drops the column store
+        """
+        if self.columns is None:
+            return
+
+        self.columns.clear()
+        self.columns = None
  
     def load_data(self):
-        self.attributes.clear()
-        self.actions.clear()
-        self.entities.clear()
-
-        self._name = self.data["name"]
-
-        for ele in self.data["attributes"]:
-            self.new_attribute(ele["name"], ele["value type"])
-
-        for ele in self.data["actions"]:
-            effects_list = []
-            for eff in ele["effects"]:
-                condition = None
-                if eff["condition"] != None:
-                    condition = ConditionStruct(eff["condition"]["attribute"],
-                                                eff["condition"]["attribute owner"],
-                                                eff["condition"]["comparison"],
-                                                eff["condition"]["value"])
-                    
-                effect = EffectStruct(eff["attribute"], eff["effect type"], condition, eff["modifier"], eff["value"])
-                effects_list.append(effect)
-
-            self.new_action(ele["name"], effects=effects_list)
-
-        for ele in self.data["entities"]:
-            attribute_list = []
-            
-            for attribute in ele["attributes"]:
-                attribute_list.append(AttrValueStruct(attribute["name"], attribute["value type"], attribute["value"]))
+        """Rebuilds the game from self.data in a single pass.
 
-            self.new_entity(ele["name"], attribute_list, ele["actions"])
+        The whole document is validated before any existing object is replaced. Objects are built
+        directly instead of being replayed through new_attribute, new_action and new_entity, and
+        self.data is materialized once at the end, so loading is linear in the size of the document.
+        """
+        self.load_records(iter_data_records(self._data))
 
-    def new_attribute(self,
-                      name: str,
-                      value_type: str):
-        if name in self.attributes:
-            raise ValueError("An attribute named {} already exists in this game.\n".format(name))
+    @_synchronized
+    def load_records(self, records: Iterable[tuple[str, Any]], lazy: bool = False):
+        """Rebuilds the game from a stream of (section, record) pairs, as yielded by iter_data_records
+        or file_management.iter_game_file. Each record is turned into its object as soon as it arrives,
+        so the records never need to be held in memory all at once.
 
-        if value_type not in VALUE_TYPES:
-            raise ValueError("Value type {} is not a supported value type.\n".format(value_type))
+        The sections must come in the order "attributes", "actions", "entities", since each one refers to the ones before it.
 
-        new = TAttribute(name, value_type)
+        Args:
+            records (Iterable[tuple[str, Any]]): ("name", name) and (section, record) pairs. Entity records may also be TRecordRefs
+            lazy (bool): Keep the entities as records in a TLazyEntityMap and only build, and validate, each TEntity
+                the first time it is accessed. Entities never accessed are saved back exactly as they were loaded
+        """
+        # Nothing built while loading is garbage, but the cyclic collector would rescan it all
+        # again and again as the object count grows, making large loads quadratic
+        gc_enabled = gc.isenabled()
+        gc.disable()
 
-        self.attributes.update({new.get_name(): new})
+        try:
+            self._load_records(records, lazy)
+
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _load_records(self, records: Iterable[tuple[str, Any]], lazy: bool):
+        name = self._name
+        objects: dict[str: dict[str: TDataObject]] = {ele: {} for ele in SECTIONS}
+        last_section = 0
+
+        if lazy:
+            objects["entities"] = TLazyEntityMap(self._hydrate_entity)
+
+        for section, record in records:
+            if section == "name":
+                name = record
+                continue
+
+            if section not in SECTIONS:
+                continue
+
+            if SECTIONS.index(section) < last_section:
+                raise ValueError("Section {} must come before section {}.\n".format(section, SECTIONS[last_section]))
+
+            last_section = SECTIONS.index(section)
+
+            record_name = record.name if isinstance(record, TRecordRef) else record["name"]
+
+            if record_name in objects[section]:
+                raise ValueError("An object named {} already exists in the {} of this game.\n".format(record_name, section))
+
+            if section == "attributes":
+                if record["value type"] not in VALUE_TYPES:
+                    raise ValueError("Value type {} is not a supported value type.\n".format(record["value type"]))
+
+                objects[section].update({record["name"]: TAttribute(record["name"], record["value type"])})
 
+            elif section == "actions":
+                effects_list = self._check_effects([effect_from_data(eff) for eff in record["effects"]], objects["attributes"])
+
+                if len(effects_list) > 0:
+                    objects[section].update({record["name"]: TAction(record["name"], effects_list)})
+
+            elif lazy:
+                if isinstance(record, TRecordRef) or len(record["attributes"]) > 0:
+                    objects[section].add_record(record_name, record)
+
+            else:
+                if isinstance(record, TRecordRef):
+                    record = record.load()
+
+                entity = self._entity_from_record(record, objects["attributes"], objects["actions"])
+
+                if entity is not None:
+                    objects[section].update({record["name"]: entity})
+
+        self._name = name
+
+        for section in SECTIONS:
+            current: dict[str: TDataObject] = getattr(self, section)
+
+            for ele in (current.hydrated_values() if isinstance(current, TLazyEntityMap) else current.values()):
+                ele.set_observer(None)
+
+            if isinstance(current, TLazyEntityMap) or isinstance(objects[section], TLazyEntityMap):
+                setattr(self, section, objects[section])
+
+            else:
+                current.clear()
+                current.update(objects[section])
+
+            if not isinstance(objects[section], TLazyEntityMap):
+                for ele in current.values():
+                    ele.set_observer(self._mark_dirty)
+
+        if self.columns is not None:
+            self.columns = None
+            self.enable_columns()
+
+        for attribute_name, index in list(self.indexes.items()):
+            index.close()
+            self.indexes.pop(attribute_name)
+
+            if attribute_name in self.attributes:
+                self.create_index(attribute_name)
+
+        self._dirty_objects.clear()
+        self._stale_sections.update(SECTIONS)
+        self._entities_unread = False
+        self._entity_positions = None
+        self._data = {"name": self._name,
+                      "attributes": [],
+                      "actions": [],
+                      "entities": []}
+
+        # The records of a lazy map are only collected, and decoded, when self.data is read
         self.update_data()
 
-    def new_action(self,
-                   name: str,
-                   *,
-                   effects: Sequence[EffectStruct]):
-        if name in self.actions:
-            raise ValueError("An action named {} already exists in this game.\n".format(name))
+        self._notify(None)
+
+        if self._operation_listeners:
+            self._record("load", {})
+
+    def _entity_from_record(self,
+                            record: dict,
+                            attributes: Mapping[str: TAttribute],
+                            actions: Mapping[str: TAction]) -> TEntity | None:
+        """Validates an entity record and builds its entity
+
+        Returns:
+            TEntity | None: The entity, or None if the record has no attributes
+        """
+        attribute_list = self._check_entity_attributes(
+            [AttrValueStruct(attribute["name"], attribute["value type"], attribute["value"]) for attribute in record["attributes"]],
+            attributes)
+        action_list = self._resolve_actions(record["actions"], actions)
+
+        if len(attribute_list) > 0:
+            return TEntity(record["name"], attribute_list, action_list)
+
+        return None
+
+    def _hydrate_entity(self, record: dict) -> TEntity:
+        """Builds the entity of a record held by a TLazyEntityMap, the first time it is accessed
+        """
+        entity = self._entity_from_record(record, self.attributes, self.actions)
+
+        if entity is None:
+            entity = TEntity(record["name"], [], [])
+
+        entity.set_observer(self._mark_dirty)
+
+        # Once collected, self.data holds the raw record in place of the entity's data
+        if self._entity_positions is not None and "entities" not in self._stale_sections:
+            self._data["entities"][self._entity_positions[record["name"]]] = entity.data
+
+        if self.columns is not None:
+            self.columns.add_entity(entity)
+
+        for ele in self.indexes.values():
+            ele.add(entity)
+
+        return entity
+
+    def _check_effects(self,
+                       effects: Sequence[EffectStruct],
+                       attributes: Mapping[str: TAttribute] | None = None) -> list[EffectStruct]:
+        """Validates a list of effects against the attributes of the game
+
+        Args:
+            effects (Sequence[EffectStruct]): The effects to validate
+            attributes (Mapping[str: TAttribute] | None): Attributes to validate against. Defaults to self.attributes
+
+        Returns:
+            list[EffectStruct]: The validated effects
+        """
+        if attributes is None:
+            attributes = self.attributes
 
         action_effects: list[EffectStruct] = []
 
         for effect in effects:
-            if effect.attribute not in self.attributes:
+            if effect.attribute not in attributes:
                 raise ValueError("An attribute named {} does not exist in this game.\n".format(effect.attribute))
 
             if effect.effect_type not in TARGETS:
@@ -727,41 +2274,51 @@ class TRPG:
             if effect.modifier != "=" and isinstance(effect.value, (bool, str)):
                 raise ValueError("Operator {} is not applicable on value of type {}.\n".format(effect.modifier, type(effect.value)))
 
+            if effect.modifier != "=" and attributes[effect.attribute].get_value_type() != "num":
+                raise ValueError("Operator {} is not applicable on attribute {} of type {}.\n".format(effect.modifier, effect.attribute, attributes[effect.attribute].get_value_type()))
+
+            if effect.duration is not None and (not isinstance(effect.duration, int) or isinstance(effect.duration, bool) or effect.duration < 0):
+                raise ValueError("Duration {} is not a number of turns.\n".format(effect.duration))
+
+            if effect.per_turn and effect.duration is None:
+                raise ValueError("A per turn effect on {} needs a duration.\n".format(effect.attribute))
 
             if effect.condition is not None:
 
                 condition = effect.condition
 
-                if condition.attribute not in self.attributes:
+                if condition.attribute not in attributes:
                     raise ValueError("An attribute named {} does not exist in this game.\n".format(condition.attribute))
 
                 if condition.comparison not in COMPARISON:
                     raise ValueError("{} is not a supported comparison.\n".format(condition.comparison))
 
-                if condition.comparison != "!=" and condition.comparison != "=" and isinstance(type(condition.value), (bool, str)):
+                if condition.comparison != "!=" and condition.comparison != "=" and isinstance(condition.value, (bool, str)):
                     raise ValueError("Comparison {} is not applicable on value of type {}.\n".format(condition.comparison, type(condition.value)))
 
             action_effects.append(effect)
 
-        if len(action_effects) > 0:
-            new = TAction(name, action_effects)
+        return action_effects
 
-            self.actions.update({name: new})
+    def _check_entity_attributes(self,
+                                 attributes: Sequence[AttrValueStruct],
+                                 game_attributes: Mapping[str: TAttribute] | None = None) -> list[AttrValueStruct]:
+        """Validates the attribute values given to an entity
 
-            self.update_data()
-
-    def new_entity(self,
-                   name: str,
-                   attributes: Sequence[AttrValueStruct],
-                   actions: Sequence[str]):
+        Args:
+            attributes (Sequence[AttrValueStruct]): The attribute values to validate
+            game_attributes (Mapping[str: TAttribute] | None): Attributes to validate against. Defaults to self.attributes
 
-        if name in self.entities:
-            raise ValueError("An entity named {} already exists in this game.\n".format(name))
+        Returns:
+            list[AttrValueStruct]: The validated attribute values
+        """
+        if game_attributes is None:
+            game_attributes = self.attributes
 
-        object_attributes = []
+        entity_attributes: list[AttrValueStruct] = []
 
         for attribute in attributes:
-            if attribute.attribute not in self.attributes:
+            if attribute.attribute not in game_attributes:
                 raise ValueError("An attribute named {} does not exist in this game.\n".format(attribute.attribute))
 
             if attribute.type == "num" and not isinstance(attribute.value, NumType):
@@ -779,28 +2336,107 @@ class TRPG:
                     "Value of type {} does not match attribute value type {}.\n".format(type(attribute.value),
                                                                                         attribute.type))
 
-            object_attributes.append(attribute)
+            entity_attributes.append(attribute)
+
+        return entity_attributes
 
+    def _resolve_actions(self,
+                         actions: Sequence[str],
+                         game_actions: Mapping[str: TAction] | None = None) -> list[TAction]:
+        """Looks up the actions named in an entity definition
 
-        object_actions = []
+        Args:
+            actions (Sequence[str]): Names of the actions
+            game_actions (Mapping[str: TAction] | None): Actions to look the names up in. Defaults to self.actions
+
+        Returns:
+            list[TAction]: The actions, in the order they were named
+        """
+        if game_actions is None:
+            game_actions = self.actions
+
+        entity_actions: list[TAction] = []
 
         for action in actions:
-            if action not in self.actions:
+            if action not in game_actions:
                 raise ValueError("An action named {} does not exist in this game.\n".format(action))
 
-            object_actions.append(self.actions[action])
+            entity_actions.append(game_actions[action])
+
+        return entity_actions
+
+    @_synchronized
+    def new_attribute(self,
+                      name: str,
+                      value_type: str):
+        if name in self.attributes:
+            raise ValueError("An attribute named {} already exists in this game.\n".format(name))
+
+        if value_type not in VALUE_TYPES:
+            raise ValueError("Value type {} is not a supported value type.\n".format(value_type))
+
+        new = TAttribute(name, value_type)
+
+        self.attributes.update({new.get_name(): new})
+
+        if value_type == "num" and self.columns is not None:
+            self.columns.add_column(name)
+
+        self._track("attributes", new)
+
+        if self._operation_listeners:
+            self._record("new_attribute", {"name": name, "value type": value_type})
+
+    @_synchronized
+    def new_action(self,
+                   name: str,
+                   *,
+                   effects: Sequence[EffectStruct]):
+        if name in self.actions:
+            raise ValueError("An action named {} already exists in this game.\n".format(name))
+
+        action_effects = self._check_effects(effects)
+
+        if len(action_effects) > 0:
+            new = TAction(name, action_effects)
+
+            self.actions.update({name: new})
+
+            self._track("actions", new)
+
+            if self._operation_listeners:
+                self._record("new_action", {"name": name, "effects": [effect_to_data(ele) for ele in action_effects]})
+
+    @_synchronized
+    def new_entity(self,
+                   name: str,
+                   attributes: Sequence[AttrValueStruct],
+                   actions: Sequence[str]):
+
+        if name in self.entities:
+            raise ValueError("An entity named {} already exists in this game.\n".format(name))
+
+        object_attributes = self._check_entity_attributes(attributes)
+        object_actions = self._resolve_actions(actions)
 
         if len(object_attributes) > 0 or len(object_attributes) > 0:
             new = TEntity(name, object_attributes, object_actions)
 
             self.entities.update({name: new})
 
-            self.update_data()
+            self._track("entities", new)
 
+            if self._operation_listeners:
+                self._record("new_entity", new.data)
+
+    @_synchronized
     def new_event(self,
                      name: str,
                      participants: Sequence[str],
-                     end: EventEndConditionStruct | EventEndConditionAttributeStruct):
+                     turn_definitions: list[EventActionStruct | EventSpeechStruct],
+                     end: EventEndConditionStruct | EventEndConditionAttributeStruct,
+                     log: TEventLog | None = None,
+                     initiative: str | None = None):
         
         participants_list = []
 
@@ -813,35 +2449,59 @@ class TRPG:
             
             participants_list.append(self.entities[ele])
 
-        new = TEvent(participants, end)
+        if len(turn_definitions) == 0:
+            raise ValueError("Event {} has no turns.\n".format(name))
+
+        new = TEvent(participants_list, turn_definitions, end, log, self.conditions, initiative)
+
+        self.event.update({name: new})
 
+    @_synchronized
     def remove_attribute(self,
                          name: str):
         if name not in self.attributes:
             raise ValueError("An attribute named {} does not exist in this game.\n".format(name))
 
-        self.attributes.pop(name)
+        self._untrack("attributes", self.attributes.pop(name))
 
+        if name in self.indexes:
+            self.drop_index(name)
+
+        if self.columns is not None:
+            self.columns.remove_column(name)
+
+        if self._operation_listeners:
+            self._record("remove_attribute", {"name": name})
+
+    @_synchronized
     def remove_action(self,
                          name: str):
         if name not in self.actions:
             raise ValueError("An action named {} does not exist in this game.\n".format(name))
 
-        self.actions.pop(name)
+        self._untrack("actions", self.actions.pop(name))
+
+        if self._operation_listeners:
+            self._record("remove_action", {"name": name})
 
+    @_synchronized
     def remove_entity(self,
                       name: str):
         if name not in self.entities:
             raise ValueError("An entity named {} does not exist in this game.\n".format(name))
 
-        self.entities.pop(name)
+        self._untrack("entities", self.entities.pop(name))
 
+        if self._operation_listeners:
+            self._record("remove_entity", {"name": name})
+
+    @_synchronized
     def remove_event(self,
                         name: str):
         if name not in self.event:
             raise ValueError("An event named {} does not exist in this game.\n".format(name))
         
-        self.event.pop(name)
+        self.event.pop(name).close()
 
     def get_attribute(self,
                       name: str) -> TAttribute:
@@ -859,18 +2519,39 @@ class TRPG:
 
     def get_entity(self,
                       name: str) -> TEntity:
-        if name not in self.entities:
-            raise ValueError("An entity named {} does not exist in this game.\n")
+        with self.lock.shared():
+            if name not in self.entities:
+                raise ValueError("An entity named {} does not exist in this game.\n".format(name))
 
-        return self.entities[name]
+            return self.entities[name]
     
+    def get_entity_data(self,
+                        name: str) -> dict:
+        """Returns a copy of the serializable form of one entity, flushed under the game's lock like self.data,
+        so it can be read while other threads keep changing the entity
+
+        Args:
+            name (str): Name of the entity
+
+        Returns:
+            dict: {"name": ..., "attributes": [...], "actions": [...]}
+        """
+        with self.lock:
+            entity = self.get_entity(name)
+            self.update_data()
+
+            return {"name": entity.data["name"],
+                    "attributes": [dict(ele) for ele in entity.data["attributes"]],
+                    "actions": list(entity.data["actions"])}
+
     def get_event(self,
                       name: str) -> TEvent:
         if name not in self.event:
-            raise ValueError("An event named {} does not exist in this game.\n")
+            raise ValueError("An event named {} does not exist in this game.\n".format(name))
 
         return self.event[name]
 
+    @_synchronized
     def modify_attribute(self, attribute_name: str, new_attribute_name: str = None, new_attribute_type: str = None):
         if not attribute_name in self.attributes.keys():
             raise ValueError("An attribute named {} does not exist in this game.\n".format(attribute_name))
@@ -883,8 +2564,17 @@ class TRPG:
         if new_attribute_type is not None:
             attribute.set_value_type(new_attribute_type)
 
-        self.update_data()
+            if attribute_name in self.indexes:
+                # The other kind of index may fit the new type
+                self.drop_index(attribute_name)
+                self.create_index(attribute_name)
 
+        if self._operation_listeners:
+            self._record("modify_attribute", {"name": attribute_name,
+                                              "new name": new_attribute_name,
+                                              "new value type": new_attribute_type})
+
+    @_synchronized
     def modify_action(self, action_name: str, new_action_name: str = None, new_action_effects: Sequence[EffectStruct] = None):
         if not action_name in self.actions.keys():
             raise ValueError("An action named {} does not exist in this game.\n".format(action_name))
@@ -895,43 +2585,18 @@ class TRPG:
             action.set_name(new_action_name)
 
         if new_action_effects is not None:
-            action_effects: list[EffectStruct] = []
-
-            for effect in new_action_effects:
-                if effect.attribute not in self.attributes:
-                    raise ValueError("An attribute named {} does not exist in this game.\n".format(effect.attribute))
-
-                if effect.effect_type not in TARGETS:
-                    raise ValueError("Target {} is not a supported target.\n".format(effect.effect_type))
-
-                if effect.modifier not in OPERATORS:
-                    raise ValueError("Operator {} is not a supported operator.\n".format(effect.modifier))
-
-                if effect.modifier != "=" and isinstance(effect.value, (bool, str)):
-                    raise ValueError("Operator {} is not applicable on value of type {}.\n".format(effect.modifier, type(effect.value)))
-
-
-                if effect.condition is not None:
-
-                    condition = effect.condition
-
-                    if condition.attribute not in self.attributes:
-                        raise ValueError("An attribute named {} does not exist in this game.\n".format(condition.attribute))
-
-                    if condition.comparison not in COMPARISON:
-                        raise ValueError("{} is not a supported comparison.\n".format(condition.comparison))
-
-                    if condition.comparison != "!=" and condition.comparison != "=" and isinstance(type(condition.value), (bool, str)):
-                        raise ValueError("Comparison {} is not applicable on value of type {}.\n".format(condition.comparison, type(condition.value)))
-
-                action_effects.append(effect)
+            action_effects = self._check_effects(new_action_effects)
 
             action.set_effects(action_effects)
 
-        self.update_data()
+        if self._operation_listeners:
+            self._record("modify_action", {"name": action_name,
+                                           "new name": new_action_name,
+                                           "new effects": None if new_action_effects is None else [effect_to_data(ele) for ele in new_action_effects]})
 
+    @_synchronized
     def modify_entity(self, entity_name: str, new_entity_name: str = None, new_entity_attributes: Sequence[AttrValueStruct] = None, new_entity_actions: Sequence[str] = None):
-        if not entity_name in self.entitys.keys():
+        if not entity_name in self.entities.keys():
             raise ValueError("An entity named {} does not exist in this game.\n".format(entity_name))
         
         entity: TEntity = self.entities[entity_name]
@@ -940,111 +2605,549 @@ class TRPG:
             entity.set_name(new_entity_name)
 
         if new_entity_attributes is not None:
-            entity_attributes = []
-
-            for attribute in new_entity_attributes:
-                if attribute.attribute not in self.attributes:
-                    raise ValueError("An attribute named {} does not exist in this game.\n".format(attribute.attribute))
-
-                if attribute.type == "num" and not isinstance(attribute.value, NumType):
-                    raise ValueError(
-                        "Value of type {} does not match attribute value type {}.\n".format(type(attribute.value),
-                                                                                            attribute.type))
+            entity.set_attributes(self._check_entity_attributes(new_entity_attributes))
 
-                if attribute.type == "alpha" and not isinstance(attribute.value, str):
-                    raise ValueError(
-                        "Value of type {} does not match attribute value type {}.\n".format(type(attribute.value),
-                                                                                            attribute.type))
-
-                if attribute.type == "bool" and not isinstance(attribute.value, bool):
-                    raise ValueError(
-                        "Value of type {} does not match attribute value type {}.\n".format(type(attribute.value),
-                                                                                            attribute.type))
-
-                entity_attributes.append(attribute)
-            
-            entity.set_attributes(entity_attributes)
+            if self.columns is not None:
+                self.columns.add_entity(entity)
 
         if new_entity_actions is not None:
-            entity_actions = []
+            entity_actions = self._resolve_actions(new_entity_actions)
 
-            for action in new_entity_actions:
-                if action not in self.actions:
-                    raise ValueError("An action named {} does not exist in this game.\n".format(action))
+            entity.set_actions(entity_actions)
 
-                entity_actions.append(self.actions[action])
+        if self._operation_listeners:
+            self._record("modify_entity", {"name": entity_name,
+                                           "new name": new_entity_name,
+                                           "new attributes": None if new_entity_attributes is None else
+                                                [{"name": ele.attribute, "value type": ele.type, "value": ele.value} for ele in new_entity_attributes],
+                                           "new actions": None if new_entity_actions is None else list(new_entity_actions)})
 
-        self.update_data()
-            
-    def use_action(self,
-                   user_name: str,
-                   action_name: str,
-                   targets: Sequence[str] | None = None):
+    def _resolve_action_call(self,
+                             user_name: str,
+                             action_name: str,
+                             targets: Sequence[str] | None) -> tuple[TEntity, TAction, list[TEntity]]:
+        """Looks up the objects involved in an action use and checks the user may use the action
+
+        Returns:
+            tuple[TEntity, TAction, list[TEntity]]: The user, the action and the targets
+        """
         if user_name not in self.entities:
             raise ValueError("An entity named {} does not exist in this game.\n".format(user_name))
 
         if action_name not in self.actions:
             raise ValueError("An action named {} does not exist in this game.\n".format(action_name))
 
-        user = self.get_entity(user_name)
-        action = self.get_action(action_name)
+        user = self.entities[user_name]
+        action = self.actions[action_name]
         target_objects = []
 
         if action_name not in user.get_actions():
             raise ValueError("An action named {} is not part of {}'s action list.\n".format(action_name, user_name))
 
-        for ele in targets:
+        for ele in targets or []:
             if ele in self.entities:
                 target_objects.append(self.entities[ele])
 
             else:
                 raise ValueError("An entity named {} does not exist in this game.\n".format(ele))
 
-        user.use_action(action, target_objects)
+        return user, action, target_objects
 
-        self.update_data()
+    @_synchronized
+    def create_index(self, attribute_name: str) -> TAttributeIndex:
+        """Indexes the values of an attribute for query. A num attribute gets a TSortedIndex answering range and
+        equality queries, an alpha or bool attribute a THashIndex answering equality queries. The index follows
+        every later write, entity added and entity removed. Every entity of a lazily loaded game is hydrated
+
+        Args:
+            attribute_name (str): Name of the attribute
+
+        Returns:
+            TAttributeIndex: The index, or the existing one if the attribute is already indexed
+        """
+        if attribute_name not in self.attributes:
+            raise ValueError("An attribute named {} does not exist in this game.\n".format(attribute_name))
+
+        if attribute_name in self.indexes:
+            return self.indexes[attribute_name]
+
+        index = self._index_type(attribute_name)(attribute_name)
+
+        for ele in self.entities.values():
+            index.add(ele)
+
+        self.indexes.update({attribute_name: index})
+
+        return index
+
+    @_synchronized
+    def drop_index(self, attribute_name: str):
+        if attribute_name not in self.indexes:
+            raise ValueError("Attribute {} is not indexed.\n".format(attribute_name))
+
+        self.indexes.pop(attribute_name).close()
+
+    def query(self,
+              attribute_name: str,
+              comparison: str,
+              value: SupportedValTypes) -> list[TEntity]:
+        """Finds the entities whose value of an attribute satisfies "value_of_entity comparison value",
+        e.g. query("HP", "<=", 0). Answered by the attribute's index if it has one, by a scan of every entity otherwise
+
+        The comparisons and values accepted, and the entity values considered, are those of the index the attribute
+        would get, see create_index, whether it has one or not: a num attribute takes any comparison with a number
+        and ignores bool and NaN values, an alpha or bool attribute only takes = and != with a str or a bool
+
+        Returns:
+            list[TEntity]: The entities. In increasing order of value for an indexed num attribute
+        """
+        if comparison not in COMPARISON_FUNCTIONS:
+            raise ValueError("Comparison {} is not a supported comparison.\n".format(comparison))
+
+        with self.lock.shared():
+            if attribute_name not in self.attributes:
+                raise ValueError("An attribute named {} does not exist in this game.\n".format(attribute_name))
+
+            index_type = self._index_type(attribute_name)
+
+            if comparison not in index_type.COMPARISONS:
+                raise ValueError("Comparison {} is not supported on attribute {} of type {}.\n".format(
+                    comparison, attribute_name, self.attributes[attribute_name].get_value_type()))
+
+            if not index_type.accepts(value):
+                raise ValueError("Value {!r} cannot be compared with the values of attribute {}.\n".format(value, attribute_name))
+
+            if attribute_name in self.indexes:
+                return self.indexes[attribute_name].query(comparison, value)
+
+            compare = COMPARISON_FUNCTIONS[comparison]
+            accepts = index_type.accepts
+
+            return [ele for ele in self.entities.values()
+                    if attribute_name in ele.get_attributes()
+                    and accepts(ele.get_attributes()[attribute_name].value)
+                    and compare(ele.get_attributes()[attribute_name].value, value)]
+
+    def _index_type(self, attribute_name: str) -> type[TAttributeIndex]:
+        return TSortedIndex if self.attributes[attribute_name].get_value_type() == "num" else THashIndex
+
+    def query_range(self,
+                    attribute_name: str,
+                    low: NumType | None = None,
+                    high: NumType | None = None) -> list[TEntity]:
+        """Finds the entities whose value of a num attribute lies between low and high, both included.
+        None leaves that end open
+
+        Returns:
+            list[TEntity]: The entities. In increasing order of value if the attribute is indexed
+        """
+        with self.lock.shared():
+            if attribute_name not in self.attributes or self._index_type(attribute_name) is not TSortedIndex:
+                raise ValueError("{} is not a num attribute of this game.\n".format(attribute_name))
+
+            for ele in (low, high):
+                if ele is not None and not TSortedIndex.accepts(ele):
+                    raise ValueError("Bound {!r} of a range query is not a number.\n".format(ele))
+
+            index = self.indexes.get(attribute_name)
+
+            if isinstance(index, TSortedIndex):
+                return index.between(low, high)
+
+            return [ele for ele in self.entities.values()
+                    if attribute_name in ele.get_attributes()
+                    and TSortedIndex.accepts(ele.get_attributes()[attribute_name].value)
+                    and (low is None or ele.get_attributes()[attribute_name].value >= low)
+                    and (high is None or ele.get_attributes()[attribute_name].value <= high)]
+
+    @_synchronized
+    def enable_entity_locks(self):
+        """Lets use_action run on several threads at once. Each call holds the game's lock shared and
+        the locks of its user and targets, so only actions sharing an entity wait on each other.
+        Everything else still holds the game's lock exclusively, so it waits for the running actions to finish
+        """
+        self.entity_locks = True
+
+    @_synchronized
+    def disable_entity_locks(self):
+        self.entity_locks = False
+
+    @contextlib.contextmanager
+    def hold_entities(self, entity_names: Sequence[str]) -> Iterator[list[TEntity]]:
+        """Holds entities for a sequence of calls that must not interleave with other threads, e.g. reading
+        an entity, waiting on I/O and then using an action on it. With entity locks enabled, the game's lock
+        is held shared and the entities' locks in order of their names. Otherwise the game's lock is held exclusively.
+        A thread holding entities shared cannot call the methods holding the game's lock exclusively until it lets go,
+        and use_action raises a ValueError for the actions needing it, those with a duration or on a column store
+
+        Args:
+            entity_names (Sequence[str]): Names of the entities
+
+        Yields:
+            list[TEntity]: The entities, in the order of entity_names
+        """
+        if not self.entity_locks:
+            with self.lock:
+                yield [self.get_entity(ele) for ele in entity_names]
+
+            return
+
+        with self.lock.shared():
+            entities = [self.get_entity(ele) for ele in entity_names]
+
+            with contextlib.ExitStack() as stack:
+                for ele in sorted(set(entities), key=TEntity.get_name):
+                    stack.enter_context(ele.lock)
+
+                yield entities
+
+    def use_action(self,
+                   user_name: str,
+                   action_name: str,
+                   targets: Sequence[str] | None = None,
+                   timers: TTimerWheel | None = None) -> TUndoJournal:
+        """Uses an action. Effects with a duration are driven by the given timer wheel, by default
+        the game's own, which advance_timers moves forward. Events drive them with their own wheel
+
+        With entity locks enabled, actions on disjoint entities run concurrently, see enable_entity_locks.
+        Actions with a duration and games using a column store still hold the game's lock exclusively,
+        so they cannot be used inside hold_entities
+        """
+        if self.entity_locks:
+            held = self.lock.held_shared()
+            self.lock.acquire_shared()
+
+            try:
+                action = self.actions.get(action_name)
+
+                # An unknown action is reported by _resolve_action_call
+                if action is None or not action.is_timed() and self.columns is None:
+                    return self._use_action_locked(user_name, action_name, targets)
+
+                if held:
+                    raise ValueError("Action {} {} so it cannot be used while entities are held.\n".format(
+                        action_name, "has a duration" if action.is_timed() else "runs on the column store"))
+
+            finally:
+                self.lock.release_shared()
+
+        return self._use_action(user_name, action_name, targets, timers)
+
+    def _use_action_locked(self,
+                           user_name: str,
+                           action_name: str,
+                           targets: Sequence[str] | None) -> TUndoJournal:
+        user, action, target_objects = self._resolve_action_call(user_name, action_name, targets)
+        entities = sorted({user, *target_objects}, key=TEntity.get_name)
+        held = 0
+
+        try:
+            for ele in entities:
+                ele.lock.acquire()
+                held += 1
+
+            journal = user.use_action(action, target_objects)
+
+            # Recorded before the entities are released, so the journal lists conflicting actions in the order they ran
+            if self._operation_listeners:
+                with self._bookkeeping:
+                    self._record("use_action", {"user": user_name, "action": action_name, "targets": list(targets or [])})
+
+        finally:
+            for ele in entities[:held]:
+                ele.lock.release()
+
+        return journal
+
+    @_synchronized
+    def _use_action(self,
+                    user_name: str,
+                    action_name: str,
+                    targets: Sequence[str] | None = None,
+                    timers: TTimerWheel | None = None) -> TUndoJournal:
+        user, action, target_objects = self._resolve_action_call(user_name, action_name, targets)
+
+        journal = user.use_action(action, target_objects, self.columns, timers if timers is not None else self.timers)
+
+        if self._operation_listeners:
+            self._record("use_action", {"user": user_name, "action": action_name, "targets": list(targets or [])})
+
+        return journal
+
+    @_synchronized
+    def use_actions(self,
+                    batch: Sequence[tuple[str, str, Sequence[str] | None]]) -> list[ActionResultStruct]:
+        """Uses many actions in one go, e.g. a whole round driven by a script.
+
+        Every item is looked up and validated before any action is applied, then the valid items are applied
+        in order and self.data is brought up to date once at the end. A failing item does not stop the batch,
+        whatever the error: it is rolled back and reported in its result.
+
+        Args:
+            batch (Sequence[tuple[str, str, Sequence[str] | None]]): (user, action, targets) tuples
+
+        Returns:
+            list[ActionResultStruct]: One result per item, in the order of the batch
+        """
+        results: list[ActionResultStruct] = []
+        calls: list[tuple[TEntity, TAction, list[TEntity]] | None] = []
+
+        for user_name, action_name, targets in batch:
+            result = ActionResultStruct(user_name, action_name, list(targets or []), True, None)
+
+            try:
+                calls.append(self._resolve_action_call(user_name, action_name, targets))
+
+            except Exception as e:
+                calls.append(None)
+                result.success = False
+                result.error = str(e) or type(e).__name__
+
+            results.append(result)
+
+        try:
+            for call, result in zip(calls, results):
+                if call is None:
+                    continue
+
+                user, action, target_objects = call
+
+                try:
+                    user.use_action(action, target_objects, self.columns, self.timers)
+
+                except Exception as e:
+                    result.success = False
+                    result.error = str(e) or type(e).__name__
+
+                if result.success and self._operation_listeners:
+                    self._record("use_action", {"user": result.user, "action": result.action, "targets": result.targets})
+
+        finally:
+            self.update_data()
+
+        return results
       
-    def start_event(self,
-    
-                    event_name: str):
+    @_synchronized
+    def begin_event(self, event_name: str) -> TEvent:
+        """Marks an event as running, so its turns can be played with step_event. Any number of different events
+        may run at the same time, see scheduler.TEventScheduler
+
+        Returns:
+            TEvent: The event
+        """
         if event_name not in self.event:
             raise ValueError("An event named {} does not exist in this game.\n".format(event_name))
-        
-        if self.event_running is not None:
-            raise ValueError("An event is already running.\n")
+
+        if event_name in self.events_running:
+            raise ValueError("Event {} is already running.\n".format(event_name))
 
         event: TEvent = self.get_event(event_name)
-        self.event_running = event
+        self.events_running.update({event_name: event})
+
+        return event
 
+    def check_event_end(self, event: TEvent) -> bool:
+        """Checks the end condition of a running event while holding the entity it reads, see hold_entities,
+        so a turn played on another thread cannot write it in the middle of the check
+        """
+        if isinstance(event.end, EventEndConditionStruct):
+            return event.check_end()
+
+        with self.hold_entities([event.end.obj]):
+            return event.check_end()
+
+    def step_event(self, event: TEvent) -> list[EventLogRecordStruct]:
+        """Plays the current turn of a running event. The turn definitions are repeated in order
+        for as long as the event lasts
+
+        With entity locks enabled, a turn only holds the locks of the entities it involves, unless its action
+        has a duration or a status of the event is due, so turns of events on disjoint entities can be
+        played on several threads at once. A running event must only be stepped by one thread at a time
 
+        Returns:
+            list[EventLogRecordStruct]: The records the turn added to the event's log
+        """
+        if self.entity_locks:
+            return self._step_event(event)
 
-        while(event.check_end()):
-            current: EventActionStruct | EventSpeechStruct = event.turn_def[event.turns]
+        with self.lock:
+            return self._step_event(event)
 
-            if isinstance(current, EventActionStruct):
+    def _step_event(self, event: TEvent) -> list[EventLogRecordStruct]:
+        current: EventActionStruct | EventSpeechStruct = event.next_turn()
+        records: list[EventLogRecordStruct] = []
+
+        if isinstance(current, EventActionStruct):
+            with self.lock.shared():
                 if current.user not in self.entities:
-                    raise ValueError("An entity named {} does not exist in this game.\n")
-                
+                    raise ValueError("An entity named {} does not exist in this game.\n".format(current.user))
+
                 for ele in current.target:
                     if ele not in self.entities:
-                        raise {"An entity named {} does not exist in this game.\n".format(ele)}
-                    
+                        raise ValueError("An entity named {} does not exist in this game.\n".format(ele))
+
                 if current.action not in self.actions:
                     raise ValueError("An action named {} does not exist in this game.\n".format(current.action))
-                
-                self.use_action(current.user, current.action, current.target)
 
-                event.log += " {} | {} used {} on {}".format(event.turns + 1,current.user, current.action, current.target)
+            journal = self.use_action(current.user, current.action, current.target, event.timers)
+
+            records.append(EventLogRecordStruct(event.turns + 1,
+                                                "action",
+                                                current.user,
+                                                current.action,
+                                                list(current.target),
+                                                journal.deltas()))
 
-            elif isinstance(current, EventSpeechStruct):
+        elif isinstance(current, EventSpeechStruct):
+            with self.lock.shared():
                 if current.speaker not in self.entities:
-                    raise ValueError("An entity named {} does not exist in this game.\n")
-                
-                event.log += "{} | {} said '{}'".format(event.turns + 1, current.speaker, current.text)
+                    raise ValueError("An entity named {} does not exist in this game.\n".format(current.speaker))
+
+            records.append(EventLogRecordStruct(event.turns + 1, "speech", current.speaker, None, [], [], current.text))
+
+        event.turns += 1
+
+        # The wheel belongs to the event, only firing statuses needs the game's lock
+        if len(event.timers) > 0:
+            records.extend(self.advance_timers(event.timers))
+
+        else:
+            event.timers.advance()
+
+        for ele in records:
+            event.log.append(ele)
+
+        return records
+
+    @_synchronized
+    def advance_timers(self, timers: TTimerWheel | None = None) -> list[EventLogRecordStruct]:
+        """Moves a timer wheel one turn forward, applying the per turn effects due and reverting the ones expiring.
+        Events advance their own wheel after every turn
+
+        Args:
+            timers (TTimerWheel | None): The wheel. Defaults to the game's own
+
+        Returns:
+            list[EventLogRecordStruct]: One "status" record per status that fired
+        """
+        timers = timers if timers is not None else self.timers
+        records: list[EventLogRecordStruct] = []
+
+        for ele in timers.advance():
+            records.append(self._fire_status(ele, timers.tick, lambda journal: ele.fire(timers, journal)))
+
+        return records
+
+    def _fire_status(self,
+                     status: TStatusEffect,
+                     turn: int,
+                     run: Callable[[TUndoJournal], None]) -> EventLogRecordStruct:
+        journal = TUndoJournal()
+        run(journal)
+        deltas = journal.deltas()
+
+        # Statuses are not saved with the game, so the journal replays the values they wrote rather than the status
+        if self._operation_listeners and len(deltas) > 0:
+            self._record("status", {"user": status.user.get_name(),
+                                    "action": status.action_name,
+                                    "changes": [[entity, attribute, new_value] for entity, attribute, _, new_value in deltas]})
+
+        return EventLogRecordStruct(turn,
+                                    "status",
+                                    status.user.get_name(),
+                                    status.action_name,
+                                    [status.entity.get_name()],
+                                    deltas)
+
+    @_synchronized
+    def finish_event(self, event: TEvent) -> list[EventLogRecordStruct]:
+        """Marks an event as no longer running and ends the statuses still active in it
+
+        Returns:
+            list[EventLogRecordStruct]: The records of the statuses ended
+        """
+        records = [self._fire_status(ele, event.turns, ele.revert) for ele in event.timers.finish()]
+
+        for ele in records:
+            event.log.append(ele)
+
+        for name, ele in list(self.events_running.items()):
+            if ele is event:
+                self.events_running.pop(name)
+
+        return records
+
+    def start_event(self,
+                    event_name: str,
+                    max_turns: int | None = None) -> bool:
+        """Runs an event until its end condition is met. The turn definitions are repeated in order
+        for as long as the event lasts.
+
+        Args:
+            event_name (str): Name of the event
+            max_turns (int | None): Stops the event after this many turns even if it has not ended
+
+        Returns:
+            bool: True if the event reached its end condition, False if it was stopped by max_turns
+        """
+        event = self.begin_event(event_name)
+
+        try:
+            while not self.check_event_end(event):
+                if max_turns is not None and event.turns >= max_turns:
+                    return False
+
+                self.step_event(event)
+
+            return True
+
+        finally:
+            self.finish_event(event)
+
+def test_hold_entities():
+    new = TRPG("Hold_Test")
+
+    new.new_attribute("HP", "num")
+
+    new.new_action("Hit", effects=[EffectStruct("HP", "st", None, "+", -3)])
+    new.new_action("Burn", effects=[EffectStruct("HP", "st", None, "+", -1, duration=3, per_turn=True)])
+
+    new.new_entity("Keith", [AttrValueStruct("HP", "num", 30)], ["Hit", "Burn"])
+    new.new_entity("Logan", [AttrValueStruct("HP", "num", 30)], ["Hit", "Burn"])
+
+    # Without entity locks the game's lock is held exclusively, every action can be used
+    with new.hold_entities(["Keith", "Logan"]):
+        new.use_action("Keith", "Hit", ["Logan"])
+        new.use_action("Keith", "Burn", ["Logan"])
+
+    new.enable_entity_locks()
+
+    with new.hold_entities(["Keith", "Logan"]) as (keith, logan):
+        new.use_action("Keith", "Hit", ["Logan"])
+
+        try:
+            new.use_action("Keith", "Burn", ["Logan"])
+            raise AssertionError("A timed action was used while entities were held shared.\n")
+
+        except ValueError as e:
+            print(e)
+
+    # Let go of the entities, the timed action takes the game's lock exclusively
+    new.use_action("Keith", "Burn", ["Logan"])
+
+    new.enable_columns()
+
+    with new.hold_entities(["Keith", "Logan"]):
+        try:
+            new.use_action("Keith", "Hit", ["Logan"])
+            raise AssertionError("An action on the column store was used while entities were held shared.\n")
+
+        except ValueError as e:
+            print(e)
 
-            ++event.turns
+    new.use_action("Keith", "Hit", ["Logan"])
 
-        self.event_running = None
+    print(logan.get_attributes()["HP"].value)
 
 def test_base():
     new = TRPG("Hello")
@@ -0,0 +1,729 @@
+"""Timing checks for how the backend scales with the size of a game.
+
+Each benchmark prints its own results, run them from main.py or directly with python.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+from base import *
+from file_management import load_game
+import binary_format
+import server
+import simulation
+
+def make_game_data(entity_count: int,
+                   name: str = "Benchmark") -> dict:
+    """Builds the data of a game with entity_count entities, in the format written by save_game
+
+    Args:
+        entity_count (int): Number of entities in the game
+        name (str): Name of the game
+
+    Returns:
+        dict: The game data
+    """
+    data = {"name": name,
+            "attributes": [{"name": "HP", "value type": "num"},
+                           {"name": "MP", "value type": "num"},
+                           {"name": "Condition", "value type": "alpha"},
+                           {"name": "Alive", "value type": "bool"}],
+            "actions": [{"name": "Hit",
+                         "effects": [effect_to_data(EffectStruct("HP", "st", ConditionStruct("HP", "target", ">", 0), "+", -7))]},
+                        {"name": "Heal",
+                         "effects": [effect_to_data(EffectStruct("HP", "self", None, "+", 5)),
+                                     effect_to_data(EffectStruct("MP", "self", None, "+", -2))]}],
+            "entities": []}
+
+    for i in range(entity_count):
+        data["entities"].append({"name": "Entity_{}".format(i),
+                                 "attributes": [{"name": "HP", "value type": "num", "value": 30 + i % 20},
+                                                {"name": "MP", "value type": "num", "value": 10},
+                                                {"name": "Condition", "value type": "alpha", "value": "OK"},
+                                                {"name": "Alive", "value type": "bool", "value": True}],
+                                 "actions": ["Hit", "Heal"]})
+
+    return data
+
+def benchmark_load(sizes: Sequence[int] = (10_000, 100_000)):
+    """Times load_game on generated files of increasing size.
+    The time per entity should stay roughly constant if loading is linear.
+
+    Args:
+        sizes (Sequence[int]): Entity counts of the generated files
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, "Benchmark_{}.json".format(size))
+
+            with open(path, "w") as f:
+                json.dump(make_game_data(size), f)
+
+            start = time.perf_counter()
+            load_game(path)
+            elapsed = time.perf_counter() - start
+
+            print("load_game: {:>7} entities in {:.3f}s ({:.2f} us/entity)".format(size, elapsed, elapsed / size * 1e6))
+
+            binary_path = os.path.join(directory, "Benchmark_{}{}".format(size, binary_format.EXTENSION))
+
+            with open(binary_path, "wb") as f:
+                binary_format.write_binary_game(make_game_data(size), f)
+
+            for file_path in (path, binary_path):
+                start = time.perf_counter()
+                game = load_game(file_path, lazy=True)
+                elapsed = time.perf_counter() - start
+
+                print("load_game(lazy=True), {}: {:>7} entities in {:.3f}s ({:.2f} us/entity)".format(
+                    os.path.splitext(file_path)[1], size, elapsed, elapsed / size * 1e6))
+
+                game.data
+
+def make_action_game(target_count: int,
+                     name: str = "Action_Benchmark") -> TRPG:
+    """Builds a small game whose actions cover every effect type, modifier and value kind
+
+    Args:
+        target_count (int): Number of entities besides the user, all targeted by the multi-target action
+        name (str): Name of the game
+
+    Returns:
+        TRPG: The game. The user is named "User" and the others "Target_<i>"
+    """
+    game = TRPG(name)
+
+    game.new_attribute("HP", "num")
+    game.new_attribute("MP", "num")
+    game.new_attribute("Condition", "alpha")
+
+    game.new_action("Drain", effects=[EffectStruct("MP", "self", ConditionStruct("MP", "user", ">", -1e9), "+", -1),
+                                      EffectStruct("HP", "st", None, "+", AttrBasedValStruct("MP", "user", "*", -0.001, None))])
+    game.new_action("Storm", effects=[EffectStruct("HP", "mt", ConditionStruct("Condition", "user", "=", "OK"), "*", 0.999),
+                                      EffectStruct("Condition", "mt", None, "=", "OK")])
+    game.new_action("Quake", effects=[EffectStruct("HP", "mt", ConditionStruct("HP", "target", ">", 0), "+", -1),
+                                      EffectStruct("MP", "mt", None, "+", AttrBasedValStruct("HP", "target", "*", 0.01, None))])
+
+    attributes = lambda: [AttrValueStruct("HP", "num", 1000.0), AttrValueStruct("MP", "num", 500), AttrValueStruct("Condition", "alpha", "OK")]
+
+    game.new_entity("User", attributes(), ["Drain", "Storm", "Quake"])
+
+    for i in range(target_count):
+        game.new_entity("Target_{}".format(i), attributes(), [])
+
+    return game
+
+def check_condition(entity: TEntity,
+                    condition: ConditionStruct) -> bool:
+    """Reference counterpart of the conditions compiled by compile_condition, used by interpret_action
+    """
+    if condition.attribute not in entity._attributes:
+        raise ValueError("The attribute checked by this condition {} is not an attribute in the entity {}.\n".format(condition.attribute, entity._name))
+
+    if condition.comparison == "=":
+        if entity._attributes[condition.attribute].value == condition.value:
+            return True
+
+        else:
+            return False
+
+    elif condition.comparison == "!=":
+        if entity._attributes[condition.attribute].value != condition.value:
+            return True
+
+        else:
+            return False
+
+    elif condition.comparison == ">":
+        if entity._attributes[condition.attribute].value > condition.value:
+            return True
+
+        else:
+            return False
+
+    elif condition.comparison == ">=":
+        if entity._attributes[condition.attribute].value >= condition.value:
+            return True
+
+        else:
+            return False
+
+    elif condition.comparison == "<":
+        if entity._attributes[condition.attribute].value < condition.value:
+            return True
+
+        else:
+            return False
+
+    elif condition.comparison == "<=":
+        if entity._attributes[condition.attribute].value <= condition.value:
+            return True
+
+        else:
+            return False
+
+def get_value_based_on_attribute(entity: TEntity,
+                                 value: AttrBasedValStruct):
+    """Reference counterpart of the value getters compiled by compile_value, used by interpret_action
+    """
+    if value.attribute not in entity._attributes:
+        raise ValueError(
+            "An attribute named {} does not exist in {}'s attribute list.\n".format(value.attribute, entity._name))
+
+    flat = 0
+    if isinstance(value.flat, FlatChangeStruct):
+        if value.flat.modifier == "+":
+            flat = value.flat.value
+
+        elif value.flat.modifier == "-":
+            flat = -value.flat.value
+
+    true_value = flat
+    if value.modifier == "+":
+        true_value += entity._attributes[value.attribute].value + value.value
+
+    elif value.modifier == "*":
+        true_value += entity._attributes[value.attribute].value * value.value
+
+    return true_value
+
+def interpret_action(user: TEntity, action: TAction, obj: Sequence[Any] | None) -> bool:
+    """Uses an action by interpreting its effects on every call. This is the original implementation of
+    TEntity.use_action, kept here as the reference benchmark_actions measures the compiled plans against
+    """
+    if not isinstance(obj[0], TEntity):
+        raise ValueError("Object type is not TEntity.\n")
+
+    if action.get_name() not in user._actions:
+        raise ValueError("An action named {} is not in {}'s action list.\n".format(action.get_name(), user._name))
+
+    effects = action.get_effects()
+    revert = user._attributes
+
+    for effect in effects:
+        if effect.effect_type == "self":
+            if effect.attribute not in user._attributes:
+                user._attributes = revert
+                raise ValueError("A user-targeted effect of action {} manipulates an attribute {} that is not present in entity {}".format(action.get_name(), effect.attribute.get_name(), user._name))
+
+            if effect.condition is not None:
+                if not check_condition(user, effect.condition):
+                    user._attributes = revert
+                    break
+
+            attribute: str = effect.attribute
+            value: SupportedValTypes = effect.value
+            modifier: str = effect.modifier
+            condition: str = effect.condition
+
+            true_value = value
+
+            if condition is not None:
+                if not check_condition(user, effect.condition):
+                    return None
+
+            if isinstance(value, AttrBasedValStruct):
+
+                if value.attribute_owner == "user":
+                    true_value = get_value_based_on_attribute(user, value)
+
+                elif value.attribute_owner == "target":
+                    if isinstance(obj[0], TEntity):
+                        target = obj[0]
+                        true_value = get_value_based_on_attribute(target, value)
+
+                    else:
+                        raise ValueError("An effect of action {} uses attribute based values depending on target but no valid target was given.\n".format(action.get_name()))
+
+            user.mark_dirty()
+
+            if modifier == "+":
+                user._attributes[attribute].value += true_value
+
+            elif modifier == "*":
+                user._attributes[attribute].value *= true_value
+                
+
+            elif modifier == "=":
+                user._attributes[attribute].value = true_value
+                
+
+        elif effect.effect_type == "st":
+            if obj is None:
+                user._attributes = revert
+                raise ValueError("A single-targeted effect of action {} requires a target but none was given.\n")
+
+            target: TEntity
+            st_revert: dict[str: AttrValueStruct]
+
+            if isinstance(obj[0], TEntity):
+                target = obj[0]
+                st_revert = target.get_attributes()
+
+            else:
+                raise ValueError("An invalid target object was given. Expected list[TObject | TEntity] got {}".format(type(obj)))
+
+            if effect.attribute not in target._attributes:
+                user._attributes = revert
+                target._attributes = st_revert
+                raise ValueError(
+                    "A single-targeted effect of action {} manipulates an attribute {} that is not present in entity {}".format(
+                        action.get_name(), effect.attribute, target.get_name()))
+
+            if effect.condition is not None:
+                if not check_condition(user, effect.condition):
+                    user._attributes = revert
+                    target._attributes = st_revert
+                    break
+
+            attribute: str = effect.attribute
+            value: SupportedValTypes = effect.value
+            modifier: str = effect.modifier
+            condition: str = effect.condition
+
+            true_value = value
+
+            if condition is not None:
+                if not check_condition(user, effect.condition):
+                    return None
+
+            if isinstance(value, AttrBasedValStruct):
+
+                if value.attribute_owner == "user":
+                    true_value = get_value_based_on_attribute(user, value)
+
+                elif value.attribute_owner == "target":
+                    if isinstance(obj[0], TEntity):
+                        true_value = get_value_based_on_attribute(target, value)
+
+                    else:
+                        raise ValueError(
+                            "An effect of action {} uses attribute based values depending on target but no valid target was given.\n".format(
+                                action.get_name()))
+
+            target.mark_dirty()
+
+            if modifier == "+":
+                target._attributes[attribute].value += true_value
+                
+            elif modifier == "*":
+                target._attributes[attribute].value *= true_value
+                
+            elif modifier == "=":
+                target._attributes[attribute].value = true_value          
+
+        elif effect.effect_type == "mt":
+            if not isinstance(obj, list):
+                user._attributes = revert
+                raise ValueError("A multi-targeted effect of action {} requires a list of targets and none was given.\n".format(action.get_name()))
+
+            if not all(isinstance(ele, TEntity) for ele in obj):
+                user._attributes = revert
+                raise ValueError("Not all elements of the list of targets given are TEntity types.\n")
+
+            target: TEntity
+            for target in obj:
+                st_revert = target.get_attributes()
+
+                if effect.attribute not in target.get_attributes():
+                    user._attributes = revert
+                    target._attributes = st_revert
+                    raise ValueError(
+                        "A single-targeted effect of action {} manipulates an attribute {} that is not present in entity {}".format(
+                            action.get_name(), effect.attribute, target.get_name))
+
+                if effect.condition is not None:
+                    if not check_condition(user, effect.condition):
+                        user._attributes = revert
+                        target._attributes = st_revert
+                        break
+
+                attribute: str = effect.attribute
+                value: SupportedValTypes = effect.value
+                modifier: str = effect.modifier
+                condition: str = effect.condition
+
+                true_value = value
+
+                if condition is not None:
+                    if not check_condition(user, effect.condition):
+                        return None
+
+                if isinstance(value, AttrBasedValStruct):
+
+                    if value.attribute_owner == "user":
+                        true_value = get_value_based_on_attribute(user, value)
+
+                    elif value.attribute_owner == "target":
+                        if isinstance(obj[0], TEntity):
+                            true_value = get_value_based_on_attribute(target, value)
+
+                        else:
+                            raise ValueError(
+                                "An effect of action {} uses attribute based values depending on target but no valid target was given.\n".format(
+                                    action.get_name()))
+
+                target.mark_dirty()
+
+                if modifier == "+":
+                    target._attributes[attribute].value += true_value                        
+
+                elif modifier == "*":
+                    target._attributes[attribute].value *= true_value
+
+                elif modifier == "=":
+                    target._attributes[attribute].value = true_value
+
+def benchmark_actions(iterations: int = 20_000,
+                      target_count: int = 10):
+    """Compares the reference interpret_action against the compiled plans run by TEntity.use_action,
+    applying the same actions to two identical games
+
+    Args:
+        iterations (int): Number of times each action is used
+        target_count (int): Number of targets of the multi-target action
+    """
+    results = {}
+
+    for mode in ("interpreted", "compiled"):
+        game = make_action_game(target_count)
+        user = game.get_entity("User")
+        targets = [game.get_entity("Target_{}".format(i)) for i in range(target_count)]
+        use = partial(interpret_action, user) if mode == "interpreted" else user.use_action
+
+        start = time.perf_counter()
+
+        for action_name in ("Drain", "Storm"):
+            action = game.get_action(action_name)
+
+            for _ in range(iterations):
+                use(action, targets)
+
+        results[mode] = (time.perf_counter() - start, game.data["entities"])
+
+    interpreted, compiled = results["interpreted"][0], results["compiled"][0]
+    actions_used = iterations * 2
+
+    print("interpret_action: {:.3f}s ({:.2f} us/action)".format(interpreted, interpreted / actions_used * 1e6))
+    print("use_action:       {:.3f}s ({:.2f} us/action), {:.2f}x".format(compiled, compiled / actions_used * 1e6, interpreted / compiled))
+    print("Same final state: {}".format(results["interpreted"][1] == results["compiled"][1]))
+
+def benchmark_columns(target_count: int = 500,
+                      iterations: int = 200):
+    """Compares a numeric multi-target action applied target by target against the same action
+    applied through the NumPy column store. Requires NumPy
+
+    Args:
+        target_count (int): Number of targets of the action
+        iterations (int): Number of times the action is used
+    """
+    results = {}
+
+    for mode in ("entities", "columns"):
+        game = make_action_game(target_count)
+        targets = ["Target_{}".format(i) for i in range(target_count)]
+
+        if mode == "columns":
+            game.enable_columns()
+
+        start = time.perf_counter()
+
+        for _ in range(iterations):
+            game.use_action("User", "Quake", targets)
+
+        results[mode] = (time.perf_counter() - start, game.data["entities"])
+
+    plain, columns = results["entities"][0], results["columns"][0]
+
+    print("Quake on {} targets, per entity: {:.2f} ms/action".format(target_count, plain / iterations * 1e3))
+    print("Quake on {} targets, columns:    {:.2f} ms/action, {:.2f}x".format(target_count, columns / iterations * 1e3, plain / columns))
+    print("Same final state: {}".format(results["entities"][1] == results["columns"][1]))
+
+def make_duel_game() -> TRPG:
+    """Builds a game with a two entity duel event named "Duel", lasting until one side's HP drops to 0
+    """
+    game = TRPG("Duel_Benchmark")
+
+    game.new_attribute("HP", "num")
+
+    game.new_action("Hit", effects=[EffectStruct("HP", "st", None, "+", -3)])
+
+    game.new_entity("Knight", [AttrValueStruct("HP", "num", 30)], ["Hit"])
+    game.new_entity("Dragon", [AttrValueStruct("HP", "num", 30)], ["Hit"])
+
+    game.new_event("Duel",
+                   ["Knight", "Dragon"],
+                   [EventActionStruct("Knight", "Hit", ["Dragon"]), EventActionStruct("Dragon", "Hit", ["Knight"])],
+                   EventEndConditionAttributeStruct("Dragon", "HP", "<=", 0))
+
+    return game
+
+def benchmark_simulation(runs: int = 20_000):
+    """Times the same Monte Carlo simulation with one worker process and with one per core
+
+    Args:
+        runs (int): Number of runs of the duel
+    """
+    game = make_duel_game()
+    ranges = {"Knight": {"HP": (10, 50)}, "Dragon": {"HP": (10, 50)}}
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        result = simulation.simulate(game, "Duel", runs, ranges, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        print("simulate: {} runs on {} worker(s) in {:.3f}s ({:.0f} runs/s), mean {:.2f} turns".format(
+            result.runs, workers, elapsed, result.runs / elapsed, result.mean_turns()))
+
+def benchmark_conditions(event_count: int = 1_000,
+                         turns: int = 2_000):
+    """Times the end checks of many events watching the same world, while one entity is hit per turn.
+    Compares the cached conditions of the game's TConditionIndex against evaluating every condition on every check
+
+    Args:
+        event_count (int): Number of events, each ending on the HP of its own entity
+        turns (int): Number of turns
+    """
+    results = {}
+
+    for mode in ("evaluated", "indexed"):
+        game = make_action_game(event_count)
+
+        for i in range(event_count):
+            game.new_event("Event_{}".format(i),
+                           ["User", "Target_{}".format(i)],
+                           [EventActionStruct("User", "Drain", ["Target_{}".format(i)])],
+                           EventEndConditionAttributeStruct("Target_{}".format(i), "HP", "<=", 0))
+
+        events = list(game.event.values())
+
+        start = time.perf_counter()
+
+        for turn in range(turns):
+            game.use_action("User", "Drain", ["Target_{}".format(turn % event_count)])
+
+            for ele in events:
+                if mode == "evaluated" and ele._end_watch is not None:
+                    ele._end_watch.invalidate()
+
+                ele.check_end()
+
+        results[mode] = time.perf_counter() - start
+
+    checks = event_count * turns
+
+    print("check_end, evaluated: {:.3f}s ({:.3f} us/check)".format(results["evaluated"], results["evaluated"] / checks * 1e6))
+    print("check_end, indexed:   {:.3f}s ({:.3f} us/check), {:.2f}x".format(results["indexed"], results["indexed"] / checks * 1e6, results["evaluated"] / results["indexed"]))
+
+def benchmark_initiative(combatants: int = 500,
+                         turns: int = 20_000):
+    """Compares picking the next combatant by a linear scan of the ones yet to act against the heap of
+    a TInitiativeOrder, while the acting combatant slows down a random other one every turn
+
+    Args:
+        combatants (int): Number of entities in the turn order
+        turns (int): Number of turns
+    """
+    results = {}
+
+    for mode in ("scan", "heap"):
+        rng = random.Random(0)
+        entities = [TEntity("Entity_{}".format(i), [AttrValueStruct("Speed", "num", rng.randint(1, 100))], [])
+                    for i in range(combatants)]
+        order = TInitiativeOrder("Speed")
+        waiting: list[TEntity] = []
+        acted = []
+
+        for ele in entities:
+            order.add(ele)
+
+        start = time.perf_counter()
+
+        for _ in range(turns):
+            if mode == "heap":
+                acted.append(order.pop())
+
+            else:
+                if len(waiting) == 0:
+                    waiting = list(entities)
+
+                fastest = max(waiting, key=lambda ele: ele.get_attributes()["Speed"].value)
+                waiting.remove(fastest)
+                acted.append(fastest.get_name())
+
+            slowed = entities[rng.randrange(combatants)]
+            slowed.set_attribute_value("Speed", slowed.get_attributes()["Speed"].value - 1)
+
+        results[mode] = (time.perf_counter() - start, acted)
+
+    scan, heap = results["scan"][0], results["heap"][0]
+
+    print("Next of {} combatants, scan: {:.2f} us/turn".format(combatants, scan / turns * 1e6))
+    print("Next of {} combatants, heap: {:.2f} us/turn, {:.2f}x".format(combatants, heap / turns * 1e6, scan / heap))
+    print("Same order: {}".format(results["scan"][1] == results["heap"][1]))
+
+def benchmark_server(requests: int = 20_000,
+                     game_count: int = 4,
+                     connections: int = 4,
+                     pipeline: int = 32):
+    """Starts a game server on localhost and drives it with pipelined use_action and get_entity requests
+    spread over several games, from the load generator of the server module
+
+    Args:
+        requests (int): Number of requests
+        game_count (int): Number of hosted games
+        connections (int): Number of client connections
+        pipeline (int): Requests in flight per connection
+    """
+    async def run():
+        game_server = server.TGameServer()
+
+        for i in range(game_count):
+            game_server.add_game(make_action_game(10, "Server_{}".format(i)))
+
+        await game_server.start(port=0)
+        host, port = game_server.address()
+
+        batch = []
+
+        for i in range(requests):
+            game_name = "Server_{}".format(i % game_count)
+
+            if i % 4 == 3:
+                batch.append(("get_entity", game_name, {"name": "Target_{}".format(i % 10)}))
+
+            else:
+                batch.append(("use_action", game_name, {"user": "User", "action": "Drain", "targets": ["Target_{}".format(i % 10)]}))
+
+        try:
+            return await server.load_test(batch, connections, pipeline, host, port)
+
+        finally:
+            await game_server.close()
+
+    print("server: {}".format(asyncio.run(run())))
+
+def benchmark_threads(thread_counts: Sequence[int] = (1, 2, 4, 8),
+                      actions: int = 20_000,
+                      io_actions: int = 200,
+                      io_delay: float = 0.001):
+    """Drives use_action from several threads, each on its own pair of entities, with the game's lock held
+    exclusively around every action and with entity locks. The CPU bound run only scales on free-threaded builds.
+    The I/O bound run holds the entities across a short sleep, like a caller waiting on a network round trip
+    between reading an entity and acting on it, and scales with entity locks on any build
+
+    Args:
+        thread_counts (Sequence[int]): Numbers of threads
+        actions (int): Actions per CPU bound run, shared between the threads
+        io_actions (int): Actions per thread of the I/O bound run
+        io_delay (float): Seconds slept while holding the entities
+    """
+    gil = sys._is_gil_enabled() if hasattr(sys, "_is_gil_enabled") else True
+    print("threads: GIL {}".format("enabled" if gil else "disabled"))
+
+    def run(game: TRPG, threads: int, count: int, delay: float) -> float:
+        def worker(index: int):
+            user, target = "User_{}".format(index), "Target_{}".format(index)
+
+            for _ in range(count):
+                if delay > 0:
+                    with game.hold_entities([user, target]):
+                        time.sleep(delay)
+                        game.use_action(user, "Hit", [target])
+
+                else:
+                    game.use_action(user, "Hit", [target])
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+
+        for ele in workers:
+            ele.start()
+
+        for ele in workers:
+            ele.join()
+
+        return time.perf_counter() - start
+
+    for threads in thread_counts:
+        for mode in ("game lock", "entity locks"):
+            game = TRPG("Thread_Benchmark")
+            game.new_attribute("HP", "num")
+            game.new_action("Hit", effects=[EffectStruct("HP", "st", None, "+", -1)])
+
+            for i in range(threads):
+                game.new_entity("User_{}".format(i), [AttrValueStruct("HP", "num", 0)], ["Hit"])
+                game.new_entity("Target_{}".format(i), [AttrValueStruct("HP", "num", 0)], [])
+
+            if mode == "entity locks":
+                game.enable_entity_locks()
+
+            cpu = run(game, threads, actions // threads, 0)
+            io = run(game, threads, io_actions, io_delay)
+            hits = sum(-game.get_entity("Target_{}".format(i)).get_attributes()["HP"].value for i in range(threads))
+
+            print("{} thread(s), {:<12}: {:>8.0f} actions/s CPU bound, {:>7.0f} actions/s I/O bound, {} hits".format(
+                threads, mode, actions // threads * threads / cpu, io_actions * threads / io, hits))
+
+def benchmark_query(entity_count: int = 100_000,
+                    queries: int = 200):
+    """Compares TRPG.query scanning every entity against the same queries answered by attribute indexes,
+    with one action changing an HP between queries
+
+    Args:
+        entity_count (int): Number of entities
+        queries (int): Number of queries of each kind
+    """
+    results = {}
+
+    for mode in ("scan", "indexed"):
+        game = make_action_game(entity_count)
+
+        if mode == "indexed":
+            game.create_index("HP")
+            game.create_index("Condition")
+
+        start = time.perf_counter()
+        found = []
+
+        for i in range(queries):
+            game.use_action("User", "Drain", ["Target_{}".format(i)])
+
+            found.append(len(game.query("HP", "<", 999.5)))
+            found.append(len(game.query_range("HP", 999.0, 999.9)))
+            found.append(len(game.query("Condition", "=", "Bad")))
+
+        results[mode] = (time.perf_counter() - start, found)
+
+    scan, indexed = results["scan"][0], results["indexed"][0]
+
+    print("query on {} entities, scan:    {:.3f} ms/query".format(entity_count, scan / (queries * 3) * 1e3))
+    print("query on {} entities, indexed: {:.3f} ms/query, {:.0f}x".format(entity_count, indexed / (queries * 3) * 1e3, scan / indexed))
+    print("Same results: {}".format(results["scan"][1] == results["indexed"][1]))
+
+BENCHMARKS: dict[str: Callable[[], None]] = {"load": benchmark_load,
+                                             "actions": benchmark_actions,
+                                             "columns": benchmark_columns,
+                                             "simulation": benchmark_simulation,
+                                             "conditions": benchmark_conditions,
+                                             "initiative": benchmark_initiative,
+                                             "server": benchmark_server,
+                                             "threads": benchmark_threads,
+                                             "query": benchmark_query}
+
+if __name__ == "__main__":
+    # python benchmarks.py [name ...] runs the named benchmarks, or all of them
+    names = sys.argv[1:] or list(BENCHMARKS)
+
+    for name in names:
+        if name not in BENCHMARKS:
+            raise SystemExit("Unknown benchmark {}, pick from {}.".format(name, ", ".join(BENCHMARKS)))
+
+    for name in names:
+        BENCHMARKS[name]()
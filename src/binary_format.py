@@ -0,0 +1,380 @@
+"""Compact binary game files, an alternative to the JSON files written by save_game.
+
+Layout, all integers little-endian and every section aligned to 8 bytes:
+
+    header      magic, version, then the offsets of the five sections below
+    strings     interned string table: count, end offset of every string, UTF-8 blob
+    attributes  count, then (name string, value type code) per attribute
+    actions     the actions as one compact JSON document
+    entities    count, then (name string, record offset) per entity. A record holds the entity's
+                attribute indices in order and its action name strings
+    columns     one typed fixed-width column per attribute, with a presence byte per entity. A num column holds
+                int64 or float64 values, or, when it mixes ints and floats or holds ints too large for int64,
+                the string indices of each value's JSON text, so every value reads back exactly as it was saved
+
+Files are opened through mmap, so only the parts that are read are paged in. The columns are read in place,
+which assumes a little-endian host like the ones the game runs on.
+"""
+from array import array
+from functools import partial
+import io
+import json
+import mmap
+import struct
+import sys
+
+from base import *
+
+MAGIC = b"TRPGBIN\x00"
+VERSION = 1
+EXTENSION = ".trpgb"
+
+HEADER = struct.Struct("<8sI4x5Q")
+ATTRIBUTE = struct.Struct("<IB")
+ENTITY_INDEX = struct.Struct("<IQ")
+COUNT = struct.Struct("<I")
+COLUMN_HEADER = struct.Struct("<B7x")
+
+TYPE_CODES = {"num": 0, "alpha": 1, "bool": 2}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+# Column kinds and the array typecodes of their values
+INT_COLUMN = 0
+FLOAT_COLUMN = 1
+STRING_COLUMN = 2
+BOOL_COLUMN = 3
+JSON_COLUMN = 4
+COLUMN_TYPECODES = {INT_COLUMN: "q", FLOAT_COLUMN: "d", STRING_COLUMN: "I", BOOL_COLUMN: "B", JSON_COLUMN: "I"}
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    return values.tobytes()
+
+def _pad(buffer: io.BytesIO):
+    buffer.write(b"\x00" * (-buffer.tell() % 8))
+
+_INDICES_STRUCTS: dict[int: struct.Struct] = {}
+
+def _indices_struct(count: int) -> struct.Struct:
+    if count not in _INDICES_STRUCTS:
+        _INDICES_STRUCTS.update({count: struct.Struct("<{}I".format(count))})
+
+    return _INDICES_STRUCTS[count]
+
+def is_binary_game(file_path: str) -> bool:
+    """Checks whether a file is a binary game file by looking at its first bytes
+    """
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def write_binary_game(data: dict, file: io.BufferedIOBase):
+    """Writes game data, in the format of TRPG.data, as a binary game file
+
+    Args:
+        data (dict): The game data
+        file (io.BufferedIOBase): A file opened for binary writing
+    """
+    strings: dict[str: int] = {}
+
+    def intern(text: str) -> int:
+        if text not in strings:
+            strings.update({text: len(strings)})
+
+        return strings[text]
+
+    intern(data["name"])
+
+    attribute_index: dict[str: int] = {}
+    attribute_types: list[str] = []
+
+    for ele in data["attributes"]:
+        attribute_index.update({ele["name"]: len(attribute_types)})
+        attribute_types.append(ele["value type"])
+        intern(ele["name"])
+
+    entity_count = len(data["entities"])
+    records = io.BytesIO()
+    record_offsets: list[int] = []
+    values: list[list] = [[None] * entity_count for _ in attribute_types]
+
+    for row, ele in enumerate(data["entities"]):
+        record_offsets.append(records.tell())
+        intern(ele["name"])
+
+        indices = array("I")
+
+        for attribute in ele["attributes"]:
+            index = attribute_index[attribute["name"]]
+
+            if attribute["value type"] != attribute_types[index]:
+                raise ValueError("Entity {} stores attribute {} as {} but the game defines it as {}.\n".format(
+                    ele["name"], attribute["name"], attribute["value type"], attribute_types[index]))
+
+            indices.append(index)
+            values[index][row] = attribute["value"]
+
+        action_strings = array("I", [intern(action) for action in ele["actions"]])
+
+        records.write(COUNT.pack(len(indices)))
+        records.write(_little_endian(indices))
+        records.write(COUNT.pack(len(action_strings)))
+        records.write(_little_endian(action_strings))
+
+    columns = io.BytesIO()
+
+    for index, value_type in enumerate(attribute_types):
+        column = values[index]
+        present = array("B", [0 if value is None else 1 for value in column])
+
+        if value_type == "num":
+            stored = [value for value in column if value is not None]
+
+            if all(type(value) is int and -2 ** 63 <= value < 2 ** 63 for value in stored):
+                kind = INT_COLUMN
+
+            elif all(type(value) is float for value in stored):
+                kind = FLOAT_COLUMN
+
+            else:
+                kind = JSON_COLUMN
+
+            if kind == JSON_COLUMN:
+                typed = array("I", [0 if value is None else intern(json.dumps(value)) for value in column])
+
+            else:
+                typed = array(COLUMN_TYPECODES[kind], [0 if value is None else value for value in column])
+
+        elif value_type == "alpha":
+            kind = STRING_COLUMN
+            typed = array("I", [0 if value is None else intern(value) for value in column])
+
+        else:
+            kind = BOOL_COLUMN
+            typed = array("B", [0 if value is None else int(value) for value in column])
+
+        columns.write(COLUMN_HEADER.pack(kind))
+        columns.write(present.tobytes())
+        _pad(columns)
+        columns.write(_little_endian(typed))
+        _pad(columns)
+
+    body = io.BytesIO()
+    body.write(b"\x00" * HEADER.size)
+
+    strings_offset = body.tell()
+    encoded = [text.encode("utf-8") for text in strings]
+    ends = array("Q")
+    end = 0
+
+    for ele in encoded:
+        end += len(ele)
+        ends.append(end)
+
+    body.write(COUNT.pack(len(encoded)))
+    _pad(body)
+    body.write(_little_endian(ends))
+    body.write(b"".join(encoded))
+    _pad(body)
+
+    attributes_offset = body.tell()
+    body.write(COUNT.pack(len(attribute_types)))
+
+    for ele in data["attributes"]:
+        body.write(ATTRIBUTE.pack(strings[ele["name"]], TYPE_CODES[ele["value type"]]))
+
+    _pad(body)
+
+    actions_offset = body.tell()
+    actions = json.dumps(data["actions"], separators=(",", ":")).encode("utf-8")
+    body.write(COUNT.pack(len(actions)))
+    body.write(actions)
+    _pad(body)
+
+    entities_offset = body.tell()
+    records_offset = entities_offset + COUNT.size + ENTITY_INDEX.size * entity_count
+    records_offset += -records_offset % 8
+
+    body.write(COUNT.pack(entity_count))
+
+    for ele, offset in zip(data["entities"], record_offsets):
+        body.write(ENTITY_INDEX.pack(strings[ele["name"]], records_offset + offset))
+
+    _pad(body)
+    body.write(records.getvalue())
+    _pad(body)
+
+    columns_offset = body.tell()
+    body.write(columns.getvalue())
+
+    body.seek(0)
+    body.write(HEADER.pack(MAGIC, VERSION, strings_offset, attributes_offset, actions_offset, entities_offset, columns_offset))
+
+    file.write(body.getvalue())
+
+class BinaryGameReader:
+    def __init__(self, file_path: str):
+        """Opens a binary game file through mmap. Nothing but the header and the attribute table
+        is decoded until it is asked for.
+
+        Args:
+            file_path (str): Path of the file
+        """
+        self._file = open(file_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, version, strings, attributes, actions, entities, columns = HEADER.unpack_from(self._map, 0)
+
+        if magic != MAGIC:
+            raise ValueError("File {} is not a binary game file.\n".format(file_path))
+
+        if version != VERSION:
+            raise ValueError("Binary game file version {} is not supported.\n".format(version))
+
+        self._actions_offset = actions
+        self._entities_offset = entities
+
+        string_count = COUNT.unpack_from(self._map, strings)[0]
+        ends_offset = strings + 8
+        self._string_ends = self._view[ends_offset:ends_offset + 8 * string_count].cast("Q")
+        self._strings_offset = ends_offset + 8 * string_count
+        self._string_cache: dict[int: str] = {}
+
+        self.name = self.string(0)
+        self.attributes: list[tuple[str, str]] = []
+
+        for i in range(COUNT.unpack_from(self._map, attributes)[0]):
+            name, code = ATTRIBUTE.unpack_from(self._map, attributes + COUNT.size + ATTRIBUTE.size * i)
+            self.attributes.append((self.string(name), TYPE_NAMES[code]))
+
+        self.entity_count: int = COUNT.unpack_from(self._map, entities)[0]
+        self._columns: list[tuple[int, memoryview, memoryview]] = []
+        offset = columns
+
+        for _ in self.attributes:
+            kind = COLUMN_HEADER.unpack_from(self._map, offset)[0]
+            offset += COLUMN_HEADER.size
+
+            present = self._view[offset:offset + self.entity_count]
+            offset += self.entity_count + (-self.entity_count % 8)
+
+            width = array(COLUMN_TYPECODES[kind]).itemsize
+            typed = self._view[offset:offset + width * self.entity_count].cast(COLUMN_TYPECODES[kind])
+            offset += width * self.entity_count + (-(width * self.entity_count) % 8)
+
+            self._columns.append((kind, present, typed))
+
+    def close(self):
+        for ele in self._columns:
+            ele[1].release()
+            ele[2].release()
+
+        self._string_ends.release()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "BinaryGameReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def string(self, index: int) -> str:
+        if index not in self._string_cache:
+            start = self._string_ends[index - 1] if index > 0 else 0
+            end = self._string_ends[index]
+            self._string_cache.update({index: str(self._map[self._strings_offset + start:self._strings_offset + end], "utf-8")})
+
+        return self._string_cache[index]
+
+    def actions(self) -> list[dict]:
+        length = COUNT.unpack_from(self._map, self._actions_offset)[0]
+        start = self._actions_offset + COUNT.size
+
+        return json.loads(self._map[start:start + length])
+
+    def entity_name(self, row: int) -> str:
+        name, _ = ENTITY_INDEX.unpack_from(self._map, self._entities_offset + COUNT.size + ENTITY_INDEX.size * row)
+
+        return self.string(name)
+
+    def entity_record(self, row: int) -> dict:
+        """Decodes one entity, in the format of the entity records of TRPG.data
+
+        Args:
+            row (int): Position of the entity in the file
+        """
+        name, offset = ENTITY_INDEX.unpack_from(self._map, self._entities_offset + COUNT.size + ENTITY_INDEX.size * row)
+
+        attribute_count = COUNT.unpack_from(self._map, offset)[0]
+        offset += COUNT.size
+        indices = _indices_struct(attribute_count).unpack_from(self._map, offset)
+        offset += 4 * attribute_count
+
+        action_count = COUNT.unpack_from(self._map, offset)[0]
+        offset += COUNT.size
+        actions = _indices_struct(action_count).unpack_from(self._map, offset)
+
+        string = self.string
+        record = {"name": string(name),
+                  "attributes": [],
+                  "actions": [string(ele) for ele in actions]}
+
+        for index in indices:
+            attribute_name, value_type = self.attributes[index]
+            kind, _, typed = self._columns[index]
+            value = typed[row]
+
+            if kind == STRING_COLUMN:
+                value = string(value)
+
+            elif kind == BOOL_COLUMN:
+                value = bool(value)
+
+            elif kind == JSON_COLUMN:
+                value = json.loads(string(value))
+
+            record["attributes"].append({"name": attribute_name, "value type": value_type, "value": value})
+
+        return record
+
+    def column(self, attribute_name: str) -> tuple[bytes, array]:
+        """Returns the presence bytes and the typed values of an attribute's column, one per entity,
+        without decoding any entity. They are copied out of the file, so they stay valid after close.
+        The values of a generic num column are string indices of their JSON text, see string
+
+        Args:
+            attribute_name (str): Name of the attribute
+        """
+        for index, (name, _) in enumerate(self.attributes):
+            if name == attribute_name:
+                _, present, typed = self._columns[index]
+
+                return present.tobytes(), array(typed.format, typed)
+
+        raise ValueError("An attribute named {} does not exist in this game.\n".format(attribute_name))
+
+    def iter_records(self, lazy: bool = False) -> Iterator[tuple[str, Any]]:
+        """Yields the name and records of the game as the (section, record) pairs taken by TRPG.load_records
+
+        Args:
+            lazy (bool): Yield the entities as TRecordRefs, decoded from the file only when they are loaded
+        """
+        yield "name", self.name
+
+        for name, value_type in self.attributes:
+            yield "attributes", {"name": name, "value type": value_type}
+
+        for ele in self.actions():
+            yield "actions", ele
+
+        for row in range(self.entity_count):
+            if lazy:
+                yield "entities", TRecordRef(self.entity_name(row), partial(self.entity_record, row))
+
+            else:
+                yield "entities", self.entity_record(row)
@@ -0,0 +1,354 @@
+"""Optional columnar storage for the numeric attributes of a game's entities.
+
+Every "num" attribute is kept as a NumPy array indexed by entity slot, which lets multi-target effects
+apply to all of their targets at once. Requires NumPy, which the rest of the backend does not.
+"""
+from __future__ import annotations
+
+from base import *
+
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
+
+VECTOR_OPERATIONS = {"+": "add",
+                     "*": "multiply"}
+
+VECTOR_COMPARISONS = {"=": "equal",
+                      "!=": "not_equal",
+                      ">": "greater",
+                      ">=": "greater_equal",
+                      "<": "less",
+                      "<=": "less_equal"}
+
+def attribute_based_values(value: AttrBasedValStruct,
+                           values: np.ndarray) -> np.ndarray:
+    """Vector counterpart of the value getters made by base.compile_value
+
+    Args:
+        value (AttrBasedValStruct): The attribute based value
+        values (np.ndarray): The values of value.attribute for every target
+
+    Returns:
+        np.ndarray: The resulting value for every target
+    """
+    flat = 0
+    if isinstance(value.flat, FlatChangeStruct):
+        if value.flat.modifier == "+":
+            flat = value.flat.value
+
+        elif value.flat.modifier == "-":
+            flat = -value.flat.value
+
+    if value.modifier in VECTOR_OPERATIONS:
+        return flat + getattr(np, VECTOR_OPERATIONS[value.modifier])(values, value.value)
+
+    return np.full(len(values), flat)
+
+class ColumnAttrValue(AttrValueStruct):
+    """An AttrValueStruct whose value lives in a column of a TColumnStore
+    """
+    def __init__(self,
+                 store: "TColumnStore",
+                 attribute: str,
+                 slot: int):
+        self.attribute = attribute
+        self.type = "num"
+        self._store = store
+        self._slot = slot
+
+    @property
+    def value(self) -> NumType:
+        return self._store.columns[self.attribute][self._slot].item()
+
+    @value.setter
+    def value(self, new_value: NumType):
+        self._store.write(self.attribute, self._slot, new_value)
+
+class TColumnStore:
+    def __init__(self,
+                 attributes: Sequence[str],
+                 capacity: int = 64):
+        """Initialize an empty column store
+
+        Args:
+            attributes (Sequence[str]): Names of the "num" attributes to store as columns
+            capacity (int): Number of entity slots allocated up front. The columns grow as needed
+        """
+        if np is None:
+            raise ImportError("The column store requires NumPy, install it with 'pip install numpy'.\n")
+
+        self.capacity = max(capacity, 1)
+        self.columns: dict[str: np.ndarray] = {}
+        self.present: dict[str: np.ndarray] = {}
+        self.slots: dict[TEntity: int] = {}
+        self.entities: list[TEntity | None] = []
+        self._free_slots: list[int] = []
+        self._last_targets: Sequence[TEntity] | None = None
+        self._last_indices: np.ndarray | None = None
+
+        for ele in attributes:
+            self.add_column(ele)
+
+    def add_column(self, attribute: str):
+        """Adds an empty column for a new "num" attribute
+        """
+        if attribute in self.columns:
+            return
+
+        self.columns.update({attribute: np.zeros(self.capacity, dtype=np.int64)})
+        self.present.update({attribute: np.zeros(self.capacity, dtype=bool)})
+
+    def remove_column(self, attribute: str):
+        """Drops the column of an attribute removed from the game. The entities keep their values as plain AttrValueStructs
+        """
+        if attribute not in self.columns:
+            return
+
+        for ele in self.slots:
+            attributes = ele.get_attributes()
+
+            if isinstance(attributes.get(attribute), ColumnAttrValue):
+                attributes[attribute] = AttrValueStruct(attribute, "num", attributes[attribute].value)
+
+        self.columns.pop(attribute)
+        self.present.pop(attribute)
+
+    def _grow(self):
+        self.capacity *= 2
+
+        for ele in self.columns:
+            self.columns[ele] = np.resize(self.columns[ele], self.capacity)
+            self.present[ele] = np.resize(self.present[ele], self.capacity)
+            self.present[ele][len(self.entities):] = False
+
+    def _fit(self, attribute: str, values: Any):
+        """Promotes an integer column to floats if values can't be stored in it without losing precision
+        """
+        column = self.columns[attribute]
+        dtype = np.result_type(column, values)
+
+        if dtype != column.dtype:
+            self.columns[attribute] = column.astype(dtype)
+
+    def write(self,
+              attribute: str,
+              slot: int,
+              value: NumType):
+        self._fit(attribute, value)
+        self.columns[attribute][slot] = value
+
+    def restore_value(self,
+                      key: tuple[str, np.ndarray, np.dtype],
+                      old_values: np.ndarray):
+        """Puts back column values recorded in a TUndoJournal by apply_effect.
+        The column gets its old dtype back too, since everything written after the promotion is rolled back first
+        """
+        attribute, slots, dtype = key
+
+        self.columns[attribute][slots] = old_values
+
+        if self.columns[attribute].dtype != dtype:
+            self.columns[attribute] = self.columns[attribute].astype(dtype)
+
+        for slot in slots:
+            self.entities[slot].value_written(attribute)
+
+    def changed_values(self,
+                       key: tuple[str, np.ndarray, np.dtype],
+                       old_values: np.ndarray) -> list[tuple[TEntity, str, NumType]]:
+        """Returns the (entity, attribute, old value) triples of column values recorded in a TUndoJournal
+        """
+        attribute, slots, _ = key
+
+        return [(self.entities[slot], attribute, old.item()) for slot, old in zip(slots, old_values)]
+
+    def add_entity(self, entity: TEntity):
+        """Moves the numeric attribute values of an entity into the columns.
+        Adding an entity again re-binds it, e.g. after its attributes were replaced.
+        """
+        if entity in self.slots:
+            slot = self.slots[entity]
+
+        elif len(self._free_slots) > 0:
+            slot = self._free_slots.pop()
+            self.entities[slot] = entity
+
+        else:
+            if len(self.entities) == self.capacity:
+                self._grow()
+
+            slot = len(self.entities)
+            self.entities.append(entity)
+
+        self.slots.update({entity: slot})
+        self._last_targets = None
+
+        for ele in self.present:
+            self.present[ele][slot] = False
+
+        attributes = entity.get_attributes()
+
+        for name, ele in attributes.items():
+            if name in self.columns and ele.type == "num":
+                value = ele.value
+                attributes[name] = ColumnAttrValue(self, name, slot)
+                attributes[name].value = value
+                self.present[name][slot] = True
+
+    def remove_entity(self, entity: TEntity):
+        """Moves the numeric attribute values of an entity back into plain AttrValueStructs and frees its slot
+        """
+        if entity not in self.slots:
+            return
+
+        slot = self.slots.pop(entity)
+        self._last_targets = None
+        attributes = entity.get_attributes()
+
+        for name, ele in attributes.items():
+            if isinstance(ele, ColumnAttrValue):
+                attributes[name] = AttrValueStruct(name, "num", ele.value)
+
+        for ele in self.present:
+            self.present[ele][slot] = False
+
+        self.entities[slot] = None
+        self._free_slots.append(slot)
+
+    def clear(self):
+        for ele in list(self.slots):
+            self.remove_entity(ele)
+
+    def _indices(self, targets: Sequence[TEntity]) -> np.ndarray | None:
+        """Returns the slots of the targets, or None if some target is not stored or appears twice.
+        The result is reused for every effect of an action, which all receive the same target list
+        """
+        if targets is self._last_targets:
+            return self._last_indices
+
+        slots = self.slots
+        indices = None
+
+        if all(ele in slots for ele in targets):
+            indices = np.fromiter([slots[ele] for ele in targets], dtype=np.int64, count=len(targets))
+
+            if len(np.unique(indices)) != len(indices):
+                indices = None
+
+        self._last_targets = targets
+        self._last_indices = indices
+
+        return indices
+
+    def _target_values(self,
+                       attribute: str,
+                       indices: np.ndarray,
+                       targets: Sequence[TEntity],
+                       mask: np.ndarray | None = None) -> np.ndarray | None:
+        """Returns the values of an attribute for the targets, or None if it is not a column.
+        Like the per-target path, only the targets selected by mask need the attribute.
+        The values of the other targets are meaningless
+        """
+        if attribute not in self.columns:
+            return None
+
+        present = self.present[attribute][indices]
+
+        if mask is not None:
+            present = present | ~mask
+
+        if not present.all():
+            missing = targets[int(np.flatnonzero(~present)[0])]
+            raise ValueError("An attribute named {} does not exist in {}'s attribute list.\n".format(attribute, missing.get_name()))
+
+        return self.columns[attribute][indices]
+
+    def apply_effect(self,
+                     effect: TCompiledEffect,
+                     action_name: str,
+                     user: TEntity,
+                     targets: Sequence[TEntity],
+                     journal: TUndoJournal | None = None) -> bool:
+        """Applies a multi-target effect to all targets at once with masked vector operations.
+
+        Args:
+            effect (TCompiledEffect): The effect to apply
+            action_name (str): Name of the action, used in error messages
+            user (TEntity): The entity using the action
+            targets (Sequence[TEntity]): The targets of the action
+            journal (TUndoJournal | None): Journal recording the overwritten values, as one entry for the whole column
+
+        Returns:
+            bool: False if the effect can't be vectorized and should be run by TCompiledEffect.run instead
+        """
+        source = effect.source
+
+        if source.effect_type != "mt" or source.attribute not in self.columns or len(targets) == 0:
+            return False
+
+        indices = self._indices(targets)
+
+        if indices is None:
+            return False
+
+        mask = np.ones(len(targets), dtype=bool)
+        condition = source.condition
+
+        if condition is not None:
+            if condition.attribute_owner == "target":
+                if condition.attribute not in self.columns or isinstance(condition.value, (bool, str)):
+                    return False
+
+                compare = getattr(np, VECTOR_COMPARISONS[condition.comparison])
+                mask = compare(self._target_values(condition.attribute, indices, targets), condition.value)
+
+            elif not effect.condition(user, targets[0]):
+                return True
+
+        value = source.value
+
+        if isinstance(value, AttrBasedValStruct):
+            if value.attribute_owner == "target":
+                values = self._target_values(value.attribute, indices, targets, mask)
+
+                if values is None:
+                    return False
+
+                value = attribute_based_values(value, values)
+
+            else:
+                value = effect.value(user, targets[0])
+
+        elif isinstance(value, (bool, str)):
+            return False
+
+        current = self._target_values(source.attribute, indices, targets, mask)
+        selected = indices[mask]
+
+        if not isinstance(value, (int, float)):
+            value = value[mask]
+
+        if source.modifier == "=":
+            new_values = np.broadcast_to(np.asarray(value), selected.shape)
+
+        else:
+            new_values = getattr(np, VECTOR_OPERATIONS[source.modifier])(current[mask], value)
+
+        if journal is not None:
+            journal.record(self, (source.attribute, selected, self.columns[source.attribute].dtype), current[mask])
+
+        self._fit(source.attribute, new_values)
+        self.columns[source.attribute][selected] = new_values
+
+        if mask.all():
+            for ele in targets:
+                ele.value_written(source.attribute)
+
+        else:
+            for i in np.flatnonzero(mask):
+                targets[i].value_written(source.attribute)
+
+        return True
@@ -1,7 +1,22 @@
 from base import *
+import binary_format
 import json
 import os
 import io
+import re
+import tempfile
+import threading
+import time
+
+STREAM_CHUNK_SIZE = 1 << 16
+AUTOSAVE_INTERVAL = 5.0
+TEMPORARY_SUFFIX = ".tmp"
+JOURNAL_EXTENSION = ".journal"
+SHARDED_EXTENSION = ".shards"
+MANIFEST_NAME = "manifest.json"
+# Characters the scan of a JSON container stops at, outside and inside its strings
+JSON_STRUCTURE = re.compile(r'[{}\[\]"]')
+JSON_STRING_END = re.compile(r'["\\]')
 
 PARENT = os.getcwd()
 
@@ -11,6 +26,8 @@ GLOBAL_DATA_DIRECTORY = os.path.join(DATA_DIRECTORY, "global.json")
 
 global_data_dict = {"games" : []}
 
+_global_data_lock = threading.Lock()
+
 data_dict = {"name" : None,
             "attributes": None,
             "actions": None,
@@ -28,68 +45,525 @@ def initialize():
         json.dump(global_data_dict, global_data, indent = 4)
         global_data.close()
 
-def update_global_data():
+def update_global_data() -> list[dict]:
+    """Brings the game catalog in global.json up to date with the game directory. Each entry holds the name, path,
+    size, modification time and section counts of a game file. Only files that are new, or whose size or
+    modification time changed since the last update, are read again, and global.json is only rewritten when something changed.
 
-    global_data_file = io.open(GLOBAL_DATA_DIRECTORY, "r")
+    Returns:
+        list[dict]: The catalog entries
+    """
+    with _global_data_lock:
+        try:
+            catalog: dict[str: dict] = {ele["path"]: ele for ele in load_global_data()["games"]}
 
-    global_data = json.load(global_data_file)
+        except (OSError, ValueError, KeyError, TypeError):
+            catalog = {}
 
-    global_data_file.close
+        games: list[dict] = []
+        changed = False
 
-    game_files = os.listdir(GAME_DIRECTORY)
+        for ele in sorted(os.listdir(GAME_DIRECTORY)):
+            file_path = os.path.join(GAME_DIRECTORY, ele)
 
-    temporary_game_data_holder = {"games": []}
+            if ele.endswith(SHARDED_EXTENSION):
+                if not os.path.isfile(os.path.join(file_path, MANIFEST_NAME)):
+                    continue
 
-    for ele in game_files:
-        with io.open(os.path.join(GAME_DIRECTORY, ele)) as game_file:
-            game_data = json.load(game_file)
-            file_data = {"name": game_data["name"], "path": os.path.join(GAME_DIRECTORY, ele)}
-            
-            temporary_game_data_holder["games"].append(file_data)
+            elif not os.path.isfile(file_path) or ele.endswith((TEMPORARY_SUFFIX, JOURNAL_EXTENSION)):
+                continue
 
-    global_data_file = io.open(GLOBAL_DATA_DIRECTORY, "w")
-    
-    json.dump(temporary_game_data_holder, global_data_file, indent=4)
+            stat = _catalog_stat(file_path)
+            entry = catalog.pop(file_path, None)
+
+            if entry is None or entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns:
+                try:
+                    entry = _catalog_entry(file_path, stat, read_game_summary(file_path))
+
+                except (OSError, ValueError, KeyError, TypeError):
+                    # Not a readable game file, it is left out of the catalog
+                    continue
+
+                changed = True
+
+            games.append(entry)
+
+        # Whatever is left was deleted from the directory
+        if changed or len(catalog) > 0:
+            _write_global_data({"games": games})
+
+        return games
+
+def _catalog_stat(file_path: str) -> os.stat_result:
+    # Sharded games are cataloged by their manifest, which is rewritten whenever the counts change
+    if os.path.isdir(file_path):
+        return os.stat(os.path.join(file_path, MANIFEST_NAME))
+
+    return os.stat(file_path)
+
+def _catalog_entry(file_path: str, stat: os.stat_result, summary: dict) -> dict:
+    return {"name": summary["name"],
+            "path": file_path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "attributes": summary["attributes"],
+            "actions": summary["actions"],
+            "entities": summary["entities"]}
+
+def _write_global_data(global_data: dict):
+    write_file_atomic(GLOBAL_DATA_DIRECTORY, json.dumps(global_data, indent=4).encode("utf-8"))
+
+def read_game_summary(file_path: str) -> dict:
+    """Reads the name and the number of attributes, actions and entities of a game file, JSON or binary,
+    or of a sharded game directory, without building the game. JSON files are streamed, so only one record
+    is held in memory at a time
+
+    Returns:
+        dict: {"name": ..., "attributes": ..., "actions": ..., "entities": ...}
+    """
+    if os.path.isdir(file_path):
+        with io.open(os.path.join(file_path, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        return {"name": manifest["name"],
+                "attributes": len(manifest["attributes"]),
+                "actions": len(manifest["actions"]),
+                "entities": manifest["entity count"]}
+
+    if binary_format.is_binary_game(file_path):
+        with binary_format.BinaryGameReader(file_path) as reader:
+            return {"name": reader.name,
+                    "attributes": len(reader.attributes),
+                    "actions": len(reader.actions()),
+                    "entities": reader.entity_count}
+
+    summary = {"name": None, "attributes": 0, "actions": 0, "entities": 0}
+
+    with io.open(file_path) as game_file:
+        for section, record in iter_game_file(game_file):
+            if section == "name":
+                summary["name"] = record
+
+            elif section in SECTIONS:
+                summary[section] += 1
+
+    if summary["name"] is None:
+        raise ValueError("File {} has no game name.\n".format(file_path))
 
-    global_data_file.close()
+    return summary
 
 def load_global_data() -> dict:
     with io.open(GLOBAL_DATA_DIRECTORY, "r") as g:
         return json.load(g)
 
-def save_game(game: TRPG):
+def game_file_path(game: TRPG, binary: bool = False) -> str:
+    extension = binary_format.EXTENSION if binary else ".json"
 
-    file_name = game.get_name() + ".json"
-    game_file_path = os.path.join(GAME_DIRECTORY, file_name)
+    return os.path.join(GAME_DIRECTORY, game.get_name() + extension)
 
-    
-    if not os.path.exists(game_file_path):
-        file = io.open(game_file_path, mode="tx")
-        
-    else:
-        file = io.open(game_file_path, mode="tw")
+def serialize_game(game: TRPG, binary: bool = False) -> tuple[bytes, dict]:
+    """Serializes a consistent snapshot of a game, holding its lock while doing so
+
+    Returns:
+        tuple[bytes, dict]: The content of the game file and the catalog summary of the game
+    """
+    with game.lock:
+        data = game.data
+        summary = {"name": data["name"], **{ele: len(data[ele]) for ele in SECTIONS}}
+
+        if binary:
+            buffer = io.BytesIO()
+            binary_format.write_binary_game(data, buffer)
+
+            return buffer.getvalue(), summary
+
+        return json.dumps(data, indent=4).encode("utf-8"), summary
+
+def write_file_atomic(file_path: str, content: bytes):
+    """Writes a file through a temporary file in the same directory that is then renamed over it,
+    so the file holds either its old or its new content even if the process dies while writing
+    """
+    directory, name = os.path.split(file_path)
+    descriptor, temporary_path = tempfile.mkstemp(prefix="." + name, suffix=TEMPORARY_SUFFIX, dir=directory)
+
+    try:
+        with io.open(descriptor, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, file_path)
+
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+def save_game(game: TRPG, binary: bool = False, sharded: bool = False):
+    """Saves a game in the game directory. The file is replaced atomically
+
+    Args:
+        game (TRPG): The game to save
+        binary (bool): Write the compact binary format of binary_format instead of JSON
+        sharded (bool): Save the game as a directory of entity shards, see shards.ShardedGameStore.
+            Only the shards holding changed entities are rewritten
+    """
+    if sharded:
+        import shards
+
+        shards.store_for(game).save()
+        return
+
+    file_path = game_file_path(game, binary)
+
+    # A snapshot written without the journal's id would make journal.recover_game drop every operation
+    # journaled after it, so the journal writes it and starts over
+    if game.journal is not None and os.path.abspath(game.journal.path) == os.path.abspath(file_path):
+        game.journal.compact()
+        return
+
+    content, summary = serialize_game(game, binary)
+
+    write_file_atomic(file_path, content)
+
+    # The counts are taken from the saved data, so the new file does not have to be read back
+    update_catalog_entry(file_path, summary)
+
+def update_catalog_entry(file_path: str, summary: dict):
+    """Adds or replaces the catalog entry of a game file that was just written
+    """
+    with _global_data_lock:
+        entry = _catalog_entry(file_path, _catalog_stat(file_path), summary)
+
+        try:
+            games = [ele for ele in load_global_data()["games"] if ele["path"] != file_path]
+
+        except (OSError, ValueError, KeyError, TypeError):
+            games = []
+
+        games.append(entry)
+
+        _write_global_data({"games": games})
+
+class AutoSaver:
+    def __init__(self, game: TRPG, interval: float = AUTOSAVE_INTERVAL, binary: bool = False):
+        """Saves a game from a background thread whenever it changed, at most once every interval seconds.
+        Changes made while a save is pending are folded into it, so bursts of actions cost one write.
+
+        Args:
+            game (TRPG): The game to save
+            interval (float): Minimum time in seconds between two saves
+            binary (bool): Save in the binary format instead of JSON
+        """
+        self.game = game
+        self.interval = interval
+        self.binary = binary
+        self.saves: int = 0
+        self.error: Exception | None = None
+
+        self._pending = False
+        self._last_save = float("-inf")
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="AutoSaver-" + game.get_name(), daemon=True)
+
+    def start(self):
+        self.game.add_change_listener(self.notify)
+        self._thread.start()
+
+    def stop(self, flush: bool = True):
+        """Stops the thread
+
+        Args:
+            flush (bool): Save pending changes before stopping
+        """
+        self.game.remove_change_listener(self.notify)
+
+        if not flush:
+            self._pending = False
+
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+
+    def __enter__(self) -> "AutoSaver":
+        self.start()
+
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def notify(self, game: TRPG, obj: TDataObject | None = None):
+        """Change listener of the game, only records that a save is needed
+        """
+        if not self._pending:
+            self._pending = True
+            self._wake.set()
+
+    def save_now(self):
+        """Saves the game on the calling thread
+        """
+        self._pending = False
+        save_game(self.game, self.binary)
+        self._last_save = time.monotonic()
+        self.saves += 1
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+
+            if self._pending:
+                # Waits out the interval, changes made meanwhile join this save
+                delay = self._last_save + self.interval - time.monotonic()
+
+                if delay > 0:
+                    self._stopping.wait(delay)
+
+                try:
+                    self.save_now()
+
+                except Exception as error:
+                    self.error = error
+
+            if self._stopping.is_set() and not self._pending:
+                return
+
+class JSONStream:
+    """Reads JSON values one at a time from a text file, keeping only a small buffer in memory.
+    Used to walk the arrays of a game file record by record.
+    """
+    def __init__(self, file: io.TextIOBase, chunk_size: int = STREAM_CHUNK_SIZE):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        # Where the scan of the container being read stopped, and its state there, see _scan_value
+        self._scan = 0
+        self._depth = 0
+        self._in_string = False
+
+    def _fill(self) -> bool:
+        """Reads the next chunk of the file into the buffer, dropping what was already consumed
+
+        Returns:
+            bool: False if the end of the file was reached
+        """
+        if self._eof:
+            return False
+
+        chunk = self._file.read(self._chunk_size)
+
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._scan -= self._pos
+        self._pos = 0
+
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character without consuming it, or "" at the end of the file
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\n\r":
+                self._pos += 1
+
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError("Malformed game file: expected '{}' but found '{}'.\n".format(char, self.peek()))
+
+        self._pos += 1
+
+    def _scan_value(self) -> bool:
+        """Scans the object, array or string starting at self._pos for its end, resuming where the last scan
+        stopped, so each character of a value spanning many chunks is only scanned once
+
+        Returns:
+            bool: True once the buffer holds the whole value
+        """
+        buffer = self._buffer
+        i = self._scan
+
+        while True:
+            if self._in_string:
+                match = JSON_STRING_END.search(buffer, i)
+
+                if match is None:
+                    self._scan = len(buffer)
+                    return False
+
+                i = match.start()
+
+                if buffer[i] == "\\":
+                    # The escaped character may be in the next chunk
+                    if i + 1 >= len(buffer):
+                        self._scan = i
+                        return False
 
-    json.dump(game.data, file, indent=4)
+                    i += 2
+                    continue
 
-    with io.open(GLOBAL_DATA_DIRECTORY, "rt") as glo:
-        data: dict = json.load(glo)
-        data["games"].append({"name": game.get_name(),
-                              "path": game_file_path})
+                i += 1
+                self._in_string = False
 
-def load_game(file_path: str) -> TRPG:
+                if self._depth == 0:
+                    return True
+
+                continue
+
+            match = JSON_STRUCTURE.search(buffer, i)
+
+            if match is None:
+                self._scan = len(buffer)
+                return False
+
+            i = match.end()
+
+            if match.group() == '"':
+                self._in_string = True
+
+            elif match.group() in "{[":
+                self._depth += 1
+
+            else:
+                self._depth -= 1
+
+                if self._depth == 0:
+                    return True
+
+    def value(self) -> Any:
+        """Decodes the next JSON value, reading more of the file until the whole value is in the buffer.
+        An object, array or string running past the buffer is scanned as chunks come in and only decoded again
+        once it is complete, so a large record costs time linear in its size
+        """
+        if self.peek() in ("{", "[", '"'):
+            try:
+                value, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+                return value
+
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+
+            self._scan = self._pos
+            self._depth = 0
+            self._in_string = False
+
+            while not self._scan_value():
+                if not self._fill():
+                    # Truncated, raw_decode reports where
+                    break
+
+            value, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+            return value
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+
+                # A number or literal running to the end of the buffer may continue in the next chunk,
+                # and so may a number cut inside its fraction or exponent, e.g. "1." or "1.5e"
+                if end < len(self._buffer) and self._buffer[end] not in "0123456789+-.eE" or self._eof:
+                    self._pos = end
+                    return value
+
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+
+            if not self._fill():
+                value, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+                return value
+
+def iter_game_file(file: io.TextIOBase) -> Iterator[tuple[str, Any]]:
+    """Parses a game file element by element, yielding the (section, record) pairs taken by TRPG.load_records.
+    Memory use is bounded by the largest single record rather than by the size of the file.
+    """
+    stream = JSONStream(file)
+
+    stream.expect("{")
+
+    if stream.peek() == "}":
+        return
+
+    while True:
+        key = stream.value()
+        stream.expect(":")
+
+        if key in SECTIONS:
+            stream.expect("[")
+
+            if stream.peek() == "]":
+                stream.expect("]")
+
+            else:
+                while True:
+                    yield key, stream.value()
+
+                    if stream.peek() == ",":
+                        stream.expect(",")
+
+                    else:
+                        stream.expect("]")
+                        break
+
+        else:
+            yield key, stream.value()
+
+        if stream.peek() == ",":
+            stream.expect(",")
+
+        else:
+            stream.expect("}")
+            break
+
+def load_game(file_path: str, lazy: bool = False) -> TRPG:
+    """Loads a game file, JSON or binary, or a sharded game directory. The format is detected from the start of the file
+
+    Args:
+        file_path (str): Path of the file
+        lazy (bool): Only build each entity the first time it is accessed, see TRPG.load_records.
+            A binary file then stays mapped until every entity has been decoded or the game is saved
+    """
 
     if not os.path.exists(file_path):
         raise FileNotFoundError("File {} was not found.\n".format(file_path))
-    
-    file = io.open(file_path)
 
-    data = file.read()
+    if os.path.isdir(file_path):
+        import shards
+
+        return shards.load_sharded_game(file_path)
 
     new = TRPG("temp")
 
-    new.data = json.loads(data)
+    if binary_format.is_binary_game(file_path) and lazy:
+        reader = binary_format.BinaryGameReader(file_path)
+
+        try:
+            new.load_records(reader.iter_records(lazy=True), lazy=True)
+
+        except Exception:
+            reader.close()
+            raise
+
+        new.entities.add_source(reader)
+
+    elif binary_format.is_binary_game(file_path):
+        with binary_format.BinaryGameReader(file_path) as reader:
+            new.load_records(reader.iter_records())
+
+    else:
+        with io.open(file_path) as file:
+            new.load_records(iter_game_file(file), lazy)
 
-    new.load_data()
     return new
     
 def test_file_system():
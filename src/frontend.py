@@ -9,6 +9,8 @@ from PyQt5.QtWidgets import QWidget
 
 import base
 import file_management as file
+import models
+import workers
 
 
 WINDOW_HEIGHT = 720
@@ -21,8 +23,6 @@ class OpenRPGDialog(widgets.QDialog):
 
         super().__init__(parent)
 
-        file.update_global_data()
-
         self.setWindowTitle("Open RPG")
         self.isModal = True
         self.setGeometry(core.QRect(640, 480, 144, 96))
@@ -30,23 +30,14 @@ class OpenRPGDialog(widgets.QDialog):
 
         self.central_layout = widgets.QVBoxLayout(self)
 
-        global_data = file.load_global_data()
-
-        games_list: list[dict] = global_data["games"]
+        self.game_list_model = models.GameCatalogModel(self)
 
-        self.game_list = widgets.QTableWidget(len(games_list), 2)
+        self.game_list = widgets.QTableView()
+        self.game_list.setModel(self.game_list_model)
         
         self.game_list.setEditTriggers(widgets.QAbstractItemView.EditTrigger.NoEditTriggers)
-        self.game_list.setHorizontalHeaderLabels(games_list[0].keys())
         self.game_list.setSelectionBehavior(widgets.QAbstractItemView.SelectionBehavior.SelectRows)
-
-        row = 0
-
-        for ele in games_list:
-            self.game_list.setItem(row, 0, widgets.QTableWidgetItem(ele["name"]))
-            self.game_list.setItem(row, 1, widgets.QTableWidgetItem(ele["path"]))
-
-            row += 1
+        self.game_list.verticalHeader().setSectionResizeMode(widgets.QHeaderView.ResizeMode.Fixed)
 
 
         btns = widgets.QDialogButtonBox.Ok | widgets.QDialogButtonBox.Cancel
@@ -72,11 +63,13 @@ class OpenRPGDialog(widgets.QDialog):
     def make_connections(self):
         self.button_box.accepted.connect(self.ok_button_pressed)
         self.button_box.rejected.connect(self.cancel_button_pressed)
-        self.game_list.itemClicked.connect(self.item_clicked)
+        self.game_list.clicked.connect(self.item_clicked)
+
+    def item_clicked(self, index: core.QModelIndex):
+        entry = self.game_list_model.entry(index.row())
 
-    def item_clicked(self, item: widgets.QTableWidgetItem):
-        self.game_name = self.game_list.item(item.row(), 0).text()
-        self.game_path = self.game_list.item(item.row(), 1).text()
+        self.game_name = entry["name"]
+        self.game_path = entry["path"]
 
     def ok_button_pressed(self):
         self.accept()
@@ -186,7 +179,30 @@ class MainWindow(widgets.QMainWindow):
         self.new_entity_action = widgets.QAction("&New Entity")
         self.menuEntities.addAction(self.new_entity_action)
 
+        self.menuEvents = self.menubar.addMenu("Events")
+        self.menuEvents.setObjectName("menuEvents")
+
+        self.run_event_action = widgets.QAction("&Run Event")
+        self.menuEvents.addAction(self.run_event_action)
+
+        self.simulate_event_action = widgets.QAction("&Simulate Event")
+        self.menuEvents.addAction(self.simulate_event_action)
+
+        self.menuEvents.addSeparator()
+
+        self.cancel_work_action = widgets.QAction("&Cancel")
+        self.cancel_work_action.setEnabled(False)
+        self.menuEvents.addAction(self.cancel_work_action)
+
+        self.progress_bar = widgets.QProgressBar()
+        self.progress_bar.setMaximumWidth(240)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+
         self.active_game = None
+        self.loaded_game_tab = None
+        self.worker: workers.GameWorker | None = None
+        self.worker_thread: core.QThread | None = None
 
         self.make_connections()
 
@@ -209,9 +225,17 @@ class MainWindow(widgets.QMainWindow):
             print("Failure: No active game available.\n")
 
         else:
+            self.unload_game_tab()
             self.loaded_game_tab = TabBarWidget(self.active_game)
             self.setCentralWidget(self.loaded_game_tab)
 
+    def unload_game_tab(self):
+        if self.loaded_game_tab is not None:
+            self.loaded_game_tab.close_game()
+            # setCentralWidget deletes the widget it replaces
+            self.setCentralWidget(widgets.QWidget())
+            self.loaded_game_tab = None
+
     def open_rpg(self):
         dialog = OpenRPGDialog(self)
         result = dialog.exec()
@@ -233,14 +257,130 @@ class MainWindow(widgets.QMainWindow):
             file.save_game(self.active_game)   
 
     def close_rpg(self):
+        self.stop_worker()
         self.save_rpg()
+        self.unload_game_tab()
         self.active_game = None   
 
+    def pick_event(self, title: str) -> str | None:
+        if not isinstance(self.active_game, base.TRPG) or len(self.active_game.event) == 0:
+            print("Failure: No event available.\n")
+            return None
+
+        if self.worker is not None:
+            print("Failure: {} is still running.\n".format(type(self.worker).__name__))
+            return None
+
+        event_name, ok = widgets.QInputDialog.getItem(self, title, "Event: ", list(self.active_game.event), 0, False)
+
+        return event_name if ok else None
+
+    def run_event(self):
+        event_name = self.pick_event("Run Event")
+
+        if event_name is not None:
+            self.start_worker(workers.EventWorker(self.active_game, event_name))
+
+    def simulate_event(self):
+        event_name = self.pick_event("Simulate Event")
+
+        if event_name is None:
+            return
+
+        runs, ok = widgets.QInputDialog.getInt(self, "Simulate Event", "Runs: ", 1000, 1, 10_000_000)
+
+        if ok:
+            self.start_worker(workers.SimulationWorker(self.active_game, event_name, runs))
+
+    def start_worker(self, worker: workers.GameWorker):
+        """Runs a worker off the GUI thread. Its progress is shown in the status bar and its changes
+        are applied to the tabs as they arrive
+        """
+        self.worker = worker
+
+        worker.progress.connect(self.worker_progress)
+        worker.finished.connect(self.worker_finished)
+        worker.failed.connect(self.worker_failed)
+        worker.cancelled.connect(self.worker_cancelled)
+
+        if self.loaded_game_tab is not None:
+            worker.state_changed.connect(self.loaded_game_tab.apply_changes)
+
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.cancel_work_action.setEnabled(True)
+        self.statusBar().showMessage("Running...")
+
+        self.worker_thread = workers.start_worker(worker, self)
+
+    def cancel_work(self):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def worker_progress(self, done: int, total: int):
+        if total < 0:
+            self.progress_bar.setRange(0, 0)
+            self.statusBar().showMessage("Running... {}".format(done))
+
+        else:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
+
+    def worker_finished(self, result):
+        if isinstance(self.worker, workers.SimulationWorker):
+            self.statusBar().showMessage("Simulated {} runs, {} ended, {:.2f} turns on average.".format(
+                result.runs, result.ended, result.mean_turns()))
+
+        elif isinstance(self.worker, workers.EventWorker):
+            self.statusBar().showMessage("Event {} {}.".format(self.worker.event_name, "ended" if result else "stopped"))
+
+        else:
+            self.statusBar().showMessage("Done.")
+
+        self.worker_done()
+
+    def worker_failed(self, error: str):
+        self.statusBar().showMessage("Failed: {}".format(error))
+        self.worker_done()
+
+    def worker_cancelled(self):
+        self.statusBar().showMessage("Cancelled.")
+        self.worker_done()
+
+    def worker_done(self):
+        self.progress_bar.hide()
+        self.cancel_work_action.setEnabled(False)
+
+        if self.worker_thread is not None:
+            self.worker_thread.wait()
+
+        self.worker = None
+        self.worker_thread = None
+
+    def stop_worker(self):
+        """Cancels the running worker and waits for it, so the game is not changed while it is saved or closed
+        """
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker_thread.wait()
+
+            # The signals the worker emitted on its way out are still queued, they must not reach a new worker's state
+            self.worker.disconnect()
+            self.statusBar().showMessage("Cancelled.")
+            self.worker_done()
+
+    def closeEvent(self, event: gui.QCloseEvent):
+        self.stop_worker()
+        super().closeEvent(event)
+
     def make_connections(self):
         self.new_rpg_action.triggered.connect(self.create_rpg)
         self.open_rpg_action.triggered.connect(self.open_rpg)
         self.save_rpg_action.triggered.connect(self.save_rpg)
         self.close_rpg_action.triggered.connect(self.close_rpg)
+        self.run_event_action.triggered.connect(self.run_event)
+        self.simulate_event_action.triggered.connect(self.simulate_event)
+        self.cancel_work_action.triggered.connect(self.cancel_work)
 
 
 class TabBarWidget(widgets.QTabWidget):
@@ -250,26 +390,42 @@ class TabBarWidget(widgets.QTabWidget):
 
         self.active_game = active_game
 
-        self.attribute_tab = AttributeTab(self.active_game)
-        self.action_tab = ActionTab(self.active_game)
+        # One model per section, shared by every view of the tabs and closed with the game
+        self.section_models: dict[str: models.GameSectionModel] = {ele: models.GameSectionModel(self.active_game, ele, self)
+                                                                    for ele in models.SECTION_TYPES}
+
+        self.attribute_tab = AttributeTab(self.active_game, self.section_models)
+        self.action_tab = ActionTab(self.active_game, self.section_models)
+        self.entity_tab = EntityTab(self.active_game, self.section_models)
         self.addTab(self.attribute_tab, "Attributes")
         self.addTab(self.action_tab, "Actions")
+        self.addTab(self.entity_tab, "Entities")
+
+    def apply_changes(self, changes: list):
+        """Applies the state changes emitted by a worker, see workers.GameWorker
+        """
+        self.entity_tab.apply_changes(changes)
+
+    def close_game(self):
+        """Stops the models following the game, so neither keeps the other alive once the game is closed
+        """
+        for ele in self.section_models.values():
+            ele.close()
 
 
 class AttributeTab(widgets.QWidget):
-    def __init__(self, active_game: base.TRPG, parent = None) -> None:
+    def __init__(self, active_game: base.TRPG, section_models: dict, parent = None) -> None:
         super().__init__(parent)
 
         self.active_game = active_game
 
         self.layout_widget = widgets.QHBoxLayout(self)
 
-        self.attribute_list_widget = widgets.QListWidget()
+        self.attribute_list_model = section_models["attributes"]
 
-        self.attribute_list_widget.clear()
-
-        for ele in self.active_game.attributes:
-            self.attribute_list_widget.addItem(ele)
+        self.attribute_list_widget = widgets.QListView()
+        self.attribute_list_widget.setUniformItemSizes(True)
+        self.attribute_list_widget.setModel(self.attribute_list_model)
 
         self.new_attribute_button = widgets.QPushButton(gui.QIcon(PLUS_ICON), None, None)
 
@@ -309,17 +465,19 @@ class AttributeTab(widgets.QWidget):
 
         self.make_connections()
 
-    def attribute_list_item_clicked(self, item: widgets.QListWidgetItem):
+    def attribute_list_item_clicked(self, index: core.QModelIndex):
+        attribute_name = self.attribute_list_model.key(index.row())
+
         self.attribute_name_lineedit_widget.clear()
-        self.attribute_name_lineedit_widget.insert(item.text())
+        self.attribute_name_lineedit_widget.insert(attribute_name)
 
-        if self.active_game.get_attribute(item.text()).get_value_type() == "num":
+        if self.active_game.get_attribute(attribute_name).get_value_type() == "num":
             self.attribute_type_combobox_widget.setCurrentIndex(0)
 
-        elif self.active_game.get_attribute(item.text()).get_value_type() == "alpha":
+        elif self.active_game.get_attribute(attribute_name).get_value_type() == "alpha":
             self.attribute_type_combobox_widget.setCurrentIndex(1)
 
-        elif self.active_game.get_attribute(item.text()).get_value_type() == "bool":
+        elif self.active_game.get_attribute(attribute_name).get_value_type() == "bool":
             self.attribute_type_combobox_widget.setCurrentIndex(2)
 
     def new_attribute_button_clicked(self):
@@ -346,31 +504,30 @@ class AttributeTab(widgets.QWidget):
             attribute_type = "bool"
         
         
+        # The list model picks the new attribute up from the game
         self.active_game.new_attribute(attribute_name, attribute_type)
-        self.attribute_list_widget.addItem(attribute_name)
 
         self.new_attribute_accept_button.hide()
 
     def make_connections(self):
-        self.attribute_list_widget.itemClicked.connect(self.attribute_list_item_clicked)
+        self.attribute_list_widget.clicked.connect(self.attribute_list_item_clicked)
         self.new_attribute_button.clicked.connect(self.new_attribute_button_clicked)
         self.new_attribute_accept_button.clicked.connect(self.new_attribute_accept_button_clicked)
 
 
 class ActionTab(widgets.QWidget):
-    def __init__(self, active_game: base.TRPG, parent = None) -> None:
+    def __init__(self, active_game: base.TRPG, section_models: dict, parent = None) -> None:
         super().__init__(parent)
 
         self.active_game = active_game
 
         self.layout_widget = widgets.QHBoxLayout(self)
 
-        self.action_list_widget = widgets.QListWidget()
+        self.action_list_model = section_models["actions"]
 
-        self.action_list_widget.clear()
-
-        for ele in self.active_game.actions:
-            self.action_list_widget.addItem(ele)
+        self.action_list_widget = widgets.QListView()
+        self.action_list_widget.setUniformItemSizes(True)
+        self.action_list_widget.setModel(self.action_list_model)
 
         self.new_action_button = widgets.QPushButton(gui.QIcon(PLUS_ICON), None, None)
 
@@ -383,10 +540,11 @@ class ActionTab(widgets.QWidget):
         
         self.action_effects_label_widget = widgets.QLabel("Action Effect: ")
 
-        self.action_effects_table_widget = widgets.QTableWidget()
+        self.action_effects_model = models.EffectTableModel(self.active_game, self)
 
-        self.action_effects_table_widget.setColumnCount(4)
-        self.action_effects_table_widget.setHorizontalHeaderLabels(["Attribute Affected", "Target Type", "Modifier", "Value"])
+        self.action_effects_table_widget = widgets.QTableView()
+        self.action_effects_table_widget.setModel(self.action_effects_model)
+        self.action_effects_table_widget.setItemDelegate(EffectDelegate(section_models["attributes"], self.action_effects_table_widget))
 
         self.commit_button = widgets.QPushButton("Ok")
 
@@ -410,44 +568,26 @@ class ActionTab(widgets.QWidget):
 
         self.make_connections()
 
-    def attribute_list_item_clicked(self, item: widgets.QListWidgetItem):
-        self.attribute_name_lineedit_widget.clear()
-        self.attribute_name_lineedit_widget.insert(item.text())
-
-        effects_list = self.active_game.get_action(item.text()).get_effects()
-
-        self.action_effects_table_widget.setRowCount(len(effects_list))
-
-        row = 0
-        for ele in effects_list:
-            effect_attribute_combo_box = widgets.QComboBox()
-            effect_attribute_combo_box.addItems(self.active_game.attributes.keys())
-            effect_attribute_combo_box.setCurrentText(ele.attribute)   
-
-            effect_type_combo_box = widgets.QComboBox()
-            effect_type_combo_box.addItems(base.TARGETS)
-            effect_type_combo_box.setCurrentText(ele.effect_type)
-
-            effect_modifier_combo_box = widgets.QComboBox()
-            effect_modifier_combo_box.addItems(base.OPERATORS)
-            effect_modifier_combo_box.setCurrentText(ele.modifier)
+    def attribute_list_item_clicked(self, index: core.QModelIndex):
+        action_name = self.action_list_model.key(index.row())
 
-            effect_value_line_edit = widgets.QLineEdit()
-            if not isinstance(ele.value, base.AttrBasedValStruct):
-                effect_value_line_edit.setText(str(ele.value))
+        self.action_name_lineedit_widget.clear()
+        self.action_name_lineedit_widget.insert(action_name)
 
-            self.action_effects_table_widget.setCellWidget(row, 0, effect_attribute_combo_box)
-            self.action_effects_table_widget.setCellWidget(row, 1, effect_type_combo_box)
-            self.action_effects_table_widget.setCellWidget(row, 2, effect_modifier_combo_box)
-            self.action_effects_table_widget.setCellWidget(row, 3, effect_value_line_edit)
+        # Editors are only created by EffectDelegate for the cell being edited
+        self.action_effects_model.set_effects(self.active_game.get_action(action_name).get_effects())
+        self.commit_button.hide()
 
     def delete_action_button_clicked(self):
-        current = self.action_list_widget.currentItem()
-        self.action_list_widget.removeItemWidget(current)
+        current = self.action_list_widget.currentIndex()
+
+        if not current.isValid():
+            return
 
-        self.active_game.remove_action(current.text())
+        # The list model drops the row once the game reports the removal
+        self.active_game.remove_action(self.action_list_model.key(current.row()))
 
-    def action_effect_changed(self, e: widgets.QTableWidgetItem):
+    def action_effect_changed(self, top_left: core.QModelIndex, bottom_right: core.QModelIndex):
 
         self.commit_button.show()
 
@@ -456,17 +596,114 @@ class ActionTab(widgets.QWidget):
         self.commit_button.show()
 
         self.action_name_lineedit_widget.clear()
-        self.action_effects_table_widget.clearContents()
+        self.action_effects_model.set_effects([])
         
         self.action_name_lineedit_widget.focusWidget()
 
-    #def new_action_accept_button_clicked(self):
-        
+    def commit_button_clicked(self):
+        action_name = self.action_name_lineedit_widget.text()
+
+        try:
+            if action_name in self.active_game.actions:
+                self.active_game.modify_action(action_name, new_action_effects=self.action_effects_model.effects())
+
+            else:
+                self.active_game.new_action(action_name, effects=self.action_effects_model.effects())
+
+        except ValueError as e:
+            print("Failed: {}".format(e))
+            return
+
+        self.commit_button.hide()
 
     def make_connections(self):
         self.new_action_button.clicked.connect(self.new_action_button_clicked)
         self.delete_action_button.clicked.connect(self.delete_action_button_clicked)
         self.action_list_widget.clicked.connect(self.attribute_list_item_clicked)
+        self.action_effects_model.dataChanged.connect(self.action_effect_changed)
+        self.commit_button.clicked.connect(self.commit_button_clicked)
+
+
+class EffectDelegate(widgets.QStyledItemDelegate):
+    def __init__(self, attribute_model: models.GameSectionModel, parent = None) -> None:
+        """Edits the cells of an EffectTableModel. Attributes, target types and modifiers are picked from combo boxes,
+        the attribute ones showing the game's shared attribute model, and values are typed in a line edit
+        """
+        super().__init__(parent)
+
+        self.attribute_model = attribute_model
+
+    def createEditor(self, parent: QWidget, option: widgets.QStyleOptionViewItem, index: core.QModelIndex) -> QWidget:
+        if index.column() == models.EffectTableModel.ATTRIBUTE_COLUMN:
+            editor = widgets.QComboBox(parent)
+            editor.setModel(self.attribute_model)
+
+            return editor
+
+        if index.column() == models.EffectTableModel.TARGET_COLUMN:
+            editor = widgets.QComboBox(parent)
+            editor.addItems(base.TARGETS)
+
+            return editor
+
+        if index.column() == models.EffectTableModel.MODIFIER_COLUMN:
+            editor = widgets.QComboBox(parent)
+            editor.addItems(base.OPERATORS)
+
+            return editor
+
+        return widgets.QLineEdit(parent)
+
+    def setEditorData(self, editor: QWidget, index: core.QModelIndex):
+        value = index.data(core.Qt.ItemDataRole.EditRole)
+
+        if isinstance(editor, widgets.QComboBox):
+            editor.setCurrentText(value)
+
+        else:
+            editor.setText(value)
+
+    def setModelData(self, editor: QWidget, model: core.QAbstractItemModel, index: core.QModelIndex):
+        if isinstance(editor, widgets.QComboBox):
+            model.setData(index, editor.currentText())
+
+        else:
+            model.setData(index, editor.text())
+
+
+class EntityTab(widgets.QWidget):
+    def __init__(self, active_game: base.TRPG, section_models: dict, parent = None) -> None:
+        super().__init__(parent)
+
+        self.active_game = active_game
+
+        self.layout_widget = widgets.QHBoxLayout(self)
+
+        self.entity_list_model = section_models["entities"]
+
+        self.entity_list_widget = widgets.QListView()
+        self.entity_list_widget.setUniformItemSizes(True)
+        self.entity_list_widget.setModel(self.entity_list_model)
+
+        self.entity_attributes_model = models.EntityAttributeModel(self.active_game, self)
+
+        self.entity_attributes_table_widget = widgets.QTableView()
+        self.entity_attributes_table_widget.setModel(self.entity_attributes_model)
+        self.entity_attributes_table_widget.setEditTriggers(widgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+
+        self.layout_widget.addWidget(self.entity_list_widget)
+        self.layout_widget.addWidget(self.entity_attributes_table_widget)
+
+        self.make_connections()
+
+    def entity_list_item_clicked(self, index: core.QModelIndex):
+        self.entity_attributes_model.set_entity(self.entity_list_model.key(index.row()))
+
+    def apply_changes(self, changes: list):
+        self.entity_attributes_model.apply_changes(changes)
+
+    def make_connections(self):
+        self.entity_list_widget.clicked.connect(self.entity_list_item_clicked)
 
 
 def test_GUI():
@@ -0,0 +1,262 @@
+"""Write-ahead journal of the operations applied to a game.
+
+A journaled game lives in two files of the game directory: a snapshot, which is an ordinary JSON game file,
+and <name>.journal, one JSON line per operation applied since the snapshot was written. Recording an operation
+only appends a line, so saving costs as much as the change instead of the whole game. Once the journal grows
+past a size threshold it is compacted: a fresh snapshot is written and the journal starts over.
+
+Each compaction draws a new journal id, stored both in the snapshot and on the first line of the journal.
+A journal is only replayed on top of the snapshot carrying its id, so a crash between writing the snapshot and
+restarting the journal never applies an operation twice.
+
+Timed statuses are not part of a snapshot. Their ticks and expiries are journaled as the values they wrote,
+and a replayed action files its statuses on a wheel that is thrown away, so the recovered game has the values
+the crashed one had but none of its statuses still running, as if it had been saved and loaded.
+"""
+import io
+import json
+import os
+import tempfile
+import uuid
+
+from base import *
+from file_management import GAME_DIRECTORY, JOURNAL_EXTENSION, iter_game_file, update_catalog_entry, write_file_atomic
+
+COMPACT_SIZE = 1 << 20
+JOURNAL_KEY = "journal"
+
+def _attributes_from_data(attributes: Sequence[dict]) -> list[AttrValueStruct]:
+    return [AttrValueStruct(ele["name"], ele["value type"], ele["value"]) for ele in attributes]
+
+def _effects_from_data(effects: Sequence[dict] | None) -> list[EffectStruct] | None:
+    if effects is None:
+        return None
+
+    return [effect_from_data(ele) for ele in effects]
+
+def _apply_status(game: TRPG, args: dict):
+    for entity, attribute, value in args["changes"]:
+        game.get_entity(entity).set_attribute_value(attribute, value)
+
+OPERATIONS: dict[str: Callable[[TRPG, dict], None]] = {
+    "new_attribute": lambda game, args: game.new_attribute(args["name"], args["value type"]),
+    "new_action": lambda game, args: game.new_action(args["name"], effects=_effects_from_data(args["effects"])),
+    "new_entity": lambda game, args: game.new_entity(args["name"], _attributes_from_data(args["attributes"]), args["actions"]),
+    "remove_attribute": lambda game, args: game.remove_attribute(args["name"]),
+    "remove_action": lambda game, args: game.remove_action(args["name"]),
+    "remove_entity": lambda game, args: game.remove_entity(args["name"]),
+    "modify_attribute": lambda game, args: game.modify_attribute(args["name"], args["new name"], args["new value type"]),
+    "modify_action": lambda game, args: game.modify_action(args["name"], args["new name"], _effects_from_data(args["new effects"])),
+    "modify_entity": lambda game, args: game.modify_entity(args["name"],
+                                                           args["new name"],
+                                                           None if args["new attributes"] is None else _attributes_from_data(args["new attributes"]),
+                                                           args["new actions"]),
+    "use_action": lambda game, args: game.use_action(args["user"], args["action"], args["targets"], TTimerWheel()),
+    "status": _apply_status,
+}
+
+def apply_operation(game: TRPG, record: dict):
+    """Applies one journal record to a game
+
+    Args:
+        game (TRPG): The game
+        record (dict): {"op": name of the TRPG method, "args": its arguments}
+    """
+    if record["op"] not in OPERATIONS:
+        raise ValueError("Operation {} cannot be replayed.\n".format(record["op"]))
+
+    OPERATIONS[record["op"]](game, record["args"])
+
+def snapshot_path(name: str, directory: str = GAME_DIRECTORY) -> str:
+    return os.path.join(directory, name + ".json")
+
+def journal_path(name: str, directory: str = GAME_DIRECTORY) -> str:
+    return os.path.join(directory, name + JOURNAL_EXTENSION)
+
+def recover_game(name: str, directory: str = GAME_DIRECTORY) -> TRPG:
+    """Rebuilds a journaled game from its last snapshot and the operations journaled after it.
+    A torn last line, left by a crash while appending, is ignored
+
+    Args:
+        name (str): Name of the game
+        directory (str): Directory holding the snapshot and the journal
+
+    Returns:
+        TRPG: The game
+    """
+    game = TRPG(name)
+    journal_id = None
+
+    def capture_id(records: Iterable[tuple[str, Any]]) -> Iterator[tuple[str, Any]]:
+        nonlocal journal_id
+
+        for section, record in records:
+            if section == JOURNAL_KEY:
+                journal_id = record
+
+            yield section, record
+
+    if os.path.exists(snapshot_path(name, directory)):
+        with io.open(snapshot_path(name, directory)) as file:
+            game.load_records(capture_id(iter_game_file(file)))
+
+    if not os.path.exists(journal_path(name, directory)):
+        return game
+
+    with io.open(journal_path(name, directory)) as file:
+        header = file.readline()
+
+        if not header.endswith("\n") or json.loads(header).get(JOURNAL_KEY) != journal_id:
+            return game
+
+        for line in file:
+            if not line.endswith("\n"):
+                break
+
+            apply_operation(game, json.loads(line))
+
+    return game
+
+class GameJournal:
+    def __init__(self,
+                 game: TRPG,
+                 directory: str = GAME_DIRECTORY,
+                 compact_size: int = COMPACT_SIZE,
+                 sync: bool = False):
+        """Journals the operations applied to a game. Nothing is written until open is called
+
+        Args:
+            game (TRPG): The game
+            directory (str): Directory of the snapshot and the journal
+            compact_size (int): Size in bytes past which the journal is folded into a new snapshot
+            sync (bool): fsync the journal after every record, so an operation is durable once its method returns
+        """
+        self.game = game
+        self.directory = directory
+        self.compact_size = compact_size
+        self.sync = sync
+        self.records: int = 0
+        self.compactions: int = 0
+
+        self._file: io.TextIOBase | None = None
+        self._name = game.get_name()
+        self.path = snapshot_path(self._name, directory)
+
+    def open(self):
+        """Writes a snapshot of the game as it is now and starts journaling its operations
+        """
+        self.compact()
+        self.game.add_operation_listener(self.record)
+        self.game.journal = self
+
+    def close(self):
+        self.game.remove_operation_listener(self.record)
+
+        if self.game.journal is self:
+            self.game.journal = None
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "GameJournal":
+        self.open()
+
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, operation: str, arguments: dict):
+        """Operation listener of the game, appends one record to the journal
+        """
+        if operation == "load":
+            # The whole game was replaced, there is nothing to replay it from
+            self.compact()
+            return
+
+        self._file.write(json.dumps({"op": operation, "args": arguments}, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+        self.records += 1
+
+        # An action running under entity locks cannot take the game's lock exclusively, the next record compacts
+        if self._file.tell() > self.compact_size and not self.game.lock.held_shared():
+            self.compact()
+
+    def compact(self):
+        """Writes a new snapshot of the game and restarts the journal from it
+        """
+        journal_id = uuid.uuid4().hex
+
+        with self.game.lock:
+            data = self.game.data
+            content = json.dumps({**data, JOURNAL_KEY: journal_id}, indent=4).encode("utf-8")
+            summary = {"name": data["name"], **{ele: len(data[ele]) for ele in SECTIONS}}
+
+            write_file_atomic(self.path, content)
+
+            if self._file is not None:
+                self._file.close()
+
+            write_file_atomic(journal_path(self._name, self.directory), (json.dumps({JOURNAL_KEY: journal_id}) + "\n").encode("utf-8"))
+            self._file = io.open(journal_path(self._name, self.directory), "a")
+
+        self.compactions += 1
+
+        if self.directory == GAME_DIRECTORY:
+            update_catalog_entry(self.path, summary)
+
+def test_journal():
+    new = TRPG("Journal_Test")
+
+    new.new_attribute("HP", "num")
+    new.new_attribute("Condition", "alpha")
+
+    new.new_action("Shield", effects=[EffectStruct("HP", "st", None, "+", 10, duration=2)])
+    new.new_action("Burn", effects=[EffectStruct("HP", "st", None, "+", -1, duration=3, per_turn=True)])
+    new.new_action("Curse", effects=[EffectStruct("Condition", "st", None, "=", "Cursed", duration=0)])
+
+    new.new_entity("Keith", [AttrValueStruct("HP", "num", 30), AttrValueStruct("Condition", "alpha", "OK")], ["Shield", "Burn", "Curse"])
+    new.new_entity("Logan", [AttrValueStruct("HP", "num", 30), AttrValueStruct("Condition", "alpha", "OK")], ["Shield", "Burn", "Curse"])
+
+    new.new_event("Duel",
+                  ["Keith", "Logan"],
+                  [EventActionStruct("Keith", "Curse", ["Logan"]), EventActionStruct("Logan", "Shield", ["Keith"])],
+                  EventEndConditionStruct(">=", 2))
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = GameJournal(new, directory)
+        journal.open()
+
+        new.use_action("Keith", "Shield", ["Logan"])
+        new.use_action("Keith", "Burn", ["Logan"])
+
+        # The shield expires on the second turn, the burn ticks three times
+        for _ in range(4):
+            new.advance_timers()
+
+        # The curse lasts until the end of the event and the shield of its second turn outlives it
+        new.start_event("Duel")
+
+        logan = new.get_entity("Logan")
+        keith = new.get_entity("Keith")
+
+        if logan.get_attributes()["HP"].value != 27 or logan.get_attributes()["Condition"].value != "OK":
+            raise AssertionError("Statuses did not expire: {}\n".format(logan.data))
+
+        if keith.get_attributes()["HP"].value != 30:
+            raise AssertionError("The status of the event was not ended: {}\n".format(keith.data))
+
+        # Recover without closing the journal, as after a crash
+        recovered = recover_game("Journal_Test", directory)
+        journal.close()
+
+        if recovered.data != new.data:
+            raise AssertionError("The recovered game differs from the journaled one:\n{}\n{}\n".format(recovered.data, new.data))
+
+        print(recovered.data["entities"])
+
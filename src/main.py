@@ -1,11 +1,26 @@
 from base import *
 from file_management import *
 from frontend import *
+from benchmarks import *
+from scheduler import test_scheduler
+from journal import test_journal
 
 TEST_FILE = False
 TEST_BASE = False
+TEST_ENTITY_LOCKS = False
+TEST_SCHEDULER = False
+TEST_JOURNAL = False
 TEST_GUI = True
 ISOLATED_TESTS = False
+BENCHMARK_LOAD = False
+BENCHMARK_ACTIONS = False
+BENCHMARK_COLUMNS = False
+BENCHMARK_SIMULATION = False
+BENCHMARK_CONDITIONS = False
+BENCHMARK_INITIATIVE = False
+BENCHMARK_SERVER = False
+BENCHMARK_THREADS = False
+BENCHMARK_QUERY = False
 
 def isolated_test():
     data = {"Hi": 1,
@@ -27,6 +42,15 @@ def run():
     if TEST_BASE:
 
         test_base()
+
+    if TEST_ENTITY_LOCKS:
+        test_hold_entities()
+
+    if TEST_SCHEDULER:
+        test_scheduler()
+
+    if TEST_JOURNAL:
+        test_journal()
  
     if TEST_GUI == True:
 
@@ -35,6 +59,33 @@ def run():
     if ISOLATED_TESTS == True:
         isolated_test()
 
+    if BENCHMARK_LOAD:
+        benchmark_load()
+
+    if BENCHMARK_ACTIONS:
+        benchmark_actions()
+
+    if BENCHMARK_COLUMNS:
+        benchmark_columns()
+
+    if BENCHMARK_SIMULATION:
+        benchmark_simulation()
+
+    if BENCHMARK_CONDITIONS:
+        benchmark_conditions()
+
+    if BENCHMARK_INITIATIVE:
+        benchmark_initiative()
+
+    if BENCHMARK_SERVER:
+        benchmark_server()
+
+    if BENCHMARK_THREADS:
+        benchmark_threads()
+
+    if BENCHMARK_QUERY:
+        benchmark_query()
+
 
 if __name__ == "__main__":
     run()
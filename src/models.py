@@ -0,0 +1,437 @@
+"""Qt item models over a game and the game catalog, for the views of frontend.
+
+The models hold row keys only and build every cell in data, when a view asks for a visible row, so a list of
+a hundred thousand entities costs no more to show than a list of ten. They follow the game through its change
+listeners instead of being rebuilt: changes are gathered and applied on the next pass of the event loop as
+row insertions, removals and dataChanged ranges. Changes made on another thread reach the model through
+a queued signal, so the views are only ever updated on the GUI thread.
+"""
+from collections.abc import Sequence
+import dataclasses
+
+import PyQt5.QtCore as core
+
+import base
+import file_management as file
+
+SECTION_TYPES: dict[str: type] = {"attributes": base.TAttribute,
+                                  "actions": base.TAction,
+                                  "entities": base.TEntity}
+
+VALUE_TYPE_NAMES = {"num": "Number", "alpha": "Word", "bool": "Boolean"}
+
+class GameSectionModel(core.QAbstractListModel):
+    # Carries the changes reported by the game to the thread of the model
+    _game_changed = core.pyqtSignal(object)
+
+    def __init__(self, game: base.TRPG, section: str, parent: core.QObject | None = None) -> None:
+        """List model of the names of one section of a game, in the order of the game's dict
+
+        Args:
+            game (base.TRPG): The game
+            section (str): "attributes", "actions" or "entities"
+            parent (core.QObject | None): Parent of the model
+        """
+        super().__init__(parent)
+
+        if section not in SECTION_TYPES:
+            raise ValueError("Section {} is not a section of a game.\n".format(section))
+
+        self.game = game
+        self.section = section
+
+        self._keys: list[str] = []
+        self._rows: dict[str: int] = {}
+        self._pending: dict[base.TDataObject | None: None] = {}
+        self._load_keys()
+
+        self._game_changed.connect(self._queue_change)
+        self.game.add_change_listener(self._on_game_change)
+
+    def close(self):
+        """Stops following the game
+        """
+        self.game.remove_change_listener(self._on_game_change)
+
+    def _load_keys(self):
+        with self.game.lock:
+            self._keys = list(getattr(self.game, self.section))
+
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+
+    def rowCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._keys)
+
+    def data(self, index: core.QModelIndex, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._keys):
+            return None
+
+        key = self._keys[index.row()]
+
+        if role in (core.Qt.ItemDataRole.DisplayRole, core.Qt.ItemDataRole.EditRole, core.Qt.ItemDataRole.UserRole):
+            return key
+
+        if role == core.Qt.ItemDataRole.ToolTipRole:
+            return self._describe(key)
+
+        return None
+
+    def key(self, row: int) -> str:
+        """Name of the object shown in a row
+        """
+        return self._keys[row]
+
+    def row_of(self, key: str) -> int:
+        """Row of an object, or -1 if it is not in the model
+        """
+        return self._rows.get(key, -1)
+
+    def _describe(self, key: str) -> str | None:
+        objects = getattr(self.game, self.section)
+
+        if key not in objects:
+            return None
+
+        if self.section == "attributes":
+            return VALUE_TYPE_NAMES.get(objects[key].get_value_type())
+
+        if self.section == "actions":
+            return "{} effect(s)".format(len(objects[key].get_effects()))
+
+        # Hovering must not hydrate a lazily loaded entity
+        if isinstance(objects, base.TLazyEntityMap) and not objects.is_hydrated(key):
+            return None
+
+        return "{} attribute(s), {} action(s)".format(len(objects[key].get_attributes()), len(objects[key].get_actions()))
+
+    def _on_game_change(self, game: base.TRPG, obj: base.TDataObject | None):
+        # Change listener, called on whichever thread changed the game
+        if obj is None or isinstance(obj, SECTION_TYPES[self.section]):
+            self._game_changed.emit(obj)
+
+    def _queue_change(self, obj: base.TDataObject | None):
+        if len(self._pending) == 0:
+            core.QTimer.singleShot(0, self._apply_changes)
+
+        self._pending.update({obj: None})
+
+    def _apply_changes(self):
+        pending = self._pending
+        self._pending = {}
+
+        if None in pending:
+            # The whole game was reloaded
+            self.beginResetModel()
+            self._load_keys()
+            self.endResetModel()
+            return
+
+        changed: list[str] = []
+        removed: list[int] = []
+        added: list[str] = []
+
+        with self.game.lock:
+            objects = getattr(self.game, self.section)
+
+            for ele in pending:
+                key = ele.get_name()
+
+                if key in self._rows and key not in objects:
+                    removed.append(self._rows[key])
+
+                elif key in self._rows:
+                    changed.append(key)
+
+                elif key in objects:
+                    added.append(key)
+
+        for row in sorted(removed, reverse=True):
+            self.beginRemoveRows(core.QModelIndex(), row, row)
+            del self._keys[row]
+            self.endRemoveRows()
+
+        if removed:
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+
+        if added:
+            self.beginInsertRows(core.QModelIndex(), len(self._keys), len(self._keys) + len(added) - 1)
+
+            for key in added:
+                self._rows.update({key: len(self._keys)})
+                self._keys.append(key)
+
+            self.endInsertRows()
+
+        rows = [self._rows[key] for key in changed if key in self._rows]
+
+        if rows:
+            # One signal for the whole span, views only repaint the rows they show
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+class GameCatalogModel(core.QAbstractTableModel):
+    COLUMNS = [("Name", "name"), ("Path", "path"), ("Entities", "entities")]
+
+    def __init__(self, parent: core.QObject | None = None) -> None:
+        """Table model of the game catalog kept in global.json, one row per game file
+        """
+        super().__init__(parent)
+
+        self._entries: list[dict] = []
+        self.refresh()
+
+    def rowCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._entries)
+
+    def columnCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index: core.QModelIndex, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._entries):
+            return None
+
+        entry = self._entries[index.row()]
+
+        if role == core.Qt.ItemDataRole.DisplayRole:
+            value = entry.get(self.COLUMNS[index.column()][1])
+
+            return None if value is None else str(value)
+
+        if role == core.Qt.ItemDataRole.ToolTipRole:
+            return entry["path"]
+
+        if role == core.Qt.ItemDataRole.UserRole:
+            return entry
+
+        return None
+
+    def headerData(self, section: int, orientation: core.Qt.Orientation, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if role == core.Qt.ItemDataRole.DisplayRole and orientation == core.Qt.Orientation.Horizontal:
+            return self.COLUMNS[section][0]
+
+        return super().headerData(section, orientation, role)
+
+    def entry(self, row: int) -> dict:
+        """Catalog entry of a row, see file_management.update_global_data
+        """
+        return self._entries[row]
+
+    def refresh(self):
+        """Re-reads the catalog. Games that appeared, disappeared or changed are inserted, removed or updated
+        in place, so the views keep their selection and scroll position
+        """
+        entries = file.update_global_data()
+        new_paths = {ele["path"]: ele for ele in entries}
+
+        for row in reversed(range(len(self._entries))):
+            if self._entries[row]["path"] not in new_paths:
+                self.beginRemoveRows(core.QModelIndex(), row, row)
+                del self._entries[row]
+                self.endRemoveRows()
+
+        known = {ele["path"]: row for row, ele in enumerate(self._entries)}
+
+        for path, row in known.items():
+            if new_paths[path] != self._entries[row]:
+                self._entries[row] = new_paths[path]
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+
+        added = [ele for ele in entries if ele["path"] not in known]
+
+        if added:
+            self.beginInsertRows(core.QModelIndex(), len(self._entries), len(self._entries) + len(added) - 1)
+            self._entries.extend(added)
+            self.endInsertRows()
+
+class EffectTableModel(core.QAbstractTableModel):
+    COLUMNS = ["Attribute Affected", "Target Type", "Modifier", "Value"]
+    ATTRIBUTE_COLUMN = 0
+    TARGET_COLUMN = 1
+    MODIFIER_COLUMN = 2
+    VALUE_COLUMN = 3
+
+    def __init__(self, game: base.TRPG, parent: core.QObject | None = None) -> None:
+        """Editable table model of the effects of an action, one row per effect. Edits change copies of the effects,
+        read back with effects and written to the game by the caller
+
+        Args:
+            game (base.TRPG): The game, whose attributes give the value types the values are parsed as
+            parent (core.QObject | None): Parent of the model
+        """
+        super().__init__(parent)
+
+        self.game = game
+
+        self._effects: list[base.EffectStruct] = []
+
+    def set_effects(self, effects: Sequence[base.EffectStruct]):
+        self.beginResetModel()
+        self._effects = [dataclasses.replace(ele) for ele in effects]
+        self.endResetModel()
+
+    def effects(self) -> list[base.EffectStruct]:
+        return [dataclasses.replace(ele) for ele in self._effects]
+
+    def rowCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._effects)
+
+    def columnCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section: int, orientation: core.Qt.Orientation, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if role == core.Qt.ItemDataRole.DisplayRole and orientation == core.Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index: core.QModelIndex) -> core.Qt.ItemFlags:
+        flags = super().flags(index)
+
+        if not index.isValid():
+            return flags
+
+        # Values read from an attribute are not plain text, they are shown but not edited here
+        if index.column() == self.VALUE_COLUMN and isinstance(self._effects[index.row()].value, base.AttrBasedValStruct):
+            return flags
+
+        return flags | core.Qt.ItemFlag.ItemIsEditable
+
+    def data(self, index: core.QModelIndex, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._effects):
+            return None
+
+        if role not in (core.Qt.ItemDataRole.DisplayRole, core.Qt.ItemDataRole.EditRole):
+            return None
+
+        effect = self._effects[index.row()]
+
+        if index.column() == self.ATTRIBUTE_COLUMN:
+            return effect.attribute
+
+        if index.column() == self.TARGET_COLUMN:
+            return effect.effect_type
+
+        if index.column() == self.MODIFIER_COLUMN:
+            return effect.modifier
+
+        if isinstance(effect.value, base.AttrBasedValStruct):
+            value = effect.value
+
+            return "{} of {} {} {}".format(value.attribute, value.attribute_owner, value.modifier, value.value) if value.modifier else \
+                "{} of {}".format(value.attribute, value.attribute_owner)
+
+        return str(effect.value)
+
+    def setData(self, index: core.QModelIndex, value, role: int = core.Qt.ItemDataRole.EditRole) -> bool:
+        if not index.isValid() or role != core.Qt.ItemDataRole.EditRole:
+            return False
+
+        effect = self._effects[index.row()]
+
+        if index.column() == self.ATTRIBUTE_COLUMN:
+            if value not in self.game.attributes:
+                return False
+
+            effect.attribute = value
+
+        elif index.column() == self.TARGET_COLUMN:
+            if value not in base.TARGETS:
+                return False
+
+            effect.effect_type = value
+
+        elif index.column() == self.MODIFIER_COLUMN:
+            if value not in base.OPERATORS:
+                return False
+
+            effect.modifier = value
+
+        else:
+            parsed = self._parse_value(effect.attribute, value)
+
+            if parsed is None:
+                return False
+
+            effect.value = parsed
+
+        self.dataChanged.emit(index, index)
+
+        return True
+
+    def _parse_value(self, attribute_name: str, text: str) -> base.SupportedValTypes | None:
+        """Reads a value typed in the table as the value type of the effect's attribute, None if it is not one
+        """
+        value_type = self.game.attributes[attribute_name].get_value_type() if attribute_name in self.game.attributes else "alpha"
+
+        if value_type == "num":
+            try:
+                number = float(text)
+
+            except ValueError:
+                return None
+
+            return int(number) if number.is_integer() and "." not in text and "e" not in text.lower() else number
+
+        if value_type == "bool":
+            return {"true": True, "false": False}.get(text.strip().lower())
+
+        return text
+
+class EntityAttributeModel(core.QAbstractTableModel):
+    COLUMNS = ["Attribute", "Value"]
+
+    def __init__(self, game: base.TRPG, parent: core.QObject | None = None) -> None:
+        """Table model of the attribute values of one entity. The values are copied when the entity is set and then
+        only changed by apply_changes, so the view never reads an entity a worker thread is writing
+        """
+        super().__init__(parent)
+
+        self.game = game
+        self.entity_name: str | None = None
+
+        self._values: list[list] = []
+        self._rows: dict[str: int] = {}
+
+    def set_entity(self, entity_name: str | None):
+        self.beginResetModel()
+
+        self.entity_name = entity_name
+        self._values = []
+
+        if entity_name is not None:
+            with self.game.lock:
+                self._values = [[ele.attribute, ele.value] for ele in self.game.get_entity(entity_name).get_attributes().values()]
+
+        self._rows = {ele[0]: row for row, ele in enumerate(self._values)}
+
+        self.endResetModel()
+
+    def apply_changes(self, changes: Sequence[tuple[str, str, base.SupportedValTypes, base.SupportedValTypes]]):
+        """Applies the (entity, attribute, old value, new value) changes emitted by a worker
+        """
+        rows = []
+
+        for entity_name, attribute_name, _, new in changes:
+            if entity_name == self.entity_name and attribute_name in self._rows:
+                self._values[self._rows[attribute_name]][1] = new
+                rows.append(self._rows[attribute_name])
+
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 1), self.index(max(rows), 1))
+
+    def rowCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._values)
+
+    def columnCount(self, parent: core.QModelIndex = core.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section: int, orientation: core.Qt.Orientation, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if role == core.Qt.ItemDataRole.DisplayRole and orientation == core.Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+
+        return super().headerData(section, orientation, role)
+
+    def data(self, index: core.QModelIndex, role: int = core.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._values) or role != core.Qt.ItemDataRole.DisplayRole:
+            return None
+
+        return str(self._values[index.row()][index.column()])
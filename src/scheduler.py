@@ -0,0 +1,181 @@
+"""Runs many events of one game at the same time, interleaved turn by turn.
+
+Every event is an asyncio task playing one turn at a time. Before a turn the task takes the locks of the entities
+the turn involves, in sorted order, so events on disjoint entities never wait on each other and events sharing
+an entity take turns on it instead of interleaving inside a turn.
+
+Without an executor the turns are played on the event loop, one at a time: events only interleave between turns,
+so no turn ever finds an entity locked and conflicts stays empty. With an executor, such as a ThreadPoolExecutor,
+and the game's entity locks enabled (TRPG.enable_entity_locks), turns of events on disjoint entities are played
+in parallel, and a turn waiting on an entity held by another event's turn is counted in conflicts.
+"""
+import asyncio
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from base import *
+
+class TEventScheduler:
+    def __init__(self,
+                 game: TRPG,
+                 executor: Executor | None = None):
+        """Initialize a scheduler for the events of a game
+
+        Args:
+            game (TRPG): The game
+            executor (Executor | None): Executor playing the turns, e.g. a ThreadPoolExecutor. Turns are played on
+                the event loop if None. Turns only run in parallel if the game's entity locks are enabled too
+        """
+        self.game = game
+        self.executor = executor
+        self.turns: int = 0
+        self.conflicts: Counter = Counter()
+
+        self._locks: dict[str: asyncio.Lock] = {}
+
+    def _lock(self, entity_name: str) -> asyncio.Lock:
+        if entity_name not in self._locks:
+            self._locks.update({entity_name: asyncio.Lock()})
+
+        return self._locks[entity_name]
+
+    def shared_entities(self, event_names: Sequence[str]) -> dict[str: list[str]]:
+        """Finds the entities that more than one of the events involves. Turns of those events on those entities
+        are serialized by the scheduler
+
+        Returns:
+            dict[str: list[str]]: Entity name -> names of the events involving it
+        """
+        users: dict[str: list[str]] = {}
+
+        for event_name in event_names:
+            event = self.game.get_event(event_name)
+            entities = set(event.participants)
+
+            for ele in event.turn_def:
+                if isinstance(ele, EventActionStruct):
+                    entities.update([ele.user, *ele.target])
+
+                else:
+                    entities.add(ele.speaker)
+
+            for ele in entities:
+                users.setdefault(ele, []).append(event_name)
+
+        return {name: events for name, events in users.items() if len(events) > 1}
+
+    async def _play(self, function: Callable, *args) -> Any:
+        """Calls a game method on the executor, or on the event loop without one
+        """
+        if self.executor is None:
+            return function(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def run_event(self,
+                        event_name: str,
+                        max_turns: int | None = None) -> bool:
+        """Runs one event to its end, yielding to the other events after every turn
+
+        Returns:
+            bool: True if the event reached its end condition, False if it was stopped by max_turns
+        """
+        event = self.game.begin_event(event_name)
+
+        try:
+            while not await self._play(self.game.check_event_end, event):
+                if max_turns is not None and event.turns >= max_turns:
+                    return False
+
+                locks = []
+
+                try:
+                    for ele in event.turn_entities():
+                        lock = self._lock(ele)
+
+                        if lock.locked():
+                            self.conflicts[ele] += 1
+
+                        await lock.acquire()
+                        locks.append(lock)
+
+                    await self._play(self.game.step_event, event)
+
+                finally:
+                    for ele in locks:
+                        ele.release()
+
+                self.turns += 1
+
+                await asyncio.sleep(0)
+
+            return True
+
+        finally:
+            self.game.finish_event(event)
+
+    async def run(self,
+                  event_names: Sequence[str],
+                  max_turns: int | None = None) -> dict[str: bool]:
+        """Runs events concurrently until all of them ended
+
+        Returns:
+            dict[str: bool]: Event name -> result of run_event
+        """
+        results = await asyncio.gather(*[self.run_event(ele, max_turns) for ele in event_names])
+
+        return dict(zip(event_names, results))
+
+def run_events(game: TRPG,
+               event_names: Sequence[str],
+               max_turns: int | None = None,
+               executor: Executor | None = None) -> dict[str: bool]:
+    """Runs events of a game concurrently from synchronous code, see TEventScheduler
+
+    Returns:
+        dict[str: bool]: Event name -> True if the event reached its end condition
+    """
+    return asyncio.run(TEventScheduler(game, executor).run(event_names, max_turns))
+
+def test_scheduler():
+    game = TRPG("Scheduler_Test")
+
+    game.new_attribute("HP", "num")
+
+    game.new_action("Hit", effects=[EffectStruct("HP", "st", None, "+", -1)])
+
+    for ele in ("Knight", "Dragon", "Troll", "Orc", "Elf"):
+        game.new_entity(ele, [AttrValueStruct("HP", "num", 20)], ["Hit"])
+
+    # The Knight fights in both events, the Orc and the Elf only in the third
+    game.new_event("Cave",
+                   ["Knight", "Dragon"],
+                   [EventActionStruct("Knight", "Hit", ["Dragon"])],
+                   EventEndConditionAttributeStruct("Dragon", "HP", "<=", 0))
+    game.new_event("Bridge",
+                   ["Knight", "Troll"],
+                   [EventActionStruct("Knight", "Hit", ["Troll"])],
+                   EventEndConditionAttributeStruct("Troll", "HP", "<=", 0))
+    game.new_event("Forest",
+                   ["Orc", "Elf"],
+                   [EventActionStruct("Orc", "Hit", ["Elf"])],
+                   EventEndConditionAttributeStruct("Elf", "HP", "<=", 0))
+
+    print(TEventScheduler(game).shared_entities(["Cave", "Bridge", "Forest"]))
+
+    scheduler = TEventScheduler(game)
+    print(asyncio.run(scheduler.run(["Cave", "Bridge"], max_turns=5)), dict(scheduler.conflicts))
+
+    assert sum(scheduler.conflicts.values()) == 0
+
+    game.enable_entity_locks()
+
+    with ThreadPoolExecutor(4) as executor:
+        scheduler = TEventScheduler(game, executor)
+        results = asyncio.run(scheduler.run(["Cave", "Bridge", "Forest"]))
+
+    print(results, dict(scheduler.conflicts))
+
+    assert all(results.values())
+    assert scheduler.conflicts["Knight"] > 0
+    assert "Orc" not in scheduler.conflicts and "Elf" not in scheduler.conflicts
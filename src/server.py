@@ -0,0 +1,447 @@
+"""Asyncio server hosting many games at once behind a local socket.
+
+The protocol is line-delimited JSON. Every request is one line
+
+    {"id": 7, "op": "use_action", "game": "Test_1", "args": {"user": "Keith", "action": "BOOM", "targets": ["Logan"]}}
+
+and is answered by one line carrying the same id, either {"id": 7, "ok": true, "result": ...}
+or {"id": 7, "ok": false, "error": "..."}. A client may pipeline requests without waiting for the answers.
+Requests on the same game are applied one at a time, in the order they arrived, so answers to requests on
+different games can come back out of order.
+
+Operations, with their args:
+
+    load        path                        Loads a game file or sharded directory, the result is the game's name
+    games                                   Names of the hosted games
+    unload      (game)                      Stops hosting a game
+    get_entity  (game), name                The entity, in the format of the entity records of TRPG.data
+    use_action  (game), user, action, targets
+                                            The changes made, as [entity, attribute, old value, new value] lists
+    start_event (game), event, max_turns    {"ended": bool, "turns": int}
+    save_game   (game), binary              Saves the game in the game directory
+
+Run this module to serve on localhost. load_test drives a server with many pipelined requests
+and reports the throughput and latency percentiles.
+"""
+import asyncio
+from dataclasses import dataclass
+import json
+import statistics
+import time
+
+from base import *
+from file_management import load_game, save_game
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Requests of one connection being handled at a time, reading pauses past this
+MAX_PIPELINE = 128
+# Longest accepted request line, in bytes
+LINE_LIMIT = 1 << 20
+
+class TGameServer:
+    def __init__(self, max_pipeline: int = MAX_PIPELINE):
+        """Initialize a server hosting no game. Games are added with add_game or by a "load" request
+
+        Args:
+            max_pipeline (int): Requests of one connection being handled at a time
+        """
+        self.max_pipeline = max_pipeline
+        self.games: dict[str: TRPG] = {}
+        self.requests: int = 0
+
+        self._locks: dict[str: asyncio.Lock] = {}
+        self._server: asyncio.AbstractServer | None = None
+
+        self._operations: dict[str: Callable[[TRPG, dict], Any]] = {"get_entity": self._get_entity,
+                                                                    "use_action": self._use_action,
+                                                                    "start_event": self._start_event,
+                                                                    "save_game": self._save_game}
+
+    def add_game(self, game: TRPG):
+        """Hosts a game under its name, replacing a hosted game of the same name
+        """
+        self.games.update({game.get_name(): game})
+
+        if game.get_name() not in self._locks:
+            self._locks.update({game.get_name(): asyncio.Lock()})
+
+    async def start(self,
+                    host: str = HOST,
+                    port: int = PORT,
+                    path: str | None = None) -> asyncio.AbstractServer:
+        """Starts listening
+
+        Args:
+            host (str): Host of the TCP socket
+            port (int): Port of the TCP socket, 0 picks a free one
+            path (str | None): Path of a Unix socket to listen on instead of TCP
+
+        Returns:
+            asyncio.AbstractServer: The listening server
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._serve_connection, path, limit=LINE_LIMIT)
+
+        else:
+            self._server = await asyncio.start_server(self._serve_connection, host, port, limit=LINE_LIMIT)
+
+        return self._server
+
+    def address(self) -> tuple[str, int] | str:
+        """The address the server listens on, (host, port) or the Unix socket path
+        """
+        name = self._server.sockets[0].getsockname()
+
+        return tuple(name[:2]) if isinstance(name, tuple) else name
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_connection(self,
+                                reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter):
+        pipeline = asyncio.Semaphore(self.max_pipeline)
+        write_lock = asyncio.Lock()
+        tasks: set[asyncio.Task] = set()
+
+        async def answer(line: bytes):
+            try:
+                response = await self.handle(line)
+
+                async with write_lock:
+                    writer.write(response)
+                    await writer.drain()
+
+            except ConnectionError:
+                pass
+
+            finally:
+                pipeline.release()
+
+        try:
+            while True:
+                await pipeline.acquire()
+
+                try:
+                    line = await reader.readline()
+
+                except (ConnectionError, ValueError):
+                    pipeline.release()
+                    break
+
+                if not line:
+                    pipeline.release()
+                    break
+
+                # Tasks start in the order they were created, so requests queue on a game's lock in arrival order
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+        finally:
+            writer.close()
+
+    async def handle(self, line: bytes) -> bytes:
+        """Handles one request line
+
+        Returns:
+            bytes: The response line
+        """
+        request_id = None
+
+        try:
+            request = json.loads(line)
+
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object.\n")
+
+            request_id = request.get("id")
+            args = request.get("args") or {}
+
+            if not isinstance(args, dict):
+                raise ValueError("The arguments of a request must be a JSON object.\n")
+
+            result = await self._dispatch(request.get("op"), request.get("game"), args)
+            response = {"id": request_id, "ok": True, "result": result}
+
+        except KeyError as e:
+            response = {"id": request_id, "ok": False, "error": "The request is missing the argument {}.".format(e.args[0])}
+
+        except Exception as e:
+            # Every request is answered, whatever went wrong handling it
+            response = {"id": request_id, "ok": False, "error": str(e).strip() or type(e).__name__}
+
+        self.requests += 1
+
+        try:
+            return (json.dumps(response, separators=(",", ":")) + "\n").encode("utf-8")
+
+        except (TypeError, ValueError):
+            # The id was parsed from JSON, only a result can fail to serialize
+            return (json.dumps({"id": request_id, "ok": False, "error": "The result could not be serialized."},
+                               separators=(",", ":")) + "\n").encode("utf-8")
+
+    async def _dispatch(self,
+                        operation: str,
+                        game_name: str | None,
+                        args: dict) -> Any:
+        if operation == "games":
+            return list(self.games)
+
+        if operation == "load":
+            loop = asyncio.get_running_loop()
+            game = await loop.run_in_executor(None, load_game, args["path"])
+
+            if game.get_name() in self._locks:
+                async with self._locks[game.get_name()]:
+                    self.add_game(game)
+
+            else:
+                self.add_game(game)
+
+            return game.get_name()
+
+        if game_name not in self.games:
+            raise ValueError("A game named {} is not hosted by this server.\n".format(game_name))
+
+        if operation == "unload":
+            async with self._locks[game_name]:
+                self.games.pop(game_name, None)
+
+            return None
+
+        if operation not in self._operations:
+            raise ValueError("Operation {} is not supported.\n".format(operation))
+
+        async with self._locks[game_name]:
+            # The game may have been unloaded while this request waited for the lock
+            if game_name not in self.games:
+                raise ValueError("A game named {} is not hosted by this server.\n".format(game_name))
+
+            return await self._operations[operation](self.games[game_name], args)
+
+    async def _get_entity(self, game: TRPG, args: dict) -> dict:
+        # Waiting for the game's lock must not hold up the event loop either
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(None, game.get_entity_data, args["name"])
+
+    async def _use_action(self, game: TRPG, args: dict) -> list:
+        # A slow action, or one waiting on entities held by another thread, would stall every connection on the loop
+        loop = asyncio.get_running_loop()
+        journal = await loop.run_in_executor(None, game.use_action, args["user"], args["action"], args.get("targets"))
+
+        return [list(ele) for ele in journal.deltas()]
+
+    async def _start_event(self, game: TRPG, args: dict) -> dict:
+        # Events can run for many turns, they are played off the event loop so other games keep being served
+        loop = asyncio.get_running_loop()
+        ended = await loop.run_in_executor(None, game.start_event, args["event"], args.get("max_turns"))
+
+        return {"ended": ended, "turns": game.get_event(args["event"]).turns}
+
+    async def _save_game(self, game: TRPG, args: dict) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, save_game, game, args.get("binary", False))
+
+class TGameClient:
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        """A connection to a TGameServer. Use connect to open one. Requests can be pipelined by
+        awaiting many calls of request at once
+        """
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._pending: dict[int: asyncio.Future] = {}
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls,
+                      host: str = HOST,
+                      port: int = PORT,
+                      path: str | None = None) -> "TGameClient":
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+
+        return cls(reader, writer)
+
+    async def _receive(self):
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response["id"], None)
+
+                if future is not None and not future.done():
+                    future.set_result(response)
+
+        finally:
+            for ele in self._pending.values():
+                if not ele.done():
+                    ele.set_exception(ConnectionError("The server closed the connection.\n"))
+
+            self._pending.clear()
+
+    async def request(self,
+                      operation: str,
+                      game: str | None = None,
+                      **args) -> Any:
+        """Sends one request and waits for its answer
+
+        Returns:
+            Any: The result of the operation
+
+        Raises:
+            ValueError: The server answered with an error
+        """
+        response = await self.send(operation, game, **args)
+
+        if not response["ok"]:
+            raise ValueError(response["error"] + "\n")
+
+        return response["result"]
+
+    async def send(self,
+                   operation: str,
+                   game: str | None = None,
+                   **args) -> dict:
+        """Sends one request and waits for the raw response line, errors included
+        """
+        if self._receiver.done():
+            raise ConnectionError("The connection to the server is closed.\n")
+
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending.update({self._next_id: future})
+
+        self._writer.write((json.dumps({"id": self._next_id, "op": operation, "game": game, "args": args},
+                                       separators=(",", ":")) + "\n").encode("utf-8"))
+        await self._writer.drain()
+
+        return await future
+
+    async def close(self):
+        self._writer.close()
+
+        try:
+            await self._writer.wait_closed()
+
+        except ConnectionError:
+            pass
+
+        await asyncio.gather(self._receiver, return_exceptions=True)
+
+@dataclass
+class LoadResultStruct:
+    requests: int
+    errors: int
+    seconds: float
+    # Latencies in milliseconds
+    p50: float
+    p95: float
+    p99: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return "{} requests ({} errors) in {:.3f}s, {:.0f} req/s, latency p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms".format(
+            self.requests, self.errors, self.seconds, self.rate, self.p50, self.p95, self.p99)
+
+async def load_test(requests: Sequence[tuple[str, str | None, dict]],
+                    connections: int = 4,
+                    pipeline: int = 32,
+                    host: str = HOST,
+                    port: int = PORT,
+                    path: str | None = None) -> LoadResultStruct:
+    """Sends requests to a server as fast as it answers them and measures every request's latency
+
+    Args:
+        requests (Sequence[tuple[str, str | None, dict]]): (operation, game, args) of every request, shared
+            round robin between the connections
+        connections (int): Number of connections
+        pipeline (int): Requests in flight per connection
+        host (str): Host of the server
+        port (int): Port of the server
+        path (str | None): Unix socket of the server, used instead of host and port
+
+    Returns:
+        LoadResultStruct: Throughput and latency percentiles
+    """
+    clients = [await TGameClient.connect(host, port, path) for _ in range(connections)]
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker(client: TGameClient, share: Sequence[tuple[str, str | None, dict]]):
+        nonlocal errors
+        position = 0
+
+        async def next_request():
+            nonlocal position, errors
+
+            while position < len(share):
+                operation, game, args = share[position]
+                position += 1
+
+                start = time.perf_counter()
+                response = await client.send(operation, game, **args)
+                latencies.append(time.perf_counter() - start)
+
+                if not response["ok"]:
+                    errors += 1
+
+        await asyncio.gather(*[next_request() for _ in range(pipeline)])
+
+    start = time.perf_counter()
+
+    try:
+        await asyncio.gather(*[worker(ele, requests[i::connections]) for i, ele in enumerate(clients)])
+
+    finally:
+        elapsed = time.perf_counter() - start
+
+        for ele in clients:
+            await ele.close()
+
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+
+    return LoadResultStruct(len(latencies), errors, elapsed, p50 * 1e3, p95 * 1e3, p99 * 1e3)
+
+async def serve(host: str = HOST,
+                port: int = PORT,
+                path: str | None = None,
+                games: Sequence[str] = ()):
+    """Runs a server until cancelled
+
+    Args:
+        games (Sequence[str]): Paths of game files to host from the start
+    """
+    server = TGameServer()
+
+    for ele in games:
+        server.add_game(load_game(ele))
+
+    listening = await server.start(host, port, path)
+
+    async with listening:
+        await listening.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(serve())
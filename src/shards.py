@@ -0,0 +1,279 @@
+"""Sharded game directories, an alternative to single file games for large campaigns.
+
+    <name>.shards/
+        manifest.json           name, attributes, actions, entity count and the list of shard files
+        entities_00000.json     the records of up to block_size entities
+        entities_00001.json
+        ...
+
+Saving through a ShardedGameStore only rewrites the shards holding entities that changed, were added or were
+removed, and the manifest only when the attributes, actions, entity count or list of shards changed. A shard emptied
+by removals is left out of the manifest, and its number is reused by the next entities added. Every file is replaced
+atomically and the manifest is written last, then the shard files it does not list are deleted. A crash during a save
+can leave some shards newer than others, or a stale shard file next to the manifest, never a torn file.
+"""
+import io
+import json
+import os
+import re
+import weakref
+
+from base import *
+from file_management import GAME_DIRECTORY, MANIFEST_NAME, SHARDED_EXTENSION, update_catalog_entry, write_file_atomic
+
+BLOCK_SIZE = 256
+SHARD_FILE_NAME = re.compile(r"entities_(\d{5,})\.json")
+
+_stores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+def shard_file_name(index: int) -> str:
+    return "entities_{:05d}.json".format(index)
+
+def shard_index(file_name: str) -> int | None:
+    """Returns the number of a shard file, or None if file_name is not a shard file
+    """
+    match = SHARD_FILE_NAME.fullmatch(file_name)
+
+    return int(match.group(1)) if match is not None else None
+
+def sharded_game_path(name: str, directory: str = GAME_DIRECTORY) -> str:
+    return os.path.join(directory, name + SHARDED_EXTENSION)
+
+def store_for(game: TRPG) -> "ShardedGameStore":
+    """Returns the store saving a game as a sharded directory in the game directory, creating it on first use
+    """
+    if game not in _stores:
+        _stores[game] = ShardedGameStore(game)
+
+    return _stores[game]
+
+def load_sharded_game(path: str) -> TRPG:
+    """Loads a sharded game directory. The shards are read one at a time, and the store of the game
+    starts out knowing which shard every entity is in, so the next save only writes what changed
+
+    Args:
+        path (str): Path of the directory
+
+    Returns:
+        TRPG: The game
+    """
+    with io.open(os.path.join(path, MANIFEST_NAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    shard_names: dict[int: list[str]] = {}
+
+    def records() -> Iterator[tuple[str, Any]]:
+        yield "name", manifest["name"]
+
+        for ele in manifest["attributes"]:
+            yield "attributes", ele
+
+        for ele in manifest["actions"]:
+            yield "actions", ele
+
+        for file_name in manifest["shards"]:
+            with io.open(os.path.join(path, file_name)) as shard_file:
+                shard = json.load(shard_file)
+
+            shard_names.update({shard_index(file_name): [ele["name"] for ele in shard]})
+
+            for ele in shard:
+                yield "entities", ele
+
+    game = TRPG(manifest["name"])
+    game.load_records(records())
+
+    store = ShardedGameStore(game, path, manifest["block size"])
+    store._adopt(shard_names, manifest["shards"])
+    _stores[game] = store
+
+    return game
+
+class ShardedGameStore:
+    def __init__(self,
+                 game: TRPG,
+                 path: str | None = None,
+                 block_size: int = BLOCK_SIZE):
+        """Saves a game as a sharded directory. The store listens to the game's changes, so it has to be
+        created before the changes it should save. A new store writes every shard on its first save
+
+        Args:
+            game (TRPG): The game
+            path (str | None): Path of the directory. Defaults to <name>.shards in the game directory
+            block_size (int): Maximum number of entities per shard
+        """
+        # Held weakly, store_for keeps one store per live game
+        self._game = weakref.ref(game)
+        self.path = path or sharded_game_path(game.get_name())
+        self.block_size = block_size
+        self.bytes_written: int = 0
+
+        self._shards: list[list[TEntity]] = []
+        self._shard_of: dict[TEntity: int] = {}
+        self._open_shards: list[int] = []
+        self._dirty_shards: set[int] = set()
+        self._changed: set[TEntity] = set()
+        self._full = True
+        self._manifest_dirty = True
+        # The shard files listed by the manifest on disk, None until one is written or loaded
+        self._disk_shards: list[str] | None = None
+        self._entity_count = 0
+
+        game.add_change_listener(self._on_change)
+
+    @property
+    def game(self) -> TRPG:
+        return self._game()
+
+    def _on_change(self, game: TRPG, obj: TDataObject | None):
+        if obj is None:
+            # The game was reloaded, none of the entities is known anymore
+            self._full = True
+
+        elif isinstance(obj, TEntity):
+            self._changed.add(obj)
+
+        else:
+            self._manifest_dirty = True
+
+    def _adopt(self, shard_names: dict[int: list[str]], disk_shards: list[str]):
+        """Takes over the shard layout of a directory the game was just loaded from. Numbers missing
+        from the manifest are empty shards
+        """
+        self._reset()
+
+        for index in range(max(shard_names, default=-1) + 1):
+            self._shards.append([])
+
+            for name in shard_names.get(index, []):
+                if name in self.game.entities:
+                    self._shards[index].append(self.game.entities[name])
+                    self._shard_of.update({self.game.entities[name]: index})
+
+                else:
+                    # Dropped while loading, the shard no longer matches the game
+                    self._dirty_shards.add(index)
+
+            if len(self._shards[index]) < self.block_size:
+                self._open_shards.append(index)
+
+        self._open_shards.reverse()
+        self._changed.clear()
+        self._full = False
+        self._manifest_dirty = False
+        self._disk_shards = disk_shards
+        self._entity_count = len(self._shard_of)
+
+    def _reset(self):
+        self._shards.clear()
+        self._shard_of.clear()
+        self._open_shards.clear()
+        self._dirty_shards.clear()
+
+    def _assign(self, entity: TEntity):
+        if len(self._open_shards) == 0:
+            self._shards.append([])
+            self._open_shards.append(len(self._shards) - 1)
+
+        index = self._open_shards[-1]
+        self._shards[index].append(entity)
+        self._shard_of.update({entity: index})
+        self._dirty_shards.add(index)
+
+        if len(self._shards[index]) == self.block_size:
+            self._open_shards.pop()
+
+    def _remove(self, entity: TEntity):
+        index = self._shard_of.pop(entity)
+        self._shards[index].remove(entity)
+        self._dirty_shards.add(index)
+
+        if len(self._shards[index]) == self.block_size - 1:
+            self._open_shards.append(index)
+
+    def save(self) -> int:
+        """Writes the shards and the manifest that changed since the last save
+
+        Returns:
+            int: Number of bytes written
+        """
+        game = self.game
+        files: list[tuple[str, bytes]] = []
+
+        with game.lock:
+            game.update_data()
+
+            if self._full:
+                self._reset()
+
+                for ele in game.entities.values():
+                    self._assign(ele)
+
+                self._changed.clear()
+                self._full = False
+                self._manifest_dirty = True
+
+            for ele in self._changed:
+                # An entity removed from the game is no longer observed by it
+                tracked = ele.get_observer() is not None
+
+                if tracked and ele not in self._shard_of:
+                    self._assign(ele)
+
+                elif not tracked and ele in self._shard_of:
+                    self._remove(ele)
+
+                elif tracked:
+                    self._dirty_shards.add(self._shard_of[ele])
+
+            self._changed.clear()
+
+            for index in sorted(self._dirty_shards):
+                # An emptied shard is dropped from the manifest instead
+                if len(self._shards[index]) == 0:
+                    continue
+
+                content = json.dumps([ele.data for ele in self._shards[index]], separators=(",", ":"))
+                files.append((shard_file_name(index), content.encode("utf-8")))
+
+            self._dirty_shards.clear()
+
+            shards = [shard_file_name(index) for index, ele in enumerate(self._shards) if len(ele) > 0]
+            write_manifest = self._manifest_dirty or shards != self._disk_shards or len(self._shard_of) != self._entity_count
+
+            if write_manifest:
+                data = game.data
+                manifest = {"name": data["name"],
+                            "attributes": data["attributes"],
+                            "actions": data["actions"],
+                            "entity count": len(self._shard_of),
+                            "block size": self.block_size,
+                            "shards": shards}
+                summary = {"name": data["name"],
+                           "attributes": len(data["attributes"]),
+                           "actions": len(data["actions"]),
+                           "entities": len(self._shard_of)}
+
+                files.append((MANIFEST_NAME, json.dumps(manifest, indent=4).encode("utf-8")))
+
+                self._manifest_dirty = False
+                self._disk_shards = shards
+                self._entity_count = len(self._shard_of)
+
+        os.makedirs(self.path, exist_ok=True)
+
+        for file_name, content in files:
+            write_file_atomic(os.path.join(self.path, file_name), content)
+
+        if write_manifest:
+            # Emptied shards and the shards of an earlier save of the directory are no longer read
+            for file_name in os.listdir(self.path):
+                if shard_index(file_name) is not None and file_name not in shards:
+                    os.remove(os.path.join(self.path, file_name))
+
+            if os.path.dirname(self.path) == GAME_DIRECTORY:
+                update_catalog_entry(self.path, summary)
+
+        self.bytes_written = sum(len(content) for _, content in files)
+
+        return self.bytes_written
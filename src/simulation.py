@@ -0,0 +1,183 @@
+"""Monte Carlo simulation of events, for balancing encounters.
+
+The same event is run many times on clones of a game, each with starting attribute values drawn at random,
+and the outcomes are aggregated. Runs are spread over a process pool, so the simulation scales with the number of cores.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections.abc import Iterator
+import os
+import random
+
+from base import *
+
+AttributeRanges = Mapping[str, Mapping[str, tuple[NumType, NumType]]]
+
+class TSimulationResult:
+    def __init__(self):
+        """Initialize an empty result. Results of separate batches of runs are combined with merge
+        """
+        self.runs: int = 0
+        self.ended: int = 0
+        self.turns: Counter = Counter()
+        self.attributes: dict[tuple[str, str]: Counter] = {}
+
+    def add_run(self,
+                game: TRPG,
+                event: TEvent,
+                ended: bool,
+                watch: Sequence[tuple[str, str]]):
+        """Records the outcome of one run
+
+        Args:
+            game (TRPG): The game after the run
+            event (TEvent): The event that was run
+            ended (bool): Whether the event reached its end condition
+            watch (Sequence[tuple[str, str]]): (entity, attribute) pairs whose final values are recorded
+        """
+        self.runs += 1
+        self.ended += 1 if ended else 0
+        self.turns[event.turns] += 1
+
+        for entity_name, attribute_name in watch:
+            value = game.entities[entity_name].get_attributes()[attribute_name].value
+            self.attributes.setdefault((entity_name, attribute_name), Counter())[value] += 1
+
+    def merge(self, other: "TSimulationResult"):
+        self.runs += other.runs
+        self.ended += other.ended
+        self.turns.update(other.turns)
+
+        for key, histogram in other.attributes.items():
+            self.attributes.setdefault(key, Counter()).update(histogram)
+
+    def mean_turns(self) -> float:
+        if self.runs == 0:
+            return 0.0
+
+        return sum(turns * count for turns, count in self.turns.items()) / self.runs
+
+def _randomize(game: TRPG,
+               ranges: AttributeRanges,
+               rng: random.Random):
+    """Draws starting values for the attributes named in ranges. Integer bounds give integer values
+    """
+    for entity_name, attributes in ranges.items():
+        entity = game.entities[entity_name]
+
+        for attribute_name, (low, high) in attributes.items():
+            if isinstance(low, int) and isinstance(high, int):
+                value = rng.randint(low, high)
+
+            else:
+                value = rng.uniform(low, high)
+
+            entity.set_attribute_value(attribute_name, value)
+
+def _run_batch(game_data: dict,
+               participants: Sequence[str],
+               turn_definitions: list[EventActionStruct | EventSpeechStruct],
+               end: EventEndConditionStruct | EventEndConditionAttributeStruct,
+               ranges: AttributeRanges,
+               seeds: Sequence[int],
+               max_turns: int | None,
+               watch: Sequence[tuple[str, str]],
+               initiative: str | None = None) -> TSimulationResult:
+    """Runs one batch of simulations. Executed in the worker processes
+    """
+    result = TSimulationResult()
+
+    for seed in seeds:
+        game = TRPG(game_data["name"])
+        game.data = game_data
+        game.load_data()
+
+        _randomize(game, ranges, random.Random(seed))
+
+        game.new_event("simulation", participants, turn_definitions, end, initiative=initiative)
+        ended = game.start_event("simulation", max_turns)
+
+        result.add_run(game, game.get_event("simulation"), ended, watch)
+
+    return result
+
+def iter_simulations(game: TRPG,
+                     event_name: str,
+                     runs: int,
+                     ranges: AttributeRanges | None = None,
+                     *,
+                     max_turns: int | None = 1000,
+                     watch: Sequence[tuple[str, str]] | None = None,
+                     workers: int | None = None,
+                     batch_size: int | None = None,
+                     seed: int = 0) -> Iterator[TSimulationResult]:
+    """Runs an event many times in a process pool and yields the result of each batch of runs as soon as it completes.
+    The game itself is left untouched, every run works on a fresh clone of it. Runs of an event with initiative
+    play their turns in the order of the same attribute
+
+    Args:
+        game (TRPG): The game holding the event
+        event_name (str): Name of the event to simulate
+        runs (int): Total number of runs
+        ranges (AttributeRanges | None): Entity name -> attribute name -> (low, high) bounds of the random starting values
+        max_turns (int | None): Runs still going after this many turns are stopped and counted as not ended
+        watch (Sequence[tuple[str, str]] | None): (entity, attribute) pairs to build histograms of final values for.
+            Defaults to every numeric attribute of every participant
+        workers (int | None): Number of worker processes. Defaults to the number of cores
+        batch_size (int | None): Number of runs per task sent to a worker
+        seed (int): Seed of the first run. Run i uses seed + i, so results are reproducible
+
+    Yields:
+        TSimulationResult: The result of one batch of runs
+    """
+    event = game.get_event(event_name)
+    participants = list(event.participants)
+    initiative = event.initiative.attribute if event.initiative is not None else None
+    ranges = ranges or {}
+
+    if watch is None:
+        watch = [(entity_name, attribute_name)
+                 for entity_name in participants
+                 for attribute_name, value in game.entities[entity_name].get_attributes().items()
+                 if value.type == "num"]
+
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size or max(1, runs // (workers * 4))
+    game_data = game.data
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_batch,
+                                   game_data,
+                                   participants,
+                                   event.turn_definitions(),
+                                   event.end,
+                                   ranges,
+                                   range(seed + start, seed + min(start + batch_size, runs)),
+                                   max_turns,
+                                   watch,
+                                   initiative)
+                   for start in range(0, runs, batch_size)]
+
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+
+        finally:
+            # Closing the generator early, e.g. to cancel a simulation, drops the batches not started yet
+            for ele in futures:
+                ele.cancel()
+
+def simulate(game: TRPG,
+             event_name: str,
+             runs: int,
+             ranges: AttributeRanges | None = None,
+             **kwargs) -> TSimulationResult:
+    """Runs an event many times in a process pool and returns the combined result.
+    Takes the same arguments as iter_simulations
+    """
+    result = TSimulationResult()
+
+    for ele in iter_simulations(game, event_name, runs, ranges, **kwargs):
+        result.merge(ele)
+
+    return result
@@ -0,0 +1,244 @@
+"""Runs events, batches of actions and simulations off the GUI thread.
+
+A worker is a QObject moved to a QThread of its own by start_worker. It reports through signals, which Qt queues
+to the thread of the receivers, so the GUI applies them between repaints:
+
+    progress(done, total)       total is -1 when unknown, e.g. for an event running until its end condition
+    state_changed(list)         (entity, attribute, old value, new value) of every value changed since the last one
+    finished(object)            the result of the work
+    failed(str)                 the error that stopped the work
+    cancelled()                 the work stopped early after cancel was called
+
+Progress and state changes are emitted at most every PROGRESS_INTERVAL seconds. A state change covers every value
+written since the previous one, once per attribute, so a fast loop never floods the GUI's event loop.
+cancel can be called from any thread, the worker stops between two turns, actions or batches of runs.
+"""
+from abc import ABCMeta, abstractmethod
+import threading
+import time
+
+import PyQt5.QtCore as core
+
+from base import *
+import simulation
+
+PROGRESS_INTERVAL = 0.05
+
+class _WorkerMeta(type(core.QObject), ABCMeta):
+    """Lets GameWorker be both a QObject and an abstract class
+    """
+
+class GameWorker(core.QObject, metaclass=_WorkerMeta):
+    progress = core.pyqtSignal(int, int)
+    state_changed = core.pyqtSignal(list)
+    finished = core.pyqtSignal(object)
+    failed = core.pyqtSignal(str)
+    cancelled = core.pyqtSignal()
+
+    def __init__(self, game: TRPG) -> None:
+        """Base class of the workers. Subclasses implement work, and call report as they go
+
+        Args:
+            game (TRPG): The game worked on
+        """
+        super().__init__()
+
+        self.game = game
+        self.result: Any = None
+
+        self._cancel = threading.Event()
+        self._changes: dict[tuple[str, str]: list] = {}
+        self._done = 0
+        self._total = -1
+        self._last_emit = 0.0
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def run(self):
+        """Does the work and emits how it ended. Connected to the started signal of the worker's thread
+        """
+        try:
+            self.result = self.work()
+
+        except Exception as e:
+            self._flush()
+            self.failed.emit(str(e).strip() or type(e).__name__)
+            return
+
+        self._flush()
+
+        if self.is_cancelled():
+            self.cancelled.emit()
+
+        else:
+            self.finished.emit(self.result)
+
+    @abstractmethod
+    def work(self) -> Any:
+        """Does the work on the worker's thread and returns its result
+        """
+
+    def report(self,
+               done: int,
+               total: int = -1,
+               deltas: Iterable[tuple[str, str, Any, Any]] = ()):
+        """Records progress and changed values, and emits them if the last emission is old enough
+
+        Args:
+            done (int): Units of work done
+            total (int): Units of work in all, -1 if unknown
+            deltas (Iterable[tuple[str, str, Any, Any]]): (entity, attribute, old value, new value) of values written
+        """
+        for entity_name, attribute_name, old, new in deltas:
+            key = (entity_name, attribute_name)
+
+            if key in self._changes:
+                self._changes[key][1] = new
+
+            else:
+                self._changes.update({key: [old, new]})
+
+        self._done = done
+        self._total = total
+
+        now = time.monotonic()
+
+        if now - self._last_emit >= PROGRESS_INTERVAL:
+            self._flush(now)
+
+    def _flush(self, now: float | None = None):
+        self._last_emit = now if now is not None else time.monotonic()
+
+        # A value written back to what it was since the last emission did not change for the receivers
+        changes = [(entity_name, attribute_name, old, new)
+                   for (entity_name, attribute_name), (old, new) in self._changes.items() if old != new]
+        self._changes = {}
+
+        if changes:
+            self.state_changed.emit(changes)
+
+        self.progress.emit(self._done, self._total)
+
+class EventWorker(GameWorker):
+    def __init__(self,
+                 game: TRPG,
+                 event_name: str,
+                 max_turns: int | None = None) -> None:
+        """Runs an event turn by turn, like TRPG.start_event. The result is True if the event reached its
+        end condition, False if it was stopped by max_turns or cancelled
+        """
+        super().__init__(game)
+
+        self.event_name = event_name
+        self.max_turns = max_turns
+
+    def work(self) -> bool:
+        event = self.game.begin_event(self.event_name)
+        total = self.max_turns if self.max_turns is not None else -1
+
+        try:
+            while not self.game.check_event_end(event):
+                if self.is_cancelled() or (self.max_turns is not None and event.turns >= self.max_turns):
+                    return False
+
+                records = self.game.step_event(event)
+                self.report(event.turns, total, [delta for ele in records for delta in ele.deltas])
+
+            return True
+
+        finally:
+            records = self.game.finish_event(event)
+            self.report(event.turns, total, [delta for ele in records for delta in ele.deltas])
+
+class ActionBatchWorker(GameWorker):
+    def __init__(self,
+                 game: TRPG,
+                 batch: Sequence[tuple[str, str, Sequence[str] | None]]) -> None:
+        """Uses a batch of actions one at a time, e.g. a round driven by a script. Like TRPG.use_actions,
+        a failing action does not stop the batch. The result is one ActionResultStruct per action used
+        """
+        super().__init__(game)
+
+        self.batch = list(batch)
+
+    def work(self) -> list[ActionResultStruct]:
+        results: list[ActionResultStruct] = []
+
+        for user_name, action_name, targets in self.batch:
+            if self.is_cancelled():
+                break
+
+            result = ActionResultStruct(user_name, action_name, list(targets or []), True, None)
+
+            try:
+                journal = self.game.use_action(user_name, action_name, targets)
+                self.report(len(results) + 1, len(self.batch), journal.deltas())
+
+            except Exception as e:
+                # use_action rolled the action back, like use_actions the failure only ends up in its result
+                result.success = False
+                result.error = str(e) or type(e).__name__
+                self.report(len(results) + 1, len(self.batch))
+
+            results.append(result)
+
+        return results
+
+class SimulationWorker(GameWorker):
+    def __init__(self,
+                 game: TRPG,
+                 event_name: str,
+                 runs: int,
+                 ranges: simulation.AttributeRanges | None = None,
+                 **kwargs) -> None:
+        """Runs simulation.iter_simulations and combines the batches as they complete. Takes the same arguments.
+        The game is not changed, so no state change is emitted. The result is the simulation.TSimulationResult,
+        and the runs completed so far are kept in it when the simulation is cancelled
+        """
+        super().__init__(game)
+
+        self.event_name = event_name
+        self.runs = runs
+        self.ranges = ranges
+        self.kwargs = kwargs
+
+    def work(self) -> simulation.TSimulationResult:
+        self.result = simulation.TSimulationResult()
+        batches = simulation.iter_simulations(self.game, self.event_name, self.runs, self.ranges, **self.kwargs)
+
+        try:
+            for ele in batches:
+                self.result.merge(ele)
+                self.report(self.result.runs, self.runs)
+
+                if self.is_cancelled():
+                    break
+
+        finally:
+            batches.close()
+
+        return self.result
+
+def start_worker(worker: GameWorker, parent: core.QObject | None = None) -> core.QThread:
+    """Moves a worker to a new thread and starts it. The thread quits once the worker is done.
+    Keep references to both until then
+
+    Returns:
+        core.QThread: The thread
+    """
+    thread = core.QThread(parent)
+    worker.moveToThread(thread)
+
+    thread.started.connect(worker.run)
+
+    # QThread.quit is thread safe, called directly the thread ends even if the GUI is busy
+    for ele in (worker.finished, worker.failed, worker.cancelled):
+        ele.connect(thread.quit, core.Qt.ConnectionType.DirectConnection)
+
+    thread.start()
+
+    return thread